@@ -0,0 +1,156 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Checks the betweenness centrality of Coco against Networkx on small weighted directed graphs with many equally short
+paths. The exact values should equal networkx.betweenness_centrality(normalized=False, weight=None), the sampled
+estimate should equal the dependencies of the same sources (networkx.betweenness_centrality_subset) scaled by n / k.
+Both are checked with one worker and with a process pool. Needs Networkx.
+
+Usage:
+    python check_betweenness.py [--workers N] [--seed S]
+"""
+
+import argparse
+import os
+import sys
+import numpy as np
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+import rsp.betweenness as bc
+import rsp.connectivitygraph as cgraph
+
+def diamond_graph():
+    """
+    Returns a graph with two equally short paths between most pairs, different weights and an isolated node
+
+    Parameters
+    ----------
+    -
+
+    Returns
+    -------
+    ConnectivityGraph
+    """
+
+    nodes = np.array([10, 11, 12, 13, 14, 15, 16])
+    src = np.array([0, 0, 1, 2, 3, 3, 4, 5, 4])
+    dst = np.array([1, 2, 3, 3, 4, 5, 6, 6, 0])
+    weights = np.array([0.5, 2.0, 1.0, 1.0, 3.0, 0.1, 1.0, 1.0, 0.7])
+    return cgraph.ConnectivityGraph(nodes, src, dst, weights)
+
+def random_graph(n, degree, rng):
+    """
+    Returns a random weighted directed graph, integer weights give ties in the weights as well
+
+    Parameters
+    ----------
+    n : int
+        Number of nodes
+    degree : float
+        Average out degree
+    rng : Numpy Generator
+        Random number generator
+
+    Returns
+    -------
+    ConnectivityGraph
+    """
+
+    m = int(n * degree)
+    src = rng.integers(0, n, m)
+    dst = rng.integers(0, n, m)
+    keep = src != dst
+    weights = rng.integers(1, 4, m).astype(float)
+    return cgraph.ConnectivityGraph(np.arange(n), src[keep], dst[keep], weights[keep])
+
+def networkx_values(g, values):
+    """
+    Returns the values of a Networkx node dict in the node order of g
+
+    Parameters
+    ----------
+    g : ConnectivityGraph
+        Graph the values are calculated on
+    values : dict
+        Value of each node id
+
+    Returns
+    -------
+    Numpy array with the value of each node of g
+    """
+
+    return np.array([values[node] for node in g.nodes.tolist()])
+
+def check(name, values, expected):
+    """
+    Prints whether the values match the expected values
+
+    Parameters
+    ----------
+    name : str
+        Name of the check
+    values : Numpy array
+        Values calculated by Coco
+    expected : Numpy array
+        Values calculated by Networkx
+
+    Returns
+    -------
+    True if the values match
+    """
+
+    ok = np.allclose(values, expected, rtol=1e-9, atol=1e-9)
+    print(f"{name:<45} {'OK' if ok else 'FAILED'}  (total {np.sum(values):.4f}, networkx {np.sum(expected):.4f})")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the betweenness centrality of Coco against Networkx')
+    parser.add_argument('--workers', type=int, default=2, help='Number of worker processes of the pooled checks')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random graphs and source samples')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # more nodes than bc.MAX_BATCH, s.t., the sources are split into several batches
+    graphs = {'diamond': diamond_graph(), 'random 60': random_graph(60, 2.5, rng), 'random 300': random_graph(300, 2.0, rng)}
+
+    ok = True
+    for (name, g) in graphs.items():
+        graph = g.to_networkx()
+        n = g.n_nodes
+        exact = networkx_values(g, nx.betweenness_centrality(graph, normalized=False, weight=None))
+        for workers in (1, args.workers):
+            ok &= check(f"{name}: exact, {workers} worker(s)", bc.betweenness_centrality(g, workers), exact)
+
+        # the sampled sources are the first k of the seeded permutation of the nodes
+        k = max(2, n // 3)
+        sources = g.nodes[np.random.default_rng(args.seed).permutation(n)[:k]].tolist()
+        subset = nx.betweenness_centrality_subset(graph, sources, graph.nodes, normalized=False, weight=None)
+        sampled = networkx_values(g, subset) * n / k
+        for workers in (1, args.workers):
+            (values, samples, _) = bc.approximate_betweenness_centrality(g, samples=k, seed=args.seed, workers=workers)
+            ok &= samples == k and check(f"{name}: {k} samples, {workers} worker(s)", values, sampled)
+
+        # a zero target error samples all nodes, which gives the exact values
+        (values, samples, error) = bc.approximate_betweenness_centrality(g, error=0, seed=args.seed, workers=args.workers)
+        ok &= samples == n and error == 0 and check(f"{name}: error 0, {args.workers} worker(s)", values, exact)
+
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
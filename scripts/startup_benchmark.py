@@ -0,0 +1,119 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the startup time of each Coco subcommand: the time to import coco and the modules of the subcommand in a
+fresh interpreter. Also checks that subcommands reading csv files do not load GDAL or plotting libraries.
+
+Usage:
+    python startup_benchmark.py [--repeat N] [--baseline FILE] [--save] [--tolerance VALUE]
+
+With a baseline file, the run fails if a subcommand is more than tolerance (default 0.25) slower than in the
+baseline. Use --save to store the measured times as the new baseline.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+SUBCOMMANDS = ['RSP', 'RSP-CF', 'RSP-CC', 'RSP-CBC', 'EVAL', 'ZONAL', 'PF']
+# libraries only needed for raster input and plotting
+ON_DEMAND = ['osgeo', 'matplotlib', 'seaborn', 'networkx']
+# subcommands that read rasters
+RASTER = ['ZONAL', 'PF']
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+import coco
+try:
+    coco.load_subcommand({cmd!r})
+    available = True
+except SystemExit:
+    available = False
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'available': available, 'loaded': [m for m in {on_demand!r} if m in sys.modules]}}))
+"""
+
+def measure(cmd, repeat):
+    """
+    Measures the startup time of a subcommand in fresh interpreters
+
+    Parameters
+    ----------
+    cmd : str
+        Coco subcommand
+    repeat : int
+        Number of measurements, the fastest is reported
+
+    Returns
+    -------
+    A dict with the startup time in seconds, whether the subcommand is available and the on demand libraries loaded
+    """
+
+    code = PROBE.format(src=SRC, cmd=cmd, on_demand=ON_DEMAND)
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(results, key=lambda result: result['seconds'])
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the startup time of each Coco subcommand')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of measurements per subcommand')
+    parser.add_argument('--baseline', type=str, help='Json file with the baseline startup times')
+    parser.add_argument('--save', action='store_true', help='Store the measured times as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown compared to the baseline')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline and os.path.isfile(args.baseline) and not args.save:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    failed = False
+    times = {}
+    print(f"{'subcommand':<10} {'seconds':>8} {'baseline':>9}  loaded on demand libraries")
+    for cmd in SUBCOMMANDS:
+        result = measure(cmd, args.repeat)
+        if not result['available']:
+            print(f"{cmd:<10} {'-':>8} {'-':>9}  not available")
+            continue
+        times[cmd] = result['seconds']
+        status = []
+        if cmd not in RASTER and result['loaded']:
+            status.append('(not on demand)')
+            failed = True
+        reference = baseline.get(cmd)
+        if reference is not None and result['seconds'] > reference * (1 + args.tolerance):
+            status.append('slower than baseline')
+            failed = True
+        reference = f"{reference:.3f}" if reference is not None else '-'
+        print(f"{cmd:<10} {result['seconds']:>8.3f} {reference:>9}  {', '.join(result['loaded'] + status) or '-'}")
+
+    if args.save and args.baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(times, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -24,13 +24,39 @@ import timer as ctimer
 #import conservation as cons
 #import solution as sol
 #import constant as c
-import rsp.rsp as rsp
-import pareto.pareto as pareto
 import sys
 #from gurobipy import GRB
 
 
 
+def load_subcommand(cmd):
+    """
+    Imports the module running subcommand cmd, s.t., each subcommand only loads the libraries it uses
+
+    Parameters
+    ----------
+    cmd : str
+        Coco subcommand
+
+    Returns
+    -------
+    The module running the subcommand
+    """
+
+    if cmd == 'PF':
+        try:
+            import pareto.pareto as module
+        except ImportError as e:
+            error = f"PF is not available: {e}"
+            sys.exit(error)
+    elif cmd == 'ZONAL':
+        import zonal as module
+    elif cmd == 'EVAL':
+        import rsp.evaluator as module
+    else:
+        import rsp.rsp as module
+    return module
+
 def main():
     # setup timers
     timer = ctimer.Timer()
@@ -38,6 +64,7 @@ def main():
 
     # parse args
     args = cparser.parse_args()
+    module = load_subcommand(args.cmd)
 
     # read files
     print("files read...")
@@ -48,15 +75,20 @@ def main():
         #    pareto.run_pf_test(args, path, features, pu, pvf, timer)
         #elif args.config:
         if args.config:
-            (features, maps, config) = cio.read_config_file(args.config)
+            (features, maps, config) = cio.read_config_file(args.config, args.io_workers, timer, args.raster_memory)
             path = args.output
-            pareto.run_pf(args, path, features, maps, config, timer)
+            module.run_pf(args, path, features, maps, config, timer)
         else:
             error = "Config json file missing"
             sys.exit(error)
+    elif args.cmd == 'ZONAL':
+        module.run_zonal(args, timer)
+    elif args.cmd == 'EVAL':
+        (path, features, pu, pvf, con_data, pu_data) = cio.read_input_files(args, timer)
+        module.run_eval(args, path, features, pu, pvf, timer, con_data, pu_data)
     else:
-        (path, features, pu, pvf) = cio.read_csv_files(args.input)
-        rsp.run_rsp(args, path, features, pu, pvf, timer)
+        (path, features, pu, pvf, con_data, pu_data) = cio.read_input_files(args, timer)
+        module.run_rsp(args, path, features, pu, pvf, timer, con_data, pu_data)
 
 if __name__ == '__main__':
     main()
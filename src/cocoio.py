@@ -15,14 +15,16 @@
 # You should have received a copy of the GNU General Public License
 # along with Coco. If not, see <http://www.gnu.org/licenses/>.
 
-import errno, sys, os, pathlib
-from osgeo import gdal
+import errno, sys, os, pathlib, csv
 import pandas as pd
 import constant as c
 import feature_map as fm
+import csvcache as csvc
 import numpy as np
-import matplotlib.pyplot as plt
+import scipy.sparse as sp
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 def process_path(path):
     """
@@ -75,8 +77,36 @@ def open_file(path, filename=None):
         else:
             raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), fullpath)
 
+def open_table(path, filename):
+    """
+    Open the csv file if possible, or the binary table written in its place (e.g., by ZONAL), raise an exception otherwise
+
+    Parameters
+    ----------
+    path : str
+        Path to the folder containing the file
+    filename : str
+        Name of the csv file to open
+
+    Returns
+    -------
+        The full name of the path and filename or an exception if neither the file nor its table is found
+    """
+
+    try:
+        return open_file(path, filename)
+    except FileNotFoundError:
+        fullpath = os.path.join(path, filename)
+        manifest = csvc.read_manifest(csvc.table_path(fullpath))
+        if manifest is not None and manifest['source'] is None:
+            return fullpath
+        raise
+
 
 def read_tif(file):
+    # GDAL is only needed for raster input and imported when a raster is read
+    from osgeo import gdal
+
     ds = gdal.Open(file, gdal.GA_ReadOnly)
 
     if ds.GetDriver().LongName != 'GeoTIFF':
@@ -85,13 +115,99 @@ def read_tif(file):
 
     return ds
 
-def get_map(fid, path, file):
+def raster_windows(rb, x_length, y_length, memory=c.RASTER_MEMORY):
+    """
+    Returns the windows to read a raster band in, aligned to the native blocks (tiles or strips) of the band
+
+    Windows span whole rows of blocks if such a strip fits in the memory budget, s.t., each block is read once and
+    only whole blocks are decoded. Otherwise a row of blocks is split into windows of as many blocks as fit.
+
+    Parameters
+    ----------
+    rb : gdal.Band
+        Raster band to read
+    x_length : int
+        Number of columns of the raster
+    y_length : int
+        Number of rows of the raster
+    memory : float
+        Memory budget (in MB) of one window, including the mask and indices of its cells with data
+
+    Returns
+    -------
+    A generator of tuples (xoff, yoff, xsize, ysize) with the offset and size of each window
+    """
+
+    from osgeo import gdal
+
+    (block_x, block_y) = rb.GetBlockSize()
+    block_x = max(1, min(block_x, x_length))
+    block_y = max(1, min(block_y, y_length))
+    # the value, the mask and the flat index of each cell in the window
+    cell_size = gdal.GetDataTypeSize(rb.DataType) // 8 + 9
+    cells = max(block_x * block_y, int(memory * 2**20) // cell_size)
+
+    strip = x_length * block_y
+    if strip <= cells:
+        rows = block_y * (cells // strip)
+        for yoff in range(0, y_length, rows):
+            yield (0, yoff, x_length, min(rows, y_length - yoff))
+        return
+
+    cols = block_x * (cells // (block_x * block_y))
+    for yoff in range(0, y_length, block_y):
+        for xoff in range(0, x_length, cols):
+            yield (xoff, yoff, min(cols, x_length - xoff), min(block_y, y_length - yoff))
+
+def valid_cells(window, no_data):
+    """
+    Returns which cells of a raster window have data, i.e., are not no data or NaN
+
+    Parameters
+    ----------
+    window : Numpy array
+        Values of the cells in the window
+    no_data : float
+        No data value of the raster, or None if all cells have data
+
+    Returns
+    -------
+    Boolean Numpy array with the shape of the window
+    """
+
+    valid = np.ones(window.shape, dtype=bool) if no_data is None else window != no_data
+    if window.dtype.kind == 'f':
+        valid &= ~np.isnan(window)
+    return valid
+
+def get_map(fid, path, file, memory=c.RASTER_MEMORY):
+    """
+    Reads a feature map window by window and keeps only the cells with data
+
+    The dense raster is never in memory, only one window of it and the flat index and value of each cell that is not
+    no data (or NaN).
+
+    Parameters
+    ----------
+    fid : str
+        Id of the feature
+    path : str
+        Folder of the feature map
+    file : str
+        File name of the GeoTIFF feature map
+    memory : float
+        Memory budget (in MB) of one window
+
+    Returns
+    -------
+    A FeatureMap with the cells with data of the raster
+    """
+
+    from osgeo import gdal_array
+
     ds = read_tif(open_file(path, file))
 
     rb = ds.GetRasterBand(1)
-    img_array = rb.ReadAsArray()
-    pu = img_array.flatten()
-
     min_val = rb.GetMinimum()
     max_val = rb.GetMaximum()
     no_data = rb.GetNoDataValue()
@@ -102,32 +218,66 @@ def get_map(fid, path, file):
     x_length = ds.RasterXSize
     y_length = ds.RasterYSize
 
+    cells = []
+    values = []
+    for (xoff, yoff, xsize, ysize) in raster_windows(rb, x_length, y_length, memory):
+        window = rb.ReadAsArray(xoff, yoff, xsize, ysize)
+        valid = valid_cells(window, no_data)
+        (rows, cols) = np.nonzero(valid)
+        cells.append((rows + yoff).astype(np.int64) * x_length + cols + xoff)
+        values.append(window[valid])
+    cells = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+    values = np.concatenate(values) if values else np.empty(0, dtype=gdal_array.GDALTypeCodeToNumericTypeCode(rb.DataType))
+    # windows of tiles are not in row major order
+    if len(cells) > 1 and (np.diff(cells) < 0).any():
+        order = np.argsort(cells, kind='stable')
+        cells = cells[order]
+        values = values[order]
 
     geotransform = ds.GetGeoTransform()
     projection = ds.GetProjection()
 
-    fmap = fm.FeatureMap(fid, pu, min_val, max_val, x_length, y_length, geotransform, projection, no_data)
-    #write_tif(fmap, 'output')
-    return fm.FeatureMap(fid, pu, min_val, max_val, x_length, y_length, geotransform, projection, no_data)
+    return fm.FeatureMap(fid, cells, values, min_val, max_val, x_length, y_length, geotransform, projection, no_data)
 
 def read_file(file):
     with open(file, 'r') as f:
         return f.read()
 
-def read_config_file(config):
+def read_config_features(config):
+    """
+    Reads the json configuration file and its features
+
+    Parameters
+    ----------
+    config : str
+        Path of the json configuration file
+
+    Returns
+    -------
+    A tuple (path, features, config) with the folder of the configuration file, a DataFrame with the settings of each
+    feature and a dict with the configuration
+    """
+
     path = os.path.dirname(config)
     config_f = json.loads(read_file(open_file(config)))
 
     features = pd.DataFrame.from_dict(config_f["features"], orient="index")
     features['feature'] = features.index
     features = features.reset_index()
+    return (path, features, config_f)
 
-    maps = []
-    for feature, file in zip(features.index, features['file']):
-        maps.append(get_map(feature, path, file))
-    return (features, maps, config_f)
+def read_config_file(config, io_workers=1, timer=None, raster_memory=c.RASTER_MEMORY):
+    (path, features, config_f) = read_config_features(config)
+
+    loaders = {}
+    for feature, name, file in zip(features.index, features['feature'], features['file']):
+        loaders[feature] = (str(name), get_map, (feature, path, file, raster_memory))
+    maps = load_files(loaders, io_workers, timer)
+    return (features, [maps[feature] for feature in features.index], config_f)
 
 def write_tif(fmap, output):
+    from osgeo import gdal
+
     name = output + '/' + fmap.fid + '.tif'
     driver = gdal.GetDriverByName("GTiff")
     outdata = driver.Create(name, fmap.x_length, fmap.y_length, 1, gdal.GDT_UInt16)
@@ -143,6 +293,8 @@ def write_tif(fmap, output):
     #show_tif(fmap, arr_out)
 
 def show_fmap(fmap, output=None):
+    import matplotlib.pyplot as plt
+
     arr_out = np.reshape(fmap.pu, (fmap.y_length, fmap.x_length))
 
     f = plt.figure()
@@ -166,7 +318,75 @@ def show_fmap(fmap, output=None):
     #plt.savefig('Tiff.png')
     #plt.show()
 
-def read_csv_files(path_arg):
+def load_files(loaders, io_workers=1, timer=None):
+    """
+    Loads input files concurrently in a pool of threads and records the load time of each file
+
+    Parsing csv files and reading rasters mostly release the GIL, s.t., the files are read in parallel.
+
+    Parameters
+    ----------
+    loaders : dict
+        For each key a tuple (name, function, args), where function(*args) loads the file and name identifies its
+        load time, e.g., pu or con_data_1 (the same file can be loaded more than once)
+    io_workers : int
+        Number of threads
+    timer : Timer
+        Timer to add the load time of each file to (or None)
+
+    Returns
+    -------
+    A dict with the loaded contents for each key
+    """
+
+    def load(name, func, args):
+        start = time.perf_counter()
+        result = func(*args)
+        if timer is not None:
+            timer.add_load_time(name, time.perf_counter() - start)
+        return result
+
+    if io_workers is None or io_workers <= 1 or len(loaders) <= 1:
+        return {key: load(*loader) for key, loader in loaders.items()}
+    with ThreadPoolExecutor(io_workers) as pool:
+        futures = {key: pool.submit(load, *loader) for key, loader in loaders.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+def csv_cache_dir(args):
+    """
+    Returns the directory of the columnar csv cache, a subfolder of the cache directory
+
+    Parameters
+    ----------
+    args : Argparse namespace
+        Contains all passed arguments.
+
+    Returns
+    -------
+    Path of the csv cache directory, or None if the csv files are always parsed
+    """
+
+    return None if args.no_csv_cache else os.path.join(args.cache_dir, c.CSV_CACHE_SUBDIR)
+
+def input_loaders(path, csv_cache=c.CSV_CACHE_DIR):
+    """
+    Returns the loaders of the standard input files in the path directory
+
+    Parameters
+    ----------
+    path : str
+        Path to the folder containing the files
+    csv_cache : str
+        Directory of the columnar cache of the files (or None to always parse the files)
+
+    Returns
+    -------
+    A dict with the loaders (name, function, args) of features, pu and pvf
+    """
+
+    return {name: (name, csvc.read_csv, (open_table(path, file), csv_cache)) for name, file in (('features', c.FEAT_F), ('pu', c.PU_F), ('pvf', c.PVF_F))}
+
+def read_csv_files(path_arg, csv_cache=c.CSV_CACHE_DIR, io_workers=1, timer=None):
     """
     Opens and reads the standard input files in the path directory
 
@@ -174,6 +394,12 @@ def read_csv_files(path_arg):
     ----------
     path : str
         Path to the folder containing the files
+    csv_cache : str
+        Directory of the columnar cache of the files (or None to always parse the files)
+    io_workers : int
+        Number of threads reading the files
+    timer : Timer
+        Timer to add the load time of each file to (or None)
 
     Returns
     -------
@@ -181,12 +407,125 @@ def read_csv_files(path_arg):
     """
 
     path = process_path(path_arg)
-    features = pd.read_csv(open_file(path, c.FEAT_F))
-    pu = pd.read_csv(open_file(path, c.PU_F))
-    pvf = pd.read_csv(open_file(path, c.PVF_F))
-    return (path, features, pu, pvf)
+    files = load_files(input_loaders(path, csv_cache), io_workers, timer)
+    return (path, files['features'], files['pu'], files['pvf'])
+
+def connectivity_loaders(path, args):
+    """
+    Returns the loaders of the connectivity files and the planning unit attribute file
 
-def read_connectivity_data(path, args):
+    Parameters
+    ----------
+    path : str
+        Path to the folder containing the files
+    args : Argparse namespace
+        Contains all passed arguments.
+
+    Returns
+    -------
+    A dict with the loaders (name, function, args): one for each connectivity file, with key (c.CON_DATA, i) and name
+    con_data_<i + 1>, and one for the planning unit attribute file, with key and name c.PU_DATA
+    """
+
+    csv_cache = csv_cache_dir(args)
+    loaders = {}
+    if getattr(args, 'con_matrix', None):
+        for i, matrix in enumerate(args.con_matrix):
+            loaders[(c.CON_DATA, i)] = (f"{c.CON_DATA}_{i + 1}", read_matrix_file, (path, matrix, args))
+    elif getattr(args, 'feature_edgelist', None):
+        for i, edgelist in enumerate(args.feature_edgelist):
+            loaders[(c.CON_DATA, i)] = (f"{c.CON_DATA}_{i + 1}", read_feature_edgelist, (open_file(path, edgelist), args.metric, args.complete_graph, csv_cache))
+    elif getattr(args, 'con_edgelist', None):
+        for i, edgelist in enumerate(args.con_edgelist):
+            loaders[(c.CON_DATA, i)] = (f"{c.CON_DATA}_{i + 1}", csvc.read_csv, (open_file(path, edgelist), csv_cache))
+    elif getattr(args, 'grid_map', None):
+        for i, grid_map in enumerate(args.grid_map):
+            loaders[(c.CON_DATA, i)] = (f"{c.CON_DATA}_{i + 1}", read_grid, (path, grid_map, args.grid_resistance, args.raster_memory))
+    if getattr(args, 'pu_data', None):
+        loaders[c.PU_DATA] = (c.PU_DATA, read_pu_data, (path, args.pu_data, csv_cache))
+    return loaders
+
+def read_input_files(args, timer=None):
+    """
+    Reads the standard input files, connectivity files and planning unit attribute file concurrently
+
+    Parameters
+    ----------
+    args : Argparse namespace
+        Contains all passed arguments.
+    timer : Timer
+        Timer to add the load time of each file to (or None)
+
+    Returns
+    -------
+    A tuple (path, features, pu, pvf, con_data, pu_data), where con_data is the list of connectivity datasets (as
+    returned by read_connectivity_data) and pu_data the planning unit attribute data (or None)
+    """
+
+    path = process_path(args.input)
+    loaders = input_loaders(path, csv_cache_dir(args))
+    loaders.update(connectivity_loaders(path, args))
+    files = load_files(loaders, args.io_workers, timer)
+    con_data = [files[key] for key in loaders if isinstance(key, tuple) and key[0] == c.CON_DATA]
+    return (path, files['features'], files['pu'], files['pvf'], con_data, files.get(c.PU_DATA))
+
+def read_grid(path, grid_map, resistance=None, memory=c.RASTER_MEMORY):
+    """
+    Reads the raster of a grid connectivity dataset and its resistance raster
+
+    Parameters
+    ----------
+    path : str
+        Path to the folder containing the files
+    grid_map : str
+        GeoTIFF whose cells with data are the planning units
+    resistance : str
+        GeoTIFF with the resistance of each cell (or None)
+    memory : float
+        Memory budget (in MB) of the window the rasters are read in
+
+    Returns
+    -------
+    A tuple (fmap, resistance) with the FeatureMap of the raster and the FeatureMap of the resistance (or None)
+    """
+
+    fmap = get_map(grid_map, path, grid_map, memory)
+    if resistance is None:
+        return (fmap, None)
+    rmap = get_map(resistance, path, resistance, memory)
+    if (rmap.x_length, rmap.y_length) != (fmap.x_length, fmap.y_length):
+        error = "The resistance raster should have the same dimensions as the grid raster"
+        sys.exit(error)
+    if (rmap.values <= 0).any():
+        error = "The resistance raster should only contain values larger than 0"
+        sys.exit(error)
+    return (fmap, rmap)
+
+def read_matrix_file(path, matrix, args):
+    """
+    Reads a connectivity matrix file and saves its edgelist if requested
+
+    Parameters
+    ----------
+    path : str
+        Path to the folder containing the file
+    matrix : str
+        Name of the matrix file
+    args : Argparse namespace
+        Contains all passed arguments.
+
+    Returns
+    -------
+    A tuple (nodes, matrix) as returned by read_connectivity_matrix
+    """
+
+    con_matrix = read_connectivity_matrix(open_file(path, matrix))
+    if args.save_edgelist:
+        name = os.path.splitext(os.path.basename(matrix))[0] + c.EDGELIST_SUFFIX
+        save_csv(matrix_to_edgelist(con_matrix), args.output, name)
+    return con_matrix
+
+def read_connectivity_data(path, args, timer=None):
     """
     Check connectivity data type, read the file and return dataframes for each dataset in a list
 
@@ -196,24 +535,162 @@ def read_connectivity_data(path, args):
         Path to the folder containing the files
     args : Argparse namespace
         Contains all passed arguments.
+    timer : Timer
+        Timer to add the load time of each file to (or None)
+
+    Returns
+    -------
+    A list with the contents of each file: a tuple (nodes, matrix) for matrices, a DataFrame for edgelists, a tuple
+    (edgelists, thresholds) for feature edgelists and a tuple (fmap, resistance) for grid rasters
+    """
+
+    loaders = {key: loader for key, loader in connectivity_loaders(path, args).items() if key != c.PU_DATA}
+    files = load_files(loaders, args.io_workers, timer)
+    return [files[key] for key in loaders]
+
+def float_key(values):
+    """
+    Returns the bucket of each value in the sketch of a distribution: the 16 most significant bits of the value as
+    float32, mapped s.t., the order of the buckets follows the order of the values
+
+    Parameters
+    ----------
+    values : Numpy array
+        Values to find the bucket of
+
+    Returns
+    -------
+    Numpy array with the bucket (0 - 65535) of each value
+    """
+
+    bits = values.astype(np.float32).view(np.uint32)
+    key = np.where(bits >> 31, ~bits, bits | np.uint32(0x80000000))
+    return (key >> 16).astype(np.int64)
+
+def feature_thresholds(file, complete_graph, csv_cache=c.CSV_CACHE_DIR):
+    """
+    Calculates the complete graph threshold (mean or median of the non-zero values) of each feature in one pass over the file
+
+    The mean is exact. For the median each feature gets a sketch counting the values per bucket of float_key. The
+    median is then known to lie in the buckets of its middle rank(s), and is refined to its exact value while reading
+    the edges.
+
+    Parameters
+    ----------
+    file : str
+        Path of the feature edgelist
+    complete_graph : str
+        Type of threshold (mean, median)
+    csv_cache : str
+        Directory of the columnar cache of the file (or None to always parse the file)
 
     Returns
     -------
-    A list of Pandas DataFrames where each DataFrame contains the information of one file
-    """
-    files = []
-    if args.con_matrix:
-        for matrix in args.con_matrix:
-            files.append(read_connectivity_matrix(open_file(path, matrix)))
-    elif args.feature_edgelist:
-        for edgelist in args.feature_edgelist:
-            files.append(pd.read_csv(open_file(path, edgelist)))
-    elif args.con_edgelist:
-        for edgelist in args.con_edgelist:
-            files.append(pd.read_csv(open_file(path, edgelist)))
-    return files
-
-def read_pu_data(path, file):
+    A dict with the threshold of each feature for the mean, or a dict with the tuple (n, b1, b2, below) for the
+    median: the number of values, the buckets of the middle ranks and the number of values in lower buckets
+    """
+
+    sums = {}
+    counts = {}
+    sketches = {}
+    for chunk in csvc.read_csv_chunks(file, c.EDGELIST_CHUNK_ROWS, csv_cache):
+        values = chunk[c.HEL_VAL].to_numpy(dtype=np.float64)
+        nonzero = values != 0
+        (fids, inverse) = np.unique(chunk[c.HEL_FID].to_numpy()[nonzero], return_inverse=True)
+        values = values[nonzero]
+        for k, fid in enumerate(fids.tolist()):
+            v = values[inverse == k]
+            if complete_graph == c.MEAN:
+                sums[fid] = sums.get(fid, 0.0) + v.sum()
+                counts[fid] = counts.get(fid, 0) + len(v)
+            else:
+                sketch = np.bincount(float_key(v), minlength=2**16)
+                sketches[fid] = sketches[fid] + sketch if fid in sketches else sketch
+
+    if complete_graph == c.MEAN:
+        return {fid: sums[fid] / counts[fid] for fid in sums}
+    thresholds = {}
+    for fid, sketch in sketches.items():
+        n = int(sketch.sum())
+        cum = np.cumsum(sketch)
+        b1 = int(np.searchsorted(cum, (n - 1) // 2, side='right'))
+        b2 = int(np.searchsorted(cum, n // 2, side='right'))
+        below = int(cum[b1 - 1]) if b1 > 0 else 0
+        thresholds[fid] = (n, b1, b2, below)
+    return thresholds
+
+def read_feature_edgelist(file, metrics, complete_graph, csv_cache=c.CSV_CACHE_DIR):
+    """
+    Reads a feature edgelist in chunks and splits it per feature, only the non-zero edges are kept
+
+    If BC on a complete graph is the only metric, the edges below the complete graph threshold of their feature are
+    dropped as well. The threshold is calculated in a first pass over the file, s.t., the memory needed depends on
+    the number of kept edges and not on the size of the file.
+
+    Parameters
+    ----------
+    file : str
+        Path of the feature edgelist
+    metrics : list
+        List of strings with the names of the metrics
+    complete_graph : str
+        Type of threshold in case of a complete graph (mean, median or None)
+    csv_cache : str
+        Directory of the columnar cache of the file (or None to always parse the file)
+
+    Returns
+    -------
+    A tuple (edgelists, thresholds) with a dict containing a DataFrame with the edges of each feature and a dict
+    with the complete graph threshold of each feature (or None without a complete graph)
+    """
+
+    bc_only = complete_graph is not None and set(metrics) == {c.BC}
+    sketch = feature_thresholds(file, complete_graph, csv_cache) if bc_only else None
+
+    parts = {}
+    median_parts = {}
+    for chunk in csvc.read_csv_chunks(file, c.EDGELIST_CHUNK_ROWS, csv_cache):
+        values = chunk[c.HEL_VAL].to_numpy(dtype=np.float64)
+        fid_col = chunk[c.HEL_FID].to_numpy()
+        (fids, inverse) = np.unique(fid_col, return_inverse=True)
+        keep = values != 0
+        if bc_only:
+            keep &= values > 0
+            if complete_graph == c.MEAN:
+                keep &= values >= np.array([sketch.get(fid, np.inf) for fid in fids.tolist()])[inverse]
+            else:
+                # keep the edges in or above the buckets of the median, the exact cut follows after reading
+                b1 = np.array([sketch[fid][1] if fid in sketch else np.iinfo(np.int64).max for fid in fids.tolist()])[inverse]
+                keep &= float_key(values) >= b1
+        edges = chunk.drop(columns=c.HEL_FID)
+        for k, fid in enumerate(fids.tolist()):
+            rows = keep & (inverse == k)
+            parts.setdefault(fid, []).append(edges.loc[rows])
+            if bc_only and complete_graph == c.MEDIAN and fid in sketch:
+                (_, b1, b2, _) = sketch[fid]
+                key = float_key(values[inverse == k])
+                median_parts.setdefault(fid, []).append(values[inverse == k][(key >= b1) & (key <= b2)])
+
+    edgelists = {}
+    thresholds = {} if complete_graph else None
+    for fid in sorted(parts):
+        edgelists[fid] = pd.concat(parts[fid], ignore_index=True)
+        if not complete_graph:
+            continue
+        if not bc_only:
+            values = edgelists[fid][c.HEL_VAL].astype(np.float64)
+            thresholds[fid] = values.mean() if complete_graph == c.MEAN else values.median()
+        elif complete_graph == c.MEAN:
+            thresholds[fid] = sketch.get(fid, np.nan)
+        elif fid in sketch:
+            (n, b1, b2, below) = sketch[fid]
+            middle = np.sort(np.concatenate(median_parts[fid]))
+            thresholds[fid] = (middle[(n - 1) // 2 - below] + middle[n // 2 - below]) / 2
+        else:
+            thresholds[fid] = np.nan
+    return (edgelists, thresholds)
+
+def read_pu_data(path, file, csv_cache=c.CSV_CACHE_DIR):
     """
     Opens and reads the attribute planning unit file for connectivity
 
@@ -223,18 +700,56 @@ def read_pu_data(path, file):
         Path to the folder containing the file
     file : str
         Name of the file to open
+    csv_cache : str
+        Directory of the columnar cache of the file (or None to always parse the file)
 
     Returns
     -------
     A DataFrame containing the planning unit attribute information or an error if the file could not be read
     """
 
-    dft = pd.read_csv(open_file(path, file))
+    dft = csvc.read_csv(open_file(path, file), csv_cache)
     return dft
 
+def read_solutions(path):
+    """
+    Reads all solutions in a folder, i.e., csv files with the id (pu) and decision variable (x) of each planning unit
+    as in solution.csv
+
+    Parameters
+    ----------
+    path : str
+        Path to the folder containing the solutions
+
+    Returns
+    -------
+    A tuple (names, solutions) with the name of each file without extension and a list of DataFrames [pu, x], in
+    the order of the file names. Csv files without pu and x columns, e.g., metrics.csv, are skipped
+    """
+
+    path = process_path(path)
+    names = []
+    solutions = []
+    for f in sorted(f for f in os.listdir(path) if f.endswith('.csv')):
+        file = os.path.join(path, f)
+        columns = pd.read_csv(file, nrows=0).columns
+        if c.PUX_PID not in columns or c.PUX_X not in columns:
+            print(f"Warning: skipping {f}, it has no {c.PUX_PID} and {c.PUX_X} columns")
+            continue
+        names.append(os.path.splitext(f)[0])
+        solutions.append(pd.read_csv(file, usecols=[c.PUX_PID, c.PUX_X]))
+    if not solutions:
+        error = f"No solutions (csv files with {c.PUX_PID} and {c.PUX_X} columns) found in {path}"
+        sys.exit(error)
+    return (names, solutions)
+
 def read_connectivity_matrix(file):
     """
-    Opens and reads the connectivity matrix file
+    Opens and reads the connectivity matrix file in blocks of rows, only the non-zero cells are kept
+
+    The file has a header with the planning unit id of each column and optionally a first column with the planning
+    unit id of each row. Without this column the rows have the planning unit ids of the columns, in the same order.
+    The rows and columns should contain the same planning units, otherwise the run stops with an error.
 
     Parameters
     ----------
@@ -243,14 +758,60 @@ def read_connectivity_matrix(file):
 
     Returns
     -------
-    A DataFrame containing the data of the connectivity matrix or an error if the file could not be read
+    A tuple (nodes, matrix) with a Numpy array of the planning unit id of each row and a square scipy.sparse coo
+    matrix with the non-zero values, where cell (i, j) is the value of the edge from nodes[i] to nodes[j]
     """
-    dft = pd.read_csv(file)
-    # fix possible unnamed columns in input file
-    if dft.columns.str.contains('^Unnamed:').any():
-        dft = pd.read_csv(file, index_col=[0])
-    dft.columns = dft.columns.astype(int)
-    return dft
+
+    with open(file, 'r') as f:
+        header = next(csv.reader(f))
+    # an empty first header field indicates a column with the planning unit id of each row
+    has_index = header[0].strip() == '' or header[0].startswith('Unnamed:')
+    col_ids = np.array(header[1:] if has_index else header).astype(int)
+    chunk_rows = max(1, c.MATRIX_CHUNK_CELLS // max(len(col_ids), 1))
+
+    row_ids = []
+    rows = []
+    cols = []
+    values = []
+    start = 0
+    for chunk in pd.read_csv(file, index_col=0 if has_index else None, chunksize=chunk_rows):
+        block = chunk.to_numpy(dtype=np.float64)
+        (r, col) = np.nonzero(block)
+        row_ids.append(chunk.index.to_numpy().astype(int) if has_index else col_ids[start:start + len(chunk)])
+        rows.append(r + start)
+        cols.append(col)
+        values.append(block[r, col])
+        start += len(chunk)
+
+    nodes = np.concatenate(row_ids) if row_ids else np.empty(0, dtype=int)
+    rows = np.concatenate(rows) if rows else np.empty(0, dtype=int)
+    values = np.concatenate(values) if values else np.empty(0)
+    # position of the planning unit of each column in the rows, each row should have exactly one column
+    node_index = pd.Index(nodes)
+    position = node_index.get_indexer(col_ids) if node_index.is_unique else None
+    if start != len(col_ids) or position is None or (position < 0).any() or len(np.unique(position)) != len(position):
+        error = f"Connectivity matrix {file}: the planning unit ids of the rows and columns do not match"
+        sys.exit(error)
+    cols = position[np.concatenate(cols)] if cols else np.empty(0, dtype=int)
+    matrix = sp.coo_matrix((values, (rows, cols)), shape=(len(nodes), len(nodes)))
+    return (nodes, matrix)
+
+def matrix_to_edgelist(con_matrix):
+    """
+    Converts a sparse connectivity matrix to an edgelist
+
+    Parameters
+    ----------
+    con_matrix : tuple
+        Tuple (nodes, matrix) as returned by read_connectivity_matrix
+
+    Returns
+    -------
+    A Pandas DataFrame with the planning unit ids and the value of each non-zero edge
+    """
+
+    (nodes, matrix) = con_matrix
+    return pd.DataFrame({c.HEL_PID1: nodes[matrix.row], c.HEL_PID2: nodes[matrix.col], c.HEL_VAL: matrix.data})
 
 def save_csv(df, path, name):
     """
@@ -277,6 +838,30 @@ def save_csv(df, path, name):
     # write solutions to file
     df.to_csv(os.path.join(path,name), index=False)
 
+def save_npz(matrix, path, name):
+    """
+    Saves the sparse matrix to a compressed npz file and stores it in path
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix
+        Matrix to save
+    path : str
+        Path to the output folder to store the npz file
+    name : str
+        Name of the saved npz file
+
+    Returns
+    -------
+    None
+    """
+
+    # create output folder if it doesn't exist
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    sp.save_npz(os.path.join(path, name), sp.csr_matrix(matrix))
+
 def print_solution_stats(solution, conservation, timer):
     """
     Print to console some basic stats on the solution found
@@ -16,6 +16,42 @@
 # along with Coco. If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import constant as c
+
+def connectivity_parser(required):
+    """
+    Creates a parent parser with the connectivity data arguments shared by the RSP variants and EVAL
+
+    Parameters
+    ----------
+    required : bool
+        Whether one of the connectivity data sources is required
+
+    Returns
+    -------
+    An ArgumentParser without help containing the connectivity data arguments
+    """
+
+    con_parser = argparse.ArgumentParser(add_help=False)
+    con_data = con_parser.add_mutually_exclusive_group(required=required)
+    con_data.add_argument('--con-matrix', type=str, action='append', help='File containing the connectivity matrix')
+    con_data.add_argument('--con-edgelist', type=str, action='append', help='File containing the connectivity edgelist')
+    con_data.add_argument('--feature-edgelist', type=str, action='append', help='File containing the connectivity edgelist for different features')
+    con_data.add_argument('--grid-map', type=str, action='append', help='GeoTIFF whose cells with data are the planning units, connected to their neighbouring cells')
+    con_data.add_argument('--distance-decay', type=float, metavar='ALPHA', help='Connect planning units within a cutoff distance of each other (xloc, yloc in pu.csv), weighted by a distance decay kernel with scale ALPHA')
+    con_parser.add_argument('--grid-neighbours', type=int, choices=[4, 8], default=8, help='Connect each cell of a grid map to its 4 or 8 neighbouring cells')
+    con_parser.add_argument('--grid-resistance', type=str, help='GeoTIFF with the resistance (> 0) of each cell of the grid map, an edge has the conductance 1 / (mean resistance of its cells * their distance)')
+    con_parser.add_argument('--grid-weight', type=float, default=1.0, help='Weight of each edge of the grid map without resistance raster')
+    con_parser.add_argument('--decay-kernel', choices=['exp', 'gaussian'], default='exp', help='Distance decay kernel: exp(-d / alpha) or exp(-(d / alpha)^2 / 2)')
+    con_parser.add_argument('--decay-cutoff', type=float, help='Maximum distance of distance decay edges (default: 3 * alpha)')
+    con_parser.add_argument('--decay-neighbours', type=int, help='Connect each planning unit to at most this number of nearest planning units within the cutoff')
+    con_parser.add_argument('--sparsify', choices=['top-k', 'quantile', 'backbone'], help='Keep only the strongest edges of each connectivity graph: the top-k out-edges per node, the edges above a quantile or a maximum spanning forest')
+    con_parser.add_argument('--sparsify-k', type=int, help='Number of strongest out-edges per node to keep (top-k, or in addition to the backbone)')
+    con_parser.add_argument('--sparsify-quantile', type=float, help='Keep the edges with a weight of at least this quantile of all weights (quantile, or in addition to the backbone)')
+    con_parser.add_argument('--pu-data', type=str, help='File containing attribute values for planning units per feature')
+    con_parser.add_argument('--save-edgelist', action='store_true', help='Save the non-zero edges of each connectivity matrix as an edgelist in the output folder')
+    con_parser.add_argument('--complete-graph', choices=['mean', 'median'], help='Indicates the data contains a complete graph, all values below should be dropped')
+    return con_parser
 
 def parse_args():
     """
@@ -32,6 +68,21 @@ def parse_args():
 
     coco_parser = argparse.ArgumentParser(add_help=False)
 
+    ###
+    # Metric calculation arguments
+    ###
+    coco_parser.add_argument('--workers', type=int, default=1, help='The number of worker processes used to calculate the BC values')
+    bc_approx = coco_parser.add_mutually_exclusive_group()
+    bc_approx.add_argument('--bc-samples', type=int, help='Approximate BC by sampling this number of source vertices')
+    bc_approx.add_argument('--bc-error', type=float, help='Approximate BC by sampling source vertices until the estimated relative error is at most this value')
+    coco_parser.add_argument('--bc-seed', type=int, default=0, help='Seed of the source vertex sample when approximating BC')
+    coco_parser.add_argument('--cache-dir', type=str, default=c.CACHE_DIR, help='Directory to cache the calculated metric values and the columnar csv files in')
+    coco_parser.add_argument('--cache-size', type=float, default=c.CACHE_SIZE, help='Maximum size of the metric cache in MB, least recently used values are removed first')
+    coco_parser.add_argument('--no-cache', action='store_true', help='Always calculate the metric values, without using the metric cache')
+    coco_parser.add_argument('--no-csv-cache', action='store_true', help='Always parse the csv input files, without using their columnar cache')
+    coco_parser.add_argument('--io-workers', type=int, default=1, help='The number of threads reading the input files concurrently')
+    coco_parser.add_argument('--raster-memory', type=float, default=c.RASTER_MEMORY, help='Memory budget (in MB) of the windows GeoTIFF rasters are read in')
+
     ###
     # Gurobi related arguments
     ###
@@ -40,6 +91,13 @@ def parse_args():
     coco_parser.add_argument('--gurobi-log', type=str, help='File path to store Gurobi log in')
     coco_parser.add_argument('--gurobi-threads', type=int, help='The number of threads to restrict Gurobi to')
     coco_parser.add_argument('--gurobi-mem', type=float, help='The amount of memory (in GB) to restrict Gurobi to')
+    coco_parser.add_argument('--pool-solutions', type=int, help='Keep this number of solutions in the solution pool of Gurobi and save them all')
+    coco_parser.add_argument('--pool-search-mode', type=int, choices=[0, 1, 2], default=2, help='How Gurobi searches for pool solutions: 0 keeps the solutions found on the way, 1 searches for more solutions, 2 for the best solutions')
+    coco_parser.add_argument('--pool-gap', type=float, help='Only keep pool solutions within this relative gap to the best solution')
+
+    # the RSP variants with connectivity require connectivity data, EVAL only with a metric
+    rsp_con_parser = connectivity_parser(True)
+    eval_con_parser = connectivity_parser(False)
 
     parser = argparse.ArgumentParser("Coco", formatter_class=argparse.RawTextHelpFormatter, description="Finding optimal solutions to variations of the RSP including connectivity")
     subparsers = parser.add_subparsers(title='Coco subcommands', dest='cmd', description='for specific help on RSP variants use: python coco.py {cmd} --help')
@@ -56,10 +114,21 @@ def parse_args():
     pf.add_argument('--output', type=str, required=True, help='Folder to store result files in')
 
 
+    ###
+    # Zonal aggregation parser
+    ###
+    zonal = subparsers.add_parser("ZONAL", parents=[coco_parser])
+    zonal.add_argument('--config', type=str, required=True, help='Json file containing the feature rasters, see documentation')
+    zonal.add_argument('--zones', type=str, required=True, help='GeoTIFF containing the planning unit id of each cell')
+    zonal.add_argument('--output', type=str, required=True, help='Folder to store the pu and pvf tables in')
+    zonal.add_argument('--statistic', choices=['sum', 'mean'], default='sum', help='Value of a feature in a planning unit: the sum or the mean of its cells')
+    zonal.add_argument('--cost', type=str, help='GeoTIFF containing the cost of each cell, summed per planning unit (default: the number of cells)')
+
+
     ###
     # RSP-CF parser
     ###
-    cf = subparsers.add_parser("RSP-CF", parents=[coco_parser])
+    cf = subparsers.add_parser("RSP-CF", parents=[coco_parser, rsp_con_parser])
     cf.add_argument('--input', type=str, required=True, help='Folder containing the input files')
     cf.add_argument('--output', type=str, required=True, help='Folder to store result files in')
     cf.add_argument('--metric', action='append', required=True, choices=['ec', 'indegree', 'outdegree', 'bc'], help='Which connectivity metric to use')
@@ -76,19 +145,13 @@ def parse_args():
     cf_max.add_argument('--metric-max', action='append', type=float, help='Maximum value to use when discritzing metric')
     cf_max.add_argument('--metric-max-type', action='append', choices=['max', 'mean', 'median'], help='Minimum value to calculate when discritzing metric')
 
-    cf_con_data = cf.add_mutually_exclusive_group(required=True)
-    cf_con_data.add_argument('--con-matrix', type=str, action='append', help='File containing the connectivity matrix')
-    cf_con_data.add_argument('--con-edgelist', type=str, action='append', help='File containing the connectivity edgelist')
-    cf_con_data.add_argument('--feature-edgelist', type=str, action='append', help='File containing the connectivity edgelist for different features')
-    cf.add_argument('--pu-data', type=str, help='File containing attribute values for planning units per feature')
-
-    #cf.add_argument('--complete-graph', action='store_true', help='Indicates the data contains a complete graph')
-    cf.add_argument('--complete-graph', choices=['mean', 'median'], help='Indicates the data contains a complete graph, all values below should be dropped')
+    cf.add_argument('--post-connectivity', action='store_true', help='Calculate the metrics and connected components of the subgraph induced by the solution area')
+    cf.add_argument('--pair-formulation', choices=['and', 'linear'], default='and', help='Formulation of the pair variables of edge weighted metrics: and-constraints or the linear relaxation z <= xi, z <= xj')
 
     ###
     # RSP-CC parser
     ###
-    cc = subparsers.add_parser("RSP-CC", parents=[coco_parser])
+    cc = subparsers.add_parser("RSP-CC", parents=[coco_parser, rsp_con_parser])
     cc.add_argument('--input', type=str, required=True, help='Folder containing the input files')
     cc.add_argument('--output', type=str, required=True, help='Folder to store result files in')
     cc.add_argument('--metric', action='append', required=True, choices=['ec', 'indegree', 'outdegree', 'bc'], help='Which connectivity metric to use')
@@ -102,17 +165,13 @@ def parse_args():
     cc_max.add_argument('--metric-max', action='append', type=float, help='Maximum value to use when discritzing metric')
     cc_max.add_argument('--metric-max-type', action='append', choices=['max', 'mean', 'median'], help='Minimum value to calculate when discritzing metric')
 
-    cc_con_data = cc.add_mutually_exclusive_group(required=True)
-    cc_con_data.add_argument('--con-matrix', type=str, action='append', help='File containing the connectivity matrix')
-    cc_con_data.add_argument('--con-edgelist', type=str, action='append', help='File containing the connectivity edgelist')
-    cc_con_data.add_argument('--feature-edgelist', type=str, action='append', help='File containing the connectivity feature edgelist')
-    cc.add_argument('--pu-data', type=str, help='File containing attribute values for planning units per feature')
-    cc.add_argument('--complete-graph', choices=['mean', 'median'], help='Indicates the data contains a complete graph, all values below should be dropped')
+    cc.add_argument('--post-connectivity', action='store_true', help='Calculate the metrics and connected components of the subgraph induced by the solution area')
+    cc.add_argument('--pair-formulation', choices=['and', 'linear', 'quadratic'], default='and', help='Formulation of the pair variables of edge weighted metrics: and-constraints, the linear relaxation z <= xi, z <= xj or a quadratic objective xi * xj')
 
     ###
     # RSP-Con parser
     ###
-    con = subparsers.add_parser("RSP-CBC", parents=[coco_parser])
+    con = subparsers.add_parser("RSP-CBC", parents=[coco_parser, rsp_con_parser])
     con.add_argument('--input', type=str, required=True, help='Folder containing the input files')
     con.add_argument('--output', type=str, required=True, help='Folder to store result files in')
     con.add_argument('--metric', action='append', required=True, choices=['ec', 'indegree', 'outdegree', 'bc'], help='Which connectivity metric to use')
@@ -126,12 +185,19 @@ def parse_args():
     con_max.add_argument('--metric-max', action='append', type=float, help='Maximum value to use when discritzing metric')
     con_max.add_argument('--metric-max-type', action='append', choices=['max', 'mean', 'median'], help='Minimum value to calculate when discritzing metric')
 
-    con_data = con.add_mutually_exclusive_group(required=True)
-    con_data.add_argument('--con-matrix', type=str, action='append', help='File containing the connectivity matrix')
-    con_data.add_argument('--con-edgelist', type=str, action='append', help='File containing the connectivity edgelist')
-    con_data.add_argument('--feature-edgelist', type=str, action='append', help='File containing the connectivity feature edgelist')
-    con.add_argument('--pu-data', type=str, help='File containing attribute values for planning units per feature')
-    con.add_argument('--complete-graph', choices=['mean', 'median'], help='Indicates the data contains a complete graph, all values below should be dropped')
+    con.add_argument('--post-connectivity', action='store_true', help='Calculate the metrics and connected components of the subgraph induced by the solution area')
+    con.add_argument('--pair-formulation', choices=['and', 'linear', 'quadratic'], default='and', help='Formulation of the pair variables of edge weighted metrics: and-constraints, the linear relaxation z <= xi, z <= xj or a quadratic objective xi * xj')
+
+    ###
+    # Evaluation parser
+    ###
+    evaluate = subparsers.add_parser("EVAL", parents=[coco_parser, eval_con_parser])
+    evaluate.add_argument('--input', type=str, required=True, help='Folder containing the input files')
+    evaluate.add_argument('--output', type=str, required=True, help='Folder to store result files in')
+    evaluate.add_argument('--solutions', type=str, required=True, help='Folder containing the solutions to evaluate, csv files with columns pu and x as solution.csv')
+    evaluate.add_argument('--metric', action='append', choices=['ec', 'indegree', 'outdegree', 'bc'], help='Which connectivity metric to evaluate')
+    # metrics are evaluated on their calculated values, without thresholds or pair variables
+    evaluate.set_defaults(metric_min=None, metric_min_type=None, metric_max=None, metric_max_type=None, pair_formulation=c.PAIR_AND)
 
     ###
     # RSP-BLM parser
@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with Coco. If not, see <http://www.gnu.org/licenses/>.
 
+import os
+
 ###
 # ARGS CONSTANTS
 ###
@@ -22,9 +24,11 @@
 # RSP variants
 RSP_CF = 'RSP-CF'
 RSP_CC = 'RSP-CC'
-RSP_CON = 'RSP-Con'
+RSP_CON = 'RSP-CBC'
 RSP = 'RSP'
 RSP_BLM = 'RSP-BLM'
+# evaluation of given solutions
+EVAL = 'EVAL'
 
 # metrics
 EC = 'ec'
@@ -46,6 +50,7 @@ BOUNDS_F = 'bound.dat'
 # pu.csv
 PU_ID = 'pu'
 PU_COST = 'cost'
+PU_STATUS = 'status'
 PU_XLOC = 'xloc'
 PU_YLOC = 'yloc'
 
@@ -85,6 +90,12 @@ BD_BOUND = 'boundary'
 PUX_PID = 'pu'
 PUX_X = 'x'
 
+# dense planning unit index columns
+PVF_IDX = 'idx'
+MET_IDX = 'idx'
+MET_IDX1 = 'idx1'
+MET_IDX2 = 'idx2'
+
 # metric values
 MET_PID = 'pu'
 MET_PID1 = 'pu1'
@@ -95,9 +106,26 @@ MET_VAL = 'value'
 NODE_VAL = 'value'
 EDGE_VAL = 'value'
 
+# pair variable formulations for edge weighted metrics
+PAIR_AND = 'and'
+PAIR_LINEAR = 'linear'
+PAIR_QUADRATIC = 'quadratic'
+
+# distance decay kernels
+DECAY_EXP = 'exp'
+DECAY_GAUSSIAN = 'gaussian'
+# default cutoff distance of distance decay edges, in multiples of the distance scale
+DECAY_CUTOFF = 3
+
+# graph sparsification methods
+SPARSE_TOP_K = 'top-k'
+SPARSE_QUANTILE = 'quantile'
+SPARSE_BACKBONE = 'backbone'
+
 # metric value name
 MEAN = 'mean'
 MEDIAN = 'median'
+SUM = 'sum'
 MIN = 'min'
 MAX = 'max'
 
@@ -111,6 +139,12 @@ TARGETS = 'targets.csv'
 SOLUTION = 'solution.csv'
 RUNSTATS = 'runstats.csv'
 SOL_AREA = 'solution_area.pdf'
+POST_METRICS = 'post_metrics.csv'
+EVAL_SUMMARY = 'eval_summary.csv'
+EVAL_FEATURES = 'eval_features.csv'
+EVAL_METRICS = 'eval_metrics.csv'
+SOL_POOL = 'solution_pool.npz'
+POOL_STATS = 'pool.csv'
 
 # args_stats
 ARGS_NAME = 'name'
@@ -124,6 +158,13 @@ TOTAL_TIME = 'total_time'
 OBJ_VAL = 'obj_value'
 GAP_OPT = 'gap_to_opt'
 TOTAL_COST = 'total_cost'
+NUM_VARS = 'num_vars'
+NUM_BIN_VARS = 'num_bin_vars'
+NUM_CONSTRS = 'num_constrs'
+NUM_GEN_CONSTRS = 'num_gen_constrs'
+NUM_NZS = 'num_nzs'
+NUM_QNZS = 'num_qnzs'
+LOAD_TIME = 'load_time'
 
 # features stats
 FEATURES = 'features'
@@ -142,4 +183,54 @@ MAX_THRES = 'max_threshold'
 TARGET_M = 'target'
 TOTAL_METRIC_M = 'total_metric'
 AVG_PER_PU = 'avg_per_pu'
-
+REMOVED_ZERO = 'removed_zero'
+REMOVED_LOOPS = 'removed_self_loops'
+SAMPLE_SIZE = 'bc_sample_size'
+EST_ERROR = 'bc_estimated_error'
+KEPT_EDGES = 'kept_edges'
+WEIGHT_SHARE = 'kept_weight_share'
+
+# post-solve metrics stats of the solution area
+SEL_PU = 'selected_pu'
+SEL_EDGES = 'selected_edges'
+COMPONENTS = 'components'
+LARGEST_COMP = 'largest_component'
+MEAN_M = 'mean'
+
+# evaluation stats of given solutions
+SOL_NAME = 'solution'
+SHORTFALL_F = 'shortfall'
+TARGETS_MET = 'targets_met'
+TOTAL_SHORTFALL = 'total_shortfall'
+
+# solution pool: number of pool solutions selecting each planning unit (as the summed solution of Marxan)
+SSOLN = 'ssoln'
+POOL_SIZE = 'pool_size'
+
+# metric cache
+CACHE_VERSION = 1
+CACHE_EXT = '.npz'
+CACHE_VALUES = 'values'
+CACHE_DIR = '~/.cache/coco'
+CACHE_SIZE = 1024
+
+# sparse matrix reader: number of cells read at once, suffix of the saved edgelist
+MATRIX_CHUNK_CELLS = 2**22
+EDGELIST_SUFFIX = '_edgelist.csv'
+# keys of the connectivity data and planning unit attribute data in the loaded input files
+CON_DATA = 'con_data'
+PU_DATA = 'pu_data'
+# feature edgelist reader: number of rows read at once
+EDGELIST_CHUNK_ROWS = 2**20
+
+# csv cache
+CSV_CACHE_VERSION = 2
+# subfolder of the cache directory (--cache-dir) with the columnar cache of the csv files
+CSV_CACHE_SUBDIR = 'csv'
+CSV_CACHE_DIR = os.path.join(CACHE_DIR, CSV_CACHE_SUBDIR)
+# folder next to the tables written without csv file, e.g., by the zonal aggregation
+CSV_TABLE_DIR = '.coco-tables'
+CSV_MANIFEST = 'manifest.json'
+
+# raster reader: memory budget (in MB) of one window of a feature map
+RASTER_MEMORY = 256
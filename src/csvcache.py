@@ -0,0 +1,549 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import constant as c
+
+def cache_path(file, cache_dir=c.CSV_CACHE_DIR):
+    """
+    Returns the folder of the columnar cache of a csv file in the cache directory, named after a hash of the absolute
+    path of the file
+
+    Parameters
+    ----------
+    file : str
+        Path of the csv file
+    cache_dir : str
+        Directory of the csv cache
+
+    Returns
+    -------
+    Path of the cache folder of the file
+    """
+
+    file = os.path.abspath(file)
+    key = hashlib.sha256(file.encode()).hexdigest()
+    return os.path.join(os.path.expanduser(cache_dir), f"{key}_{os.path.basename(file)}")
+
+def table_path(file):
+    """
+    Returns the folder of a table written without csv file, in a folder next to the csv file it replaces
+
+    Parameters
+    ----------
+    file : str
+        Path of the csv file
+
+    Returns
+    -------
+    Path of the table folder of the file
+    """
+
+    (folder, name) = os.path.split(os.path.abspath(file))
+    return os.path.join(folder, c.CSV_TABLE_DIR, name)
+
+def file_hash(file):
+    """
+    Returns the sha256 hash of the contents of a file
+
+    Parameters
+    ----------
+    file : str
+        Path of the file
+
+    Returns
+    -------
+    Hexadecimal sha256 hash of the file
+    """
+
+    h = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def compact_column(values):
+    """
+    Returns the column with the smallest dtype that holds all its values exactly
+
+    Integer columns become int32 if all values fit, float columns become float32 if no value changes. Text columns
+    are stored as fixed width unicode, s.t., they can be memory mapped as well, masked where a value is missing.
+
+    Parameters
+    ----------
+    values : Pandas Series
+        Column of a csv file
+
+    Returns
+    -------
+    Numpy array with the values of the column, a masked array for text columns
+    """
+
+    values = values.to_numpy()
+    if values.dtype.kind in 'iu':
+        if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+            return values.astype(np.int32)
+        return values
+    if values.dtype.kind == 'f':
+        compact = values.astype(np.float32)
+        same = (compact.astype(values.dtype) == values) | (np.isnan(compact) & np.isnan(values))
+        return compact if same.all() else values
+    if values.dtype.kind == 'b':
+        return values
+    nulls = pd.isna(values)
+    return np.ma.MaskedArray(np.where(nulls, '', values).astype(str), mask=nulls)
+
+def text_column(values, nulls):
+    """
+    Returns a text column as read by pandas: objects, with NaN for the missing values
+
+    Parameters
+    ----------
+    values : Numpy array
+        Fixed width unicode values of the column
+    nulls : Numpy array
+        Boolean mask of the missing values (or None if no value is missing)
+
+    Returns
+    -------
+    Numpy array of objects
+    """
+
+    values = values.astype(object)
+    if nulls is not None:
+        values[nulls] = np.nan
+    return values
+
+def read_manifest(folder):
+    """
+    Reads the manifest of a columnar cache
+
+    Parameters
+    ----------
+    folder : str
+        Cache folder of the csv file
+
+    Returns
+    -------
+    A dict with the manifest, or None if there is no valid manifest
+    """
+
+    try:
+        with open(os.path.join(folder, c.CSV_MANIFEST), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == c.CSV_CACHE_VERSION else None
+
+def write_cache(file, folder, columns, stat, digest):
+    """
+    Writes each column as a .npy file and the manifest describing the source file and the columns
+
+    Parameters
+    ----------
+    file : str
+        Path of the csv file, or None for a table without csv file
+    folder : str
+        Cache folder of the csv file
+    columns : dict
+        Compact Numpy array of each column of the csv file
+    stat : os.stat_result
+        Status of the csv file when it was read, or None for a table without csv file
+    digest : str
+        Hash of the csv file, or None for a table without csv file
+
+    Returns
+    -------
+    None
+    """
+
+    # write to a temporary folder first and swap it in, s.t., a partial cache is never read
+    temp = f"{folder}.{os.getpid()}.tmp"
+    shutil.rmtree(temp, ignore_errors=True)
+    os.makedirs(temp)
+    files = []
+    for k, (name, values) in enumerate(columns.items()):
+        np.save(os.path.join(temp, f"{k}.npy"), np.ma.getdata(values))
+        column = {'name': name, 'file': f"{k}.npy", 'dtype': str(values.dtype)}
+        if np.ma.getmaskarray(values).any():
+            np.save(os.path.join(temp, f"{k}.nulls.npy"), np.ma.getmaskarray(values))
+            column['nulls'] = f"{k}.nulls.npy"
+        files.append(column)
+    manifest = {'version': c.CSV_CACHE_VERSION, 'source': os.path.abspath(file) if file is not None else None, 'columns': files}
+    write_manifest(temp, manifest, stat, digest)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(temp, folder)
+
+def write_table(file, df):
+    """
+    Writes a DataFrame directly in the columnar format of the csv cache, without writing the csv file itself
+
+    The table is stored next to the csv file it replaces and read as if it were the csv file, as long as there is
+    no csv file with the same name.
+
+    Parameters
+    ----------
+    file : str
+        Path of the csv file the table replaces
+    df : Pandas DataFrame
+        Table to write
+
+    Returns
+    -------
+    None
+    """
+
+    write_cache(None, table_path(file), {str(name): compact_column(df[name]) for name in df.columns}, None, None)
+
+def read_table(file):
+    """
+    Loads the table written in place of a csv file that does not exist
+
+    Parameters
+    ----------
+    file : str
+        Path of the csv file
+
+    Returns
+    -------
+    A Pandas DataFrame with the table, or None if there is no table without csv file
+    """
+
+    if os.path.exists(file):
+        return None
+    folder = table_path(file)
+    manifest = read_manifest(folder)
+    if manifest is None or manifest['source'] is not None:
+        return None
+    return load_cache(folder, manifest)
+
+def write_manifest(folder, manifest, stat, digest):
+    """
+    Writes the manifest of a columnar cache with the modification time, size and hash of the csv file (if any)
+
+    Parameters
+    ----------
+    folder : str
+        Cache folder of the csv file
+    manifest : dict
+        Manifest of the cache
+    stat : os.stat_result
+        Status of the csv file, or None for a table without csv file
+    digest : str
+        Hash of the csv file, or None for a table without csv file
+
+    Returns
+    -------
+    None
+    """
+
+    if stat is not None:
+        manifest.update({'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest})
+    with open(os.path.join(folder, c.CSV_MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+
+def load_cache(folder, manifest):
+    """
+    Loads the columns of a columnar cache as memory mapped arrays
+
+    The arrays are mapped copy-on-write: they are only read from disk when used, and changes stay in memory.
+
+    Parameters
+    ----------
+    folder : str
+        Cache folder of the csv file
+    manifest : dict
+        Manifest of the cache
+
+    Returns
+    -------
+    A Pandas DataFrame with the contents of the csv file
+    """
+
+    data = {}
+    for column in manifest['columns']:
+        file = os.path.join(folder, column['file'])
+        try:
+            values = np.load(file, mmap_mode='c')
+        except ValueError:
+            # empty columns can not be memory mapped
+            values = np.load(file)
+        if values.dtype.kind == 'U':
+            nulls = np.load(os.path.join(folder, column['nulls'])) if 'nulls' in column else None
+            values = text_column(values, nulls)
+        data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+def valid_manifest(file, folder, stat):
+    """
+    Returns the manifest of the columnar cache of a csv file if the cache matches the file
+
+    The cache matches if the modification time and size of the file are unchanged. Otherwise the hash of the file is
+    compared, and the manifest is updated to the new status if only the status changed.
+
+    Parameters
+    ----------
+    file : str
+        Path of the csv file
+    folder : str
+        Cache folder of the csv file
+    stat : os.stat_result
+        Status of the csv file
+
+    Returns
+    -------
+    A tuple (manifest, digest) with the manifest (or None if the cache does not match) and the hash of the file (or
+    None if it was not calculated)
+    """
+
+    manifest = read_manifest(folder)
+    digest = None
+    if manifest is not None and (manifest['mtime'] != stat.st_mtime_ns or manifest['size'] != stat.st_size):
+        digest = file_hash(file)
+        if manifest['sha256'] != digest:
+            return (None, digest)
+        # same contents, only the file status changed
+        try:
+            write_manifest(folder, manifest, stat, digest)
+        except OSError:
+            pass
+    return (manifest, digest)
+
+def to_frame(columns):
+    """
+    Creates a DataFrame of compact columns, text columns are converted to objects (with NaN for missing values) as
+    read by pandas
+
+    Parameters
+    ----------
+    columns : dict
+        Compact Numpy array of each column
+
+    Returns
+    -------
+    A Pandas DataFrame with the columns
+    """
+
+    return pd.DataFrame({name: text_column(np.ma.getdata(values), np.ma.getmaskarray(values)) if values.dtype.kind == 'U' else values for name, values in columns.items()})
+
+def read_csv(file, cache_dir=c.CSV_CACHE_DIR):
+    """
+    Reads a csv file through its columnar cache
+
+    The first read converts the file to typed columns, stored in the cache directory next to a manifest with the modification time, size and
+    hash of the file. Later reads memory map the columns if the file is unchanged. A file with a new modification time
+    or size is only parsed again if its hash changed as well. The columns always have the compact dtypes, also when
+    the file is parsed, s.t., the result does not depend on the state of the cache. If the csv file does not exist,
+    a table written in its place by write_table is read instead.
+
+    Parameters
+    ----------
+    file : str
+        Path of the csv file
+    cache_dir : str
+        Directory of the csv cache, None to always parse the csv file
+
+    Returns
+    -------
+    A Pandas DataFrame with the contents of the csv file
+    """
+
+    table = read_table(file)
+    if table is not None:
+        return table
+    if cache_dir is None:
+        df = pd.read_csv(file)
+        return to_frame({str(name): compact_column(df[name]) for name in df.columns})
+
+    folder = cache_path(file, cache_dir)
+    stat = os.stat(file)
+    (manifest, digest) = valid_manifest(file, folder, stat)
+    if manifest is not None:
+        try:
+            return load_cache(folder, manifest)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    df = pd.read_csv(file)
+    columns = {str(name): compact_column(df[name]) for name in df.columns}
+    try:
+        write_cache(file, folder, columns, stat, digest if digest is not None else file_hash(file))
+    except OSError as e:
+        print("Warning: could not write csv cache: ", e)
+    return to_frame(columns)
+
+def read_csv_chunks(file, chunk_rows, cache_dir=c.CSV_CACHE_DIR):
+    """
+    Reads a csv file through its columnar cache in chunks of rows
+
+    If the cache matches the file, the chunks are slices of the memory mapped columns. Otherwise the file is parsed
+    chunk by chunk and the columns are appended to the cache on the fly, s.t., the whole file is never in memory. A
+    column is widened (e.g., int32 to int64) as soon as a chunk does not fit, and the cache is only completed if all
+    chunks are read.
+
+    Parameters
+    ----------
+    file : str
+        Path of the csv file
+    chunk_rows : int
+        Number of rows per chunk
+    cache_dir : str
+        Directory of the csv cache, None to always parse the csv file
+
+    Returns
+    -------
+    A generator of Pandas DataFrames with the rows of each chunk
+    """
+
+    table = read_table(file)
+    if table is not None:
+        for start in range(0, len(table), chunk_rows):
+            yield table.iloc[start:start + chunk_rows]
+        return
+    if cache_dir is None:
+        for chunk in pd.read_csv(file, chunksize=chunk_rows):
+            frame = to_frame({str(name): compact_column(chunk[name]) for name in chunk.columns})
+            frame.index = chunk.index
+            yield frame
+        return
+
+    folder = cache_path(file, cache_dir)
+    stat = os.stat(file)
+    (manifest, digest) = valid_manifest(file, folder, stat)
+    if manifest is not None:
+        try:
+            df = load_cache(folder, manifest)
+        except (OSError, ValueError, KeyError):
+            df = None
+        if df is not None:
+            for start in range(0, len(df), chunk_rows):
+                yield df.iloc[start:start + chunk_rows]
+            return
+
+    temp = f"{folder}.{os.getpid()}.tmp"
+    dtypes = {}
+    writing = True
+    try:
+        shutil.rmtree(temp, ignore_errors=True)
+        os.makedirs(temp)
+    except OSError as e:
+        print("Warning: could not write csv cache: ", e)
+        writing = False
+    try:
+        for chunk in pd.read_csv(file, chunksize=chunk_rows):
+            columns = {str(name): compact_column(chunk[name]) for name in chunk.columns}
+            if writing:
+                try:
+                    append_columns(temp, columns, dtypes)
+                except (OSError, TypeError) as e:
+                    print("Warning: could not write csv cache: ", e)
+                    writing = False
+            frame = to_frame(columns)
+            frame.index = chunk.index
+            yield frame
+        if writing and dtypes:
+            finish_cache(file, folder, temp, dtypes, stat, digest if digest is not None else file_hash(file))
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
+
+def append_columns(temp, columns, dtypes):
+    """
+    Appends the compact columns of a chunk to the raw column files of a cache under construction
+
+    Parameters
+    ----------
+    temp : str
+        Temporary folder of the cache
+    columns : dict
+        Compact Numpy array of each column of the chunk
+    dtypes : dict
+        Dtype of each column written so far, updated in place
+
+    Returns
+    -------
+    None
+    """
+
+    for k, (name, values) in enumerate(columns.items()):
+        raw = os.path.join(temp, f"{k}.raw")
+        dtype = dtypes.get(name)
+        if dtype is None:
+            dtype = values.dtype
+        elif np.promote_types(dtype, values.dtype) != dtype:
+            # widen the values written so far
+            wide = np.promote_types(dtype, values.dtype)
+            np.fromfile(raw, dtype=dtype).astype(wide).tofile(raw)
+            dtype = wide
+        dtypes[name] = dtype
+        with open(raw, 'ab') as f:
+            np.ma.getdata(values).astype(dtype).tofile(f)
+        # the mask of missing values is kept for all columns, s.t., it covers all rows if a column turns into text
+        with open(os.path.join(temp, f"{k}.nulls.raw"), 'ab') as f:
+            np.ma.getmaskarray(values).tofile(f)
+
+def finish_cache(file, folder, temp, dtypes, stat, digest):
+    """
+    Converts the raw column files of a cache under construction to .npy files and swaps in the completed cache
+
+    Parameters
+    ----------
+    file : str
+        Path of the csv file
+    folder : str
+        Cache folder of the csv file
+    temp : str
+        Temporary folder of the cache
+    dtypes : dict
+        Dtype of each column
+    stat : os.stat_result
+        Status of the csv file when it was read
+    digest : str
+        Hash of the csv file
+
+    Returns
+    -------
+    None
+    """
+
+    try:
+        files = []
+        for k, (name, dtype) in enumerate(dtypes.items()):
+            raw = os.path.join(temp, f"{k}.raw")
+            size = os.path.getsize(raw) // dtype.itemsize
+            values = np.memmap(raw, dtype=dtype, mode='r') if size > 0 else np.empty(0, dtype=dtype)
+            np.save(os.path.join(temp, f"{k}.npy"), values)
+            del values
+            os.remove(raw)
+            column = {'name': name, 'file': f"{k}.npy", 'dtype': str(dtype)}
+            raw = os.path.join(temp, f"{k}.nulls.raw")
+            nulls = np.fromfile(raw, dtype=bool)
+            os.remove(raw)
+            if dtype.kind == 'U' and nulls.any():
+                np.save(os.path.join(temp, f"{k}.nulls.npy"), nulls)
+                column['nulls'] = f"{k}.nulls.npy"
+            files.append(column)
+        manifest = {'version': c.CSV_CACHE_VERSION, 'source': os.path.abspath(file), 'columns': files}
+        write_manifest(temp, manifest, stat, digest)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(temp, folder)
+    except OSError as e:
+        print("Warning: could not write csv cache: ", e)
@@ -14,13 +14,49 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with Coco. If not, see <http://www.gnu.org/licenses/>.
+import numpy as np
 import constant as c
 
 class FeatureMap:
 
-    def __init__(self, fid, pu, min_val, max_val, x, y, geotransform, projection, no_data):
+    def __init__(self, fid, cells, values, min_val, max_val, x, y, geotransform, projection, no_data):
+        """
+        Creates and initializes a new FeatureMap object
+
+        Only the cells of the raster with data are kept, as the flat (row major) index of each cell and its value. The
+        dense raster is rebuilt from these arrays when needed.
+
+        Parameters
+        ----------
+        fid : str
+            Id of the feature
+        cells : Numpy array
+            Flat index of each cell with data, in increasing order
+        values : Numpy array
+            Value of each cell with data
+        min_val : float
+            Minimum value of the raster band
+        max_val : float
+            Maximum value of the raster band
+        x : int
+            Number of columns of the raster
+        y : int
+            Number of rows of the raster
+        geotransform : tuple
+            GDAL geotransform of the raster
+        projection : str
+            GDAL projection of the raster
+        no_data : float
+            Value of cells without data
+
+        Returns
+        -------
+        None
+        """
+
         self.fid = fid
-        self.pu = pu
+        self.cells = cells
+        self.values = values
         self.min_val = min_val
         self.max_val = max_val
         self.x_length = x
@@ -28,3 +64,23 @@ class FeatureMap:
         self.geotransform = geotransform
         self.projection = projection
         self.no_data = no_data
+
+    @property
+    def pu(self):
+        """
+        Returns the dense, flattened raster with no_data in each cell without data
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        Numpy array with the value of each cell of the raster
+        """
+
+        if len(self.cells) == self.x_length * self.y_length:
+            return self.values.copy()
+        pu = np.full(self.x_length * self.y_length, self.no_data, dtype=self.values.dtype)
+        pu[self.cells] = self.values
+        return pu
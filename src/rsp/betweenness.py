@@ -0,0 +1,364 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import scipy.sparse as sp
+from contextlib import contextmanager
+from multiprocessing import Pool, shared_memory
+
+# memory (in bytes) for the dense node x source blocks of one batch of sources
+BATCH_MEMORY = 2**28
+MAX_BATCH = 256
+# number of sources of the first round of adaptive sampling
+INITIAL_SAMPLES = 64
+
+# adjacency matrix of the graph in a worker process and the shared memory blocks backing it
+_adjacency = None
+_shared = []
+
+def batch_size(n_nodes):
+    """
+    Returns the number of sources handled at once, s.t., the dense blocks of one batch fit in BATCH_MEMORY
+
+    Parameters
+    ----------
+    n_nodes : int
+        Number of nodes in the graph
+
+    Returns
+    -------
+    Number of sources per batch
+    """
+
+    # sigma, delta (float64) and dist (int32) for each node and source
+    return int(max(1, min(MAX_BATCH, BATCH_MEMORY // (20 * max(n_nodes, 1)))))
+
+def adjacency(indptr, indices, n_nodes):
+    """
+    Returns the unweighted adjacency matrix of a CSR graph
+
+    Parameters
+    ----------
+    indptr : Numpy array
+        CSR index pointer of the graph
+    indices : Numpy array
+        CSR column indices of the graph
+    n_nodes : int
+        Number of nodes in the graph
+
+    Returns
+    -------
+    scipy.sparse csr matrix with a 1 for each edge
+    """
+
+    return sp.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(n_nodes, n_nodes))
+
+def dependencies(a, sources):
+    """
+    Calculates the Brandes dependencies of a batch of sources on all nodes
+
+    All sources are handled at once: the breadth first search and the dependency accumulation are sparse matrix
+    products restricted to the nodes on the current level, with one column per source.
+
+    Parameters
+    ----------
+    a : scipy.sparse csr matrix
+        Unweighted adjacency matrix of the graph
+    sources : Numpy array
+        Node index of each source in the batch
+
+    Returns
+    -------
+    Numpy array (nodes x sources) with the dependency of each source on each node, 0 for the source itself
+    """
+
+    n = a.shape[0]
+    b = len(sources)
+    cols = np.arange(b)
+    sigma = np.zeros((n, b))
+    dist = np.full((n, b), -1, dtype=np.int32)
+    sigma[sources, cols] = 1
+    dist[sources, cols] = 0
+
+    # nodes on each level of the search of any source in the batch
+    levels = [np.unique(sources)]
+    while True:
+        rows = levels[-1]
+        out = a[rows]
+        nxt = np.unique(out.indices)
+        if len(nxt) == 0:
+            break
+        # shortest paths to the unvisited nodes on the next level
+        paths = out[:, nxt].T @ np.where(dist[rows] == len(levels) - 1, sigma[rows], 0)
+        paths[dist[nxt] >= 0] = 0
+        reached = paths.any(axis=1)
+        if not reached.any():
+            break
+        nxt = nxt[reached]
+        paths = paths[reached]
+        dist[nxt] = np.where(paths > 0, len(levels), dist[nxt])
+        sigma[nxt] += paths
+        levels.append(nxt)
+
+    delta = np.zeros((n, b))
+    for d in range(len(levels) - 1, 0, -1):
+        w = levels[d]
+        v = levels[d - 1]
+        on_w = dist[w] == d
+        t = np.where(on_w, (1 + delta[w]) / np.where(on_w, sigma[w], 1), 0)
+        contrib = a[v][:, w] @ t
+        delta[v] += np.where(dist[v] == d - 1, sigma[v] * contrib, 0)
+
+    delta[sources, cols] = 0
+    return delta
+
+def partial_moments(a, sources):
+    """
+    Calculates the sum and the sum of squares of the dependencies of the sources on each node
+
+    Parameters
+    ----------
+    a : scipy.sparse csr matrix
+        Unweighted adjacency matrix of the graph
+    sources : Numpy array
+        Node index of each source
+
+    Returns
+    -------
+    Numpy array (2 x nodes) with the sum and the sum of squares of the dependencies on each node
+    """
+
+    moments = np.zeros((2, a.shape[0]))
+    size = batch_size(a.shape[0])
+    for start in range(0, len(sources), size):
+        delta = dependencies(a, sources[start:start + size])
+        moments[0] += delta.sum(axis=1)
+        moments[1] += (delta * delta).sum(axis=1)
+    return moments
+
+def init_worker(indptr_name, indptr_shape, indices_name, indices_shape, n_nodes):
+    """
+    Attaches a worker process to the CSR arrays of the graph in shared memory
+
+    Parameters
+    ----------
+    indptr_name : str
+        Name of the shared memory block of the CSR index pointer
+    indptr_shape : tuple
+        Shape of the CSR index pointer
+    indices_name : str
+        Name of the shared memory block of the CSR column indices
+    indices_shape : tuple
+        Shape of the CSR column indices
+    n_nodes : int
+        Number of nodes in the graph
+
+    Returns
+    -------
+    None
+    """
+
+    global _adjacency, _shared
+    indptr_shm = shared_memory.SharedMemory(name=indptr_name)
+    indices_shm = shared_memory.SharedMemory(name=indices_name)
+    _shared = [indptr_shm, indices_shm]
+    indptr = np.ndarray(indptr_shape, dtype=np.int64, buffer=indptr_shm.buf)
+    indices = np.ndarray(indices_shape, dtype=np.int32, buffer=indices_shm.buf)
+    _adjacency = adjacency(indptr, indices, n_nodes)
+
+def worker_moments(sources):
+    """
+    Calculates the partial dependency moments of sources in a worker process
+
+    Parameters
+    ----------
+    sources : Numpy array
+        Node index of each source
+
+    Returns
+    -------
+    Numpy array (2 x nodes) with the sum and the sum of squares of the dependencies on each node
+    """
+
+    return partial_moments(_adjacency, sources)
+
+def to_shared(array):
+    """
+    Copies an array to a new shared memory block
+
+    Parameters
+    ----------
+    array : Numpy array
+        Array to share
+
+    Returns
+    -------
+    The SharedMemory block containing a copy of array
+    """
+
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm
+
+@contextmanager
+def moments_calculator(g, workers=1):
+    """
+    Provides a function that calculates the summed dependency moments of a set of sources
+
+    With more than one worker, the sources are split over a process pool sharing the read-only CSR arrays of the
+    graph. The pool is kept alive as long as the context is open, s.t., it can be reused for several sets of sources.
+
+    Parameters
+    ----------
+    g : ConnectivityGraph
+        Graph to calculate the dependencies on
+    workers : int
+        Number of worker processes
+
+    Returns
+    -------
+    A function mapping a Numpy array of sources to a Numpy array (2 x nodes) with the sum and the sum of squares
+    of their dependencies on each node
+    """
+
+    if workers is None or workers <= 1 or g.n_nodes < 2:
+        a = adjacency(g.indptr, g.indices, g.n_nodes)
+        yield lambda sources: partial_moments(a, sources)
+        return
+
+    indptr = g.indptr.astype(np.int64)
+    indices = g.indices.astype(np.int32)
+    indptr_shm = to_shared(indptr)
+    indices_shm = to_shared(indices)
+    try:
+        initargs = (indptr_shm.name, indptr.shape, indices_shm.name, indices.shape, g.n_nodes)
+        with Pool(workers, initializer=init_worker, initargs=initargs) as pool:
+            def calculate(sources):
+                # several chunks per worker to balance the load
+                chunks = [chunk for chunk in np.array_split(sources, workers * 4) if len(chunk) > 0]
+                return np.sum(pool.map(worker_moments, chunks), axis=0)
+            yield calculate
+    finally:
+        indptr_shm.close()
+        indptr_shm.unlink()
+        indices_shm.close()
+        indices_shm.unlink()
+
+def betweenness_centrality(g, workers=1):
+    """
+    Calculates the unnormalized, unweighted betweenness centrality of each node in a directed graph
+
+    Gives the same values as networkx.betweenness_centrality(g, normalized=False, weight=None). With more than one
+    worker, the sources are split over a process pool sharing the read-only CSR arrays of the graph and the partial
+    dependency vectors are summed.
+
+    Parameters
+    ----------
+    g : ConnectivityGraph
+        Graph to calculate the betweenness centrality on
+    workers : int
+        Number of worker processes
+
+    Returns
+    -------
+    Numpy array with the betweenness centrality of each node
+    """
+
+    with moments_calculator(g, workers) as calculate:
+        return calculate(np.arange(g.n_nodes))[0]
+
+def relative_error(moments, k, n):
+    """
+    Estimates the relative standard error of the sampled betweenness centrality
+
+    The standard error of each node follows from the sample variance of its dependencies, with a finite population
+    correction for sampling without replacement. The relative error is the L2 norm of the standard errors divided by
+    the L2 norm of the estimated values.
+
+    Parameters
+    ----------
+    moments : Numpy array
+        Sum and sum of squares of the dependencies of the sampled sources on each node
+    k : int
+        Number of sampled sources
+    n : int
+        Number of nodes in the graph
+
+    Returns
+    -------
+    The estimated relative error, infinite if it can not be estimated from a single sample
+    """
+
+    if k >= n:
+        return 0.0
+    if k < 2:
+        return np.inf
+    mean = moments[0] / k
+    var = np.maximum(moments[1] - k * mean * mean, 0) / (k - 1)
+    std_error = n * np.sqrt(var / k * (1 - k / n))
+    norm = np.linalg.norm(n * mean)
+    if norm == 0:
+        return 0.0 if not std_error.any() else np.inf
+    return float(np.linalg.norm(std_error) / norm)
+
+def approximate_betweenness_centrality(g, samples=None, error=None, seed=0, workers=1):
+    """
+    Estimates the unnormalized, unweighted betweenness centrality of each node by sampling source nodes
+
+    The sources are drawn uniformly without replacement in a fixed order given by the seed, and the summed
+    dependencies are scaled by n / k. With a sample count, exactly that many sources are used. With a target
+    relative error, the sample is doubled until the estimated relative error is at most the target (or all
+    nodes are sources, which gives the exact values).
+
+    Parameters
+    ----------
+    g : ConnectivityGraph
+        Graph to calculate the betweenness centrality on
+    samples : int
+        Number of source nodes to sample
+    error : float
+        Target relative error of the estimate, used if samples is not set
+    seed : int
+        Seed of the random source order
+    workers : int
+        Number of worker processes
+
+    Returns
+    -------
+    A tuple (values, k, error) with a Numpy array of the estimated betweenness centrality of each node, the number
+    of sampled sources and the estimated relative error
+    """
+
+    n = g.n_nodes
+    order = np.random.default_rng(seed).permutation(n)
+    moments = np.zeros((2, n))
+    k = 0
+    with moments_calculator(g, workers) as calculate:
+        if samples is not None:
+            k = min(max(int(samples), 1), n)
+            moments = calculate(order[:k])
+        else:
+            step = min(n, INITIAL_SAMPLES)
+            while k < n:
+                moments += calculate(order[k:k + step])
+                k += step
+                if relative_error(moments, k, n) <= error:
+                    break
+                step = min(n - k, k)
+
+    values = moments[0] * n / k if k > 0 else moments[0]
+    return (values, k, relative_error(moments, k, n))
@@ -16,7 +16,6 @@
 # along with Coco. If not, see <http://www.gnu.org/licenses/>.
 
 import pandas as pd
-import networkx as nx
 import constant as c
 import rsp.connectivitymetric as metric
 import rsp.connectivitydata as cdata
@@ -50,6 +49,30 @@ class Connectivity:
         self.connectivity_data = []
         self.metrics = []
         self.complete_graph = complete_graph
+        self.pu_index = None
+        self.pair_formulation = c.PAIR_AND
+        self.workers = 1
+        self.bc_samples = None
+        self.bc_error = None
+        self.bc_seed = 0
+        self.cache = None
+        self.sparsify = None
+
+    def set_pu_index(self, pu_index):
+        """
+        Sets the dense planning unit index used to add pu positions to the metric values of all datasets
+
+        Parameters
+        ----------
+        pu_index : Pandas Index
+            Dense planning unit index of the Conservation object
+
+        Returns
+        -------
+        None
+        """
+
+        self.pu_index = pu_index
 
     def get_connectivity_data(self):
         """
@@ -84,14 +107,30 @@ class Connectivity:
     #        for data in self.connectivity_data:
     #            data.set_connectivity_metrics(metric)
 
+    def new_data(self, name):
+        """
+        Creates a new ConnectivityData object with the metric settings of this Connectivity object
+
+        Parameters
+        ----------
+        name : str
+            Name of the dataset
+
+        Returns
+        -------
+        A new ConnectivityData object
+        """
+
+        return cdata.ConnectivityData(name, self.pu_index, self.workers, self.bc_samples, self.bc_error, self.bc_seed, self.cache, self.sparsify)
+
     def set_connectivity_matrix(self, matrix, name, metrics, pu_data):
         """
         Initializes a new ConnectivityData object with the values of matrix
 
         Parameters
         ----------
-        matrix : Pandas DataFrame
-            DataFrame containing the connectivity information
+        matrix : tuple
+            Tuple (nodes, matrix) with the planning unit ids and the sparse connectivity matrix
         name : str
             Name of the dataset
         metrics : list
@@ -103,11 +142,65 @@ class Connectivity:
         None
         """
 
-        temp_data = cdata.ConnectivityData(name)
+        temp_data = self.new_data(name)
         temp_data.set_connectivity_matrix(matrix, metrics, pu_data)
         self.connectivity_data.append(temp_data)
         self.metrics = metrics
 
+    def set_connectivity_grid(self, grid, name, neighbours, weight, metrics, pu_data):
+        """
+        Initializes a new ConnectivityData object with the grid adjacency of the cells of a raster
+
+        Parameters
+        ----------
+        grid : tuple
+            Tuple (fmap, resistance) with the FeatureMap of the raster and the FeatureMap of the resistance (or None)
+        name : str
+            Name of the dataset
+        neighbours : int
+            4 or 8 neighbour adjacency
+        weight : float
+            Weight of each edge without resistance
+        metrics : list
+            List of strings containing all metrics to be set on the data
+        pu_data : Pandas DataFrame
+            DataFrame containing the planning unit attribute data (or None if not needed)
+        Returns
+        -------
+        None
+        """
+
+        temp_data = self.new_data(name)
+        temp_data.set_connectivity_grid(grid, neighbours, weight, metrics, pu_data)
+        self.connectivity_data.append(temp_data)
+        self.metrics = metrics
+
+    def set_connectivity_decay(self, pu, decay, name, metrics, pu_data):
+        """
+        Initializes a new ConnectivityData object with distance decay edges between the planning units
+
+        Parameters
+        ----------
+        pu : Pandas DataFrame
+            Planning units with their coordinates (xloc, yloc)
+        decay : dict
+            Settings of the distance decay: alpha, kernel, cutoff and neighbours
+        name : str
+            Name of the dataset
+        metrics : list
+            List of strings containing all metrics to be set on the data
+        pu_data : Pandas DataFrame
+            DataFrame containing the planning unit attribute data (or None if not needed)
+        Returns
+        -------
+        None
+        """
+
+        temp_data = self.new_data(name)
+        temp_data.set_connectivity_decay(pu, decay, metrics, pu_data)
+        self.connectivity_data.append(temp_data)
+        self.metrics = metrics
+
     #TODO check if this works
     def set_connectivity_edgelist(self, edgelist, name, metrics, pu_data):
         """
@@ -128,7 +221,7 @@ class Connectivity:
         None
         """
 
-        temp_data = cdata.ConnectivityData(name)
+        temp_data = self.new_data(name)
         temp_data.set_connectivity_edgelist(edgelist, metrics, pu_data)
         self.connectivity_data.append(temp_data)
         self.metrics = metrics
@@ -140,8 +233,8 @@ class Connectivity:
 
         Parameters
         ----------
-        edgelist : Pandas DataFrame
-            DataFrame containing the connectivity information
+        edgelist : tuple
+            Tuple (edgelists, thresholds) with the edges of each feature and their complete graph threshold, as read by read_feature_edgelist
         metrics : list
             List of strings containing all metrics to be set on the data
         pu_data : Pandas DataFrame
@@ -151,16 +244,13 @@ class Connectivity:
         None
         """
 
-        feature = [y for x, y in edgelist.groupby(c.HEL_FID)]
-        for h in feature:
-            if (conservation.has_target(h[c.PVF_FID].iloc[-1])):
-                #target = conservation.get_target(feature[c.PVF_FID].iloc[-1])
-                #if conservation.has_target(h.iloc[feature][-1])
-                nh = pd.DataFrame(h).reset_index(drop=True)
-                name = nh[c.HEL_FID][0]
-                temp_data = cdata.ConnectivityData(name)
+        (edgelists, thresholds) = edgelist
+        for name, h in edgelists.items():
+            if (conservation.has_target(name)):
+                temp_data = self.new_data(name)
                 node_data = None if pu_data is None else self.find_pu_data(pu_data, name)
-                temp_data.set_connectivity_feature_edgelist(h, metrics, self.complete_graph, node_data)
+                threshold = None if thresholds is None else thresholds[name]
+                temp_data.set_connectivity_feature_edgelist(h, metrics, self.complete_graph, node_data, threshold)
                 self.connectivity_data.append(temp_data)
         self.metrics = metrics
 
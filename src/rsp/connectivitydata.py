@@ -15,15 +15,14 @@
 # You should have received a copy of the GNU General Public License
 # along with Coco.  If not, see <http://www.gnu.org/licenses/>.
 
-import pandas as pd
-import networkx as nx
 import rsp.connectivitymetric as metric
+import rsp.connectivitygraph as cgraph
 import constant as c
 import numpy as np
 
 class ConnectivityData:
 
-    def __init__(self, name=None):
+    def __init__(self, name=None, pu_index=None, workers=1, bc_samples=None, bc_error=None, bc_seed=0, cache=None, sparsify=None):
         """
         Creates and initializes a new ConnectivityData object with name name if provided
 
@@ -31,6 +30,20 @@ class ConnectivityData:
         ----------
         name : str
             Name of the new ConnectivityData object
+        pu_index : Pandas Index
+            Dense planning unit index of the Conservation object
+        workers : int
+            Number of worker processes used to calculate the metrics
+        bc_samples : int
+            Number of sampled source nodes to approximate BC, None for exact values
+        bc_error : float
+            Target relative error to approximate BC by adaptive sampling, None for exact values
+        bc_seed : int
+            Seed of the sampled source nodes
+        cache : MetricCache
+            Cache of metric values (or None to always calculate the metrics)
+        sparsify : dict
+            Settings of the sparsification of the graphs: method, k and quantile (or None to keep all edges)
 
         Returns
         ----------
@@ -38,9 +51,20 @@ class ConnectivityData:
         """
 
         self.name = name
+        self.pu_index = pu_index
+        self.workers = workers
+        self.bc_samples = bc_samples
+        self.bc_error = bc_error
+        self.bc_seed = bc_seed
+        self.cache = cache
+        self.sparsify = sparsify
+        # last sparsified graph: (graph, sparse graph, kept edges, weight share)
+        self.sparse = None
         self.matrix = None
         self.edgelist = None
         self.feature_edgelist = None
+        self.grid = None
+        self.decay = None
         self.metrics = {}
 
     def set_connectivity_matrix(self, con_matrix, metrics, node_values):
@@ -49,8 +73,8 @@ class ConnectivityData:
 
         Parameters
         ----------
-        con_matrix : Pandas DataFrame
-            Pandas DataFrame containing the connectivity matrix
+        con_matrix : tuple
+            Tuple (nodes, matrix) with the planning unit id of each row and column and the sparse connectivity matrix
         metrics : list
             List of strings with the names of the metrics
         node_values : Pandas DataFrame
@@ -61,8 +85,8 @@ class ConnectivityData:
         """
 
         self.matrix = con_matrix
+        g = cgraph.ConnectivityGraph.from_matrix(*self.matrix)
         for metric_type in metrics:
-            g = nx.from_pandas_adjacency(self.matrix, create_using=nx.DiGraph())
             self.set_connectivity_metrics(metric_type, g, node_values)
 
     def set_connectivity_edgelist(self, con_edgelist, metrics, node_values):
@@ -83,32 +107,91 @@ class ConnectivityData:
         """
 
         self.edgelist = con_edgelist
+        g = cgraph.ConnectivityGraph.from_edgelist(con_edgelist[c.HEL_PID1], con_edgelist[c.HEL_PID2], con_edgelist[c.HEL_VAL])
         for metric_type in metrics:
             #TODO add betcent complete graph drop
-            g = nx.from_pandas_edgelist(con_edgelist, c.HEL_PID1, c.HEL_PID2, c.HEL_VAL, create_using=nx.DiGraph())
             self.set_connectivity_metrics(metric_type, g, node_values)
 
-    def set_connectivity_feature_edgelist(self, con_feature_edgelist, metrics, complete_graph, node_values):
+    def set_connectivity_grid(self, grid, neighbours, weight, metrics, node_values):
+        """
+        Sets the grid adjacency of the cells of a raster as the connectivity graph of the dataset and calculates the metrics on it
+
+        Parameters
+        ----------
+        grid : tuple
+            Tuple (fmap, resistance) with the FeatureMap of the raster and the FeatureMap of the resistance (or None)
+        neighbours : int
+            4 or 8 neighbour adjacency
+        weight : float
+            Weight of each edge without resistance
+        metrics : list
+            List of strings with the names of the metrics
+        node_values : Pandas DataFrame
+            Pandas DataFrame containing the planning unit attribute values
+        Returns
+        -------
+        None
+        """
+
+        self.grid = grid
+        (fmap, resistance) = grid
+        cells = fmap.cells
+        values = None
+        if resistance is not None:
+            # only cells with data in both rasters
+            cells = np.intersect1d(fmap.cells, resistance.cells, assume_unique=True)
+            values = resistance.values[np.searchsorted(resistance.cells, cells)]
+        g = cgraph.ConnectivityGraph.from_grid(cells, fmap.x_length, neighbours, values, weight)
+        for metric_type in metrics:
+            self.set_connectivity_metrics(metric_type, g, node_values)
+
+    def set_connectivity_decay(self, pu, decay, metrics, node_values):
+        """
+        Connects the planning units within a cutoff distance of each other, weighted by a distance decay kernel, and calculates the metrics on it
+
+        Parameters
+        ----------
+        pu : Pandas DataFrame
+            Planning units with their coordinates (xloc, yloc)
+        decay : dict
+            Settings of the distance decay: alpha, kernel, cutoff and neighbours
+        metrics : list
+            List of strings with the names of the metrics
+        node_values : Pandas DataFrame
+            Pandas DataFrame containing the planning unit attribute values
+        Returns
+        -------
+        None
+        """
+
+        self.decay = decay
+        g = cgraph.ConnectivityGraph.from_points(pu[c.PU_ID].to_numpy(), pu[c.PU_XLOC], pu[c.PU_YLOC], **decay)
+        for metric_type in metrics:
+            self.set_connectivity_metrics(metric_type, g, node_values)
+
+    def set_connectivity_feature_edgelist(self, con_feature_edgelist, metrics, complete_graph, node_values, threshold=None):
         """
         Sets the (feature) edgelist of the dataset and calculates the metrics on it
 
         Parameters
         ----------
         con_feature_edgelist : Pandas DataFrame
-            Pandas DataFrame containing the connectivity data
+            Pandas DataFrame containing the non-zero edges of the feature
         metrics : list
             List of strings with the names of the metrics
         complete_graph : str
             A string containing the type of values to be dropped in case of a complete graph
         node_values : Pandas DataFrame
             Pandas DataFrame containing the planning unit attribute values
+        threshold : float
+            The complete graph threshold (mean or median of the edge values) of the feature
         Returns
         -------
         None
         """
 
-        self.feature_edgelist = con_feature_edgelist.drop(labels=c.HEL_FID, axis=1)
-        self.feature_edgelist = self.feature_edgelist.loc[self.feature_edgelist[c.HEL_VAL] != 0].reset_index(drop=True)
+        self.feature_edgelist = con_feature_edgelist
+        g = None
         for metric_type in metrics:
             # drop values under mean value for BC iff complete graph
     # Now: we drop LOW values (aka not the resistance values). This is implemented to use the same
@@ -118,17 +201,15 @@ class ConnectivityData:
     # SO: if you run with complete graph BC, run probability map. If you run with a none complete graph, it doesn't matter because we don't use the edge-weighted version
     # todo: implement edge weighted version for the BC optionally
             if metric_type == c.BC and complete_graph:
-                bet_list = self.feature_edgelist.copy()
-                if complete_graph == c.MEAN:
-                    bet_list[c.HEL_VAL] = bet_list[c.HEL_VAL].where(bet_list[c.HEL_VAL] >= bet_list[c.HEL_VAL].mean(), other=0)
-                elif complete_graph == c.MEDIAN:
-                    bet_list[c.HEL_VAL] = bet_list[c.HEL_VAL].where(bet_list[c.HEL_VAL] >= bet_list[c.HEL_VAL].median(), other=0)
-                # dropping 0 values
-                bet_list = bet_list.loc[(bet_list[c.HEL_VAL] > 0)]
-                g = nx.from_pandas_edgelist(bet_list, c.HEL_PID1, c.HEL_PID2, c.HEL_VAL, create_using=nx.DiGraph())
+                values = self.feature_edgelist[c.HEL_VAL]
+                # dropping values below the threshold and 0 values
+                bet_list = self.feature_edgelist.loc[(values >= threshold) & (values > 0)]
+                bet_g = cgraph.ConnectivityGraph.from_edgelist(bet_list[c.HEL_PID1], bet_list[c.HEL_PID2], bet_list[c.HEL_VAL])
+                self.set_connectivity_metrics(metric_type, bet_g, node_values, complete_graph)
             else:
-                g = nx.from_pandas_edgelist(self.feature_edgelist, c.HEL_PID1, c.HEL_PID2, c.HEL_VAL, create_using=nx.DiGraph())
-            self.set_connectivity_metrics(metric_type, g, node_values)
+                if g is None:
+                    g = cgraph.ConnectivityGraph.from_edgelist(self.feature_edgelist[c.HEL_PID1], self.feature_edgelist[c.HEL_PID2], self.feature_edgelist[c.HEL_VAL])
+                self.set_connectivity_metrics(metric_type, g, node_values)
 
     def set_node_values(self, node_values):
         """
@@ -136,19 +217,40 @@ class ConnectivityData:
 
         Parameters
         ----------
-        args : Argparse namespace
-            Contains all passed arguments.
+        node_values : Pandas DataFrame
+            Pandas DataFrame containing the planning unit attribute values
 
         Returns
         -------
-        Pandas DataFrame containting all the arguments and corresponding values
+        None
         """
-        ''' Set the node values for metrics that need it given in the planning unit attribute file '''
-        node_values.drop(c.ATTR_FID, inplace=True, axis=1)
-        node_attr = node_values.set_index(c.ATTR_PID).to_dict()[c.ATTR_VAL]
-        nx.set_node_attributes(self.metrics[c.EC].g, node_attr, c.NODE_VAL)
 
-    def set_connectivity_metrics(self, metric_type, g, node_values):
+        self.metrics[c.EC].g.set_node_values(node_values[c.ATTR_PID], node_values[c.ATTR_VAL])
+
+    def sparse_graph(self, g):
+        """
+        Returns the sparsified graph g, sparsified only once for all metrics calculated on g
+
+        Parameters
+        ----------
+        g : ConnectivityGraph
+            Graph of the dataset
+
+        Returns
+        -------
+        A tuple (g, kept_edges, weight_share) with the sparse graph, the number of kept edges and the share of the total
+        edge weight they retain, or g itself and None if the graphs are not sparsified
+        """
+
+        if self.sparsify is None:
+            return (g, None, None)
+        if self.sparse is None or self.sparse[0] is not g:
+            self.sparse = (g, *g.sparsify(**self.sparsify))
+            (_, _, kept_edges, weight_share) = self.sparse
+            print("sparsified graph: kept ", kept_edges, " of ", g.n_edges, " edges, retaining ", weight_share, " of the total weight")
+        return self.sparse[1:]
+
+    def set_connectivity_metrics(self, metric_type, g, node_values, complete_graph=None):
         """
         Initializes a new ConnectivityMetric object for the metric and calculates its values on graph g
 
@@ -156,19 +258,24 @@ class ConnectivityData:
         ----------
         metric_type : str
             Name of the metric
-        g : Networkx Graph
+        g : ConnectivityGraph
             Graph the metric should be calculated on
         node_values : Pandas DataFrame
             DataFrame containing the planning unit attribute values (if needed)
+        complete_graph : str
+            The type of values dropped from g in case of a complete graph (or None)
         Returns
         -------
         None
         """
 
-        self.metrics[metric_type] = metric.ConnectivityMetric(metric_type, g)
+        (g, kept_edges, weight_share) = self.sparse_graph(g)
+        self.metrics[metric_type] = metric.ConnectivityMetric(metric_type, g, self.pu_index, self.workers, self.bc_samples, self.bc_error, self.bc_seed)
+        self.metrics[metric_type].kept_edges = kept_edges
+        self.metrics[metric_type].weight_share = weight_share
         if metric_type == c.EC and node_values is not None:
             self.set_node_values(node_values)
-        self.metrics[metric_type].set_connectivity_metrics()
+        self.metrics[metric_type].set_connectivity_metrics(self.cache, complete_graph)
 
     #def set_connectivity_metrics(self, metric_type):
     #    print("set metric type: ", metric_type)
@@ -215,6 +322,35 @@ class ConnectivityData:
             error = "Metric unknown for normalization"
             sys.exit(error)
 
+    def get_compact_metric_values(self, name, normalized=False):
+        """
+        Returns the (normalized) values of metric name without the entries that do not contribute to the model
+
+        Drops all entries with value 0, e.g., values dropped by a threshold or the smallest value after min-max normalization,
+        and all self-loops (pu1 == pu2) of edge weighted metrics. The number of removed entries is stored in the metric.
+
+        Parameters
+        ----------
+        name : str
+            Name of the metric to get the values of
+        normalized : boolean
+            Return the normalized values if True, the (thresholded) metric values otherwise
+
+        Returns
+        -------
+        Pandas DataFrame containing the remaining values of the metric
+        """
+
+        metric_values = self.get_normalized_metric_values(name) if normalized else self.get_metric_values(name)
+        zero = (metric_values[c.MET_VAL] == 0).to_numpy()
+        if c.MET_PID1 in metric_values.columns:
+            loop = (metric_values[c.MET_PID1] == metric_values[c.MET_PID2]).to_numpy()
+        else:
+            loop = np.zeros(len(metric_values.index), dtype=bool)
+
+        self.metrics[name].set_removed(np.count_nonzero(zero & ~loop), np.count_nonzero(loop))
+        return metric_values[~(zero | loop)]
+
     def normalize_node_weights(self, metric_values):
         """
         Calculates and returns the normalized values of the Pandas Series of node metric name
@@ -229,22 +365,18 @@ class ConnectivityData:
         Pandas DataFrame containing all normalized values of the node metric per planning unit
         """
 
+        norm_values = metric_values.copy()
         if metric_values[c.MET_VAL].min() != metric_values[c.MET_VAL].max():
-            norm_data = (metric_values[c.MET_VAL] - metric_values[c.MET_VAL].min())/(metric_values[c.MET_VAL].max() - metric_values[c.MET_VAL].min())
-            return pd.DataFrame(list(zip(metric_values[c.MET_PID], norm_data)), columns = [c.MET_PID, c.MET_VAL])
+            norm_values[c.MET_VAL] = (metric_values[c.MET_VAL] - metric_values[c.MET_VAL].min())/(metric_values[c.MET_VAL].max() - metric_values[c.MET_VAL].min())
         else:
             # TODO: all values are the same, assume they are normalized (otherwise div by 0 error)
             if metric_values[c.MET_VAL].min() > 0:
                 print("Warning: no normalization needed, node min is equal to max, all values set to 1")
-                vals = np.ones(len(metric_values.index))
+                norm_values[c.MET_VAL] = np.ones(len(metric_values.index))
             else:
                 print("Warning: no normalization needed, all values are 0")
-                vals = np.zeros(len(metric_values.index))
-#df.loc[df['First Season'] > 1990, 'First Season'] = 1
-            #metric_values.loc[metric_values[c.MET_VAL] > 0, c.MET_VAL] = 1
-
-            return pd.DataFrame(list(zip(metric_values[c.MET_PID], vals )), columns = [c.MET_PID, c.MET_VAL])
-            #return metric_values
+                norm_values[c.MET_VAL] = np.zeros(len(metric_values.index))
+        return norm_values
 
     def normalize_edge_weights(self, metric_values):
         """
@@ -260,21 +392,17 @@ class ConnectivityData:
         Pandas DataFrame containing all normalized values of the edge metric per planning unit pair
         """
 
+        norm_values = metric_values.copy()
         if metric_values[c.MET_VAL].min() != metric_values[c.MET_VAL].max():
-            norm_data = (metric_values[c.MET_VAL] - metric_values[c.MET_VAL].min())/(metric_values[c.MET_VAL].max() - metric_values[c.MET_VAL].min())
-            return pd.DataFrame(list(zip(metric_values[c.MET_PID1], metric_values[c.MET_PID2], norm_data)), columns = [c.MET_PID1,  c.MET_PID2, c.MET_VAL])
+            norm_values[c.MET_VAL] = (metric_values[c.MET_VAL] - metric_values[c.MET_VAL].min())/(metric_values[c.MET_VAL].max() - metric_values[c.MET_VAL].min())
         else:
             # TODO: all values are the same, assume they are normalized (otherwise div by 0 error)
             print("Warning: no normalization needed, edge min is equal to max")
             if metric_values[c.MET_VAL].min() > 0:
-                vals = np.ones(len(metric_values.index))
+                norm_values[c.MET_VAL] = np.ones(len(metric_values.index))
             else:
-                vals = np.zeros(len(metric_values.index))
-#df.loc[df['First Season'] > 1990, 'First Season'] = 1
-            #metric_values.loc[metric_values[c.MET_VAL] > 0, c.MET_VAL] = 1
-
-            return pd.DataFrame(list(zip(metric_values[c.MET_PID], vals )), columns = [c.MET_PID, c.MET_VAL])
-            #return metrics_values
+                norm_values[c.MET_VAL] = np.zeros(len(metric_values.index))
+        return norm_values
 
     def get_metric(self, name):
         """
@@ -0,0 +1,526 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import constant as c
+
+def decay(distance, alpha, kernel=c.DECAY_EXP):
+    """
+    Returns the weight of edges of a distance decay kernel
+
+    Parameters
+    ----------
+    distance : Numpy array
+        Length of each edge
+    alpha : float
+        Distance scale of the kernel
+    kernel : str
+        exp(-d / alpha) for the exponential kernel, exp(-(d / alpha)^2 / 2) for the gaussian kernel
+
+    Returns
+    -------
+    Numpy array with the weight of each edge
+    """
+
+    if kernel == c.DECAY_GAUSSIAN:
+        return np.exp(-0.5 * (distance / alpha) ** 2)
+    return np.exp(-distance / alpha)
+
+class ConnectivityGraph:
+
+    def __init__(self, nodes, src, dst, weights):
+        """
+        Creates and initializes a new directed ConnectivityGraph stored as a compact CSR adjacency
+
+        A repeated edge (i, j) keeps its last weight, as in a Networkx DiGraph.
+
+        Parameters
+        ----------
+        nodes : Numpy array
+            Planning unit id of each node, the position in this array is the node index
+        src : Numpy array
+            Node index of the source of each edge
+        dst : Numpy array
+            Node index of the destination of each edge
+        weights : Numpy array
+            Weight of each edge
+
+        Returns
+        -------
+        None
+        """
+
+        self.nodes = np.asarray(nodes)
+        self.n_nodes = len(self.nodes)
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        weights = np.asarray(weights)
+
+        # sort edges on (src, dst), keep the last occurrence of repeated edges
+        key = src * self.n_nodes + dst
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        last = np.append(key[1:] != key[:-1], True) if len(key) > 0 else np.empty(0, dtype=bool)
+        order = order[last]
+
+        self.indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src[order], minlength=self.n_nodes), out=self.indptr[1:])
+        self.indices = dst[order].astype(np.int32)
+        self.weights = weights[order].astype(np.float32)
+        self.n_edges = len(self.indices)
+
+        # attribute value of each node, NaN if not set
+        self.node_values = np.full(self.n_nodes, np.nan)
+
+    @classmethod
+    def from_edgelist(cls, pu1, pu2, values):
+        """
+        Creates a new ConnectivityGraph from an edgelist
+
+        The nodes are all planning units in the edgelist in order of first appearance.
+
+        Parameters
+        ----------
+        pu1 : Pandas Series
+            Planning unit id of the source of each edge
+        pu2 : Pandas Series
+            Planning unit id of the destination of each edge
+        values : Pandas Series
+            Weight of each edge
+
+        Returns
+        -------
+        A new ConnectivityGraph
+        """
+
+        pu1 = np.asarray(pu1)
+        pu2 = np.asarray(pu2)
+        nodes = pd.unique(np.column_stack((pu1, pu2)).ravel())
+        node_index = pd.Index(nodes)
+        return cls(nodes, node_index.get_indexer(pu1), node_index.get_indexer(pu2), np.asarray(values))
+
+    @classmethod
+    def from_matrix(cls, nodes, matrix):
+        """
+        Creates a new ConnectivityGraph from a sparse adjacency matrix, with an edge for each non-zero cell
+
+        Parameters
+        ----------
+        nodes : Numpy array
+            Planning unit id of each row and column of the matrix
+        matrix : scipy.sparse matrix
+            Square matrix with the value of the edge from the planning unit of row i to the planning unit of column j
+
+        Returns
+        -------
+        A new ConnectivityGraph
+        """
+
+        matrix = sp.coo_matrix(matrix)
+        nonzero = matrix.data != 0
+        return cls(nodes, matrix.row[nonzero], matrix.col[nonzero], matrix.data[nonzero])
+
+    @classmethod
+    def from_csr(cls, nodes, indptr, indices, weights):
+        """
+        Creates a new ConnectivityGraph directly from CSR arrays without repeated edges
+
+        Parameters
+        ----------
+        nodes : Numpy array
+            Planning unit id of each node, the position in this array is the node index
+        indptr : Numpy array
+            CSR index pointer, the edges of node i are at positions indptr[i] to indptr[i + 1]
+        indices : Numpy array
+            Node index of the destination of each edge, sorted per source
+        weights : Numpy array
+            Weight of each edge
+
+        Returns
+        -------
+        A new ConnectivityGraph
+        """
+
+        g = cls.__new__(cls)
+        g.nodes = np.asarray(nodes)
+        g.n_nodes = len(g.nodes)
+        g.indptr = np.asarray(indptr, dtype=np.int64)
+        g.indices = np.asarray(indices, dtype=np.int32)
+        g.weights = np.asarray(weights, dtype=np.float32)
+        g.n_edges = len(g.indices)
+        g.node_values = np.full(g.n_nodes, np.nan)
+        return g
+
+    @classmethod
+    def from_grid(cls, cells, x_length, neighbours=8, resistance=None, weight=1.0):
+        """
+        Creates a new ConnectivityGraph of the 4 or 8 neighbour adjacency between the cells of a raster
+
+        The nodes are the cells with data, with planning unit id row * x_length + column + 1. Each pair of neighbouring
+        cells is connected in both directions. The weight of an edge is its conductance, one over the mean resistance of
+        both cells times the distance between their centers (in cells), s.t., edges that are easy to cross are the
+        strongest, or the constant weight without resistance. The CSR arrays are built
+        directly: the neighbours are visited in increasing cell order, s.t., the edges need no sorting.
+
+        Parameters
+        ----------
+        cells : Numpy array
+            Flat (row major) index of each cell with data, in increasing order
+        x_length : int
+            Number of columns of the raster
+        neighbours : int
+            4 (rook) or 8 (queen) neighbour adjacency
+        resistance : Numpy array
+            Resistance of each cell, larger than 0 (or None)
+        weight : float
+            Weight of each edge without resistance
+
+        Returns
+        -------
+        A new ConnectivityGraph
+        """
+
+        cells = np.asarray(cells, dtype=np.int64)
+        n = len(cells)
+        cols = cells % x_length
+        offsets = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0) and (neighbours == 8 or dr == 0 or dc == 0)]
+
+        # node index of the neighbour at each offset of each cell, -1 if it has no data or is outside the raster
+        pos = np.full((n, len(offsets)), -1, dtype=np.int32)
+        for k, (dr, dc) in enumerate(offsets):
+            dst = cells + dr * x_length + dc
+            p = np.searchsorted(cells, dst)
+            found = (cols + dc >= 0) & (cols + dc < x_length) & (p < n)
+            found[found] = cells[p[found]] == dst[found]
+            pos[found, k] = p[found]
+
+        edges = pos >= 0
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(edges.sum(axis=1), out=indptr[1:])
+        indices = pos[edges]
+        if resistance is None:
+            weights = np.full(len(indices), weight, dtype=np.float32)
+        else:
+            resistance = np.asarray(resistance, dtype=np.float64)
+            length = np.broadcast_to(np.hypot(*np.array(offsets, dtype=np.float64).T), pos.shape)[edges]
+            src = np.repeat(np.arange(n), np.diff(indptr))
+            weights = 1 / ((resistance[src] + resistance[indices]) / 2 * length)
+        return cls.from_csr(cells + 1, indptr, indices, weights)
+
+    @classmethod
+    def from_points(cls, nodes, x, y, alpha, kernel=c.DECAY_EXP, cutoff=None, neighbours=None):
+        """
+        Creates a new ConnectivityGraph connecting planning units within a cutoff distance, weighted by a distance decay kernel
+
+        The pairs are found with a KD-tree, s.t., the pairs beyond the cutoff are never materialized. Without neighbours,
+        each pair within the cutoff is connected in both directions. With neighbours, each planning unit is connected to
+        its nearest neighbours within the cutoff only.
+
+        Parameters
+        ----------
+        nodes : Numpy array
+            Planning unit id of each node
+        x : Numpy array
+            x coordinate of each planning unit
+        y : Numpy array
+            y coordinate of each planning unit
+        alpha : float
+            Distance scale of the decay kernel
+        kernel : str
+            Decay kernel, see decay
+        cutoff : float
+            Maximum length of an edge (default: DECAY_CUTOFF * alpha)
+        neighbours : int
+            Number of nearest planning units to connect each planning unit to (or None for all within the cutoff)
+
+        Returns
+        -------
+        A new ConnectivityGraph
+        """
+
+        from scipy.spatial import cKDTree
+
+        if cutoff is None:
+            cutoff = c.DECAY_CUTOFF * alpha
+        points = np.column_stack((np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)))
+        tree = cKDTree(points)
+        if neighbours is None:
+            pairs = tree.query_pairs(cutoff, output_type='ndarray')
+            src = np.concatenate((pairs[:, 0], pairs[:, 1]))
+            dst = np.concatenate((pairs[:, 1], pairs[:, 0]))
+            distance = np.linalg.norm(points[src] - points[dst], axis=1)
+        else:
+            # the nearest point is the planning unit itself
+            (distance, dst) = tree.query(points, k=neighbours + 1, distance_upper_bound=cutoff)
+            src = np.repeat(np.arange(len(points)), neighbours + 1).reshape(distance.shape)
+            keep = np.isfinite(distance) & (dst != src)
+            (src, dst, distance) = (src[keep], dst[keep], distance[keep])
+        return cls(nodes, src, dst, decay(distance, alpha, kernel))
+
+    def sources(self):
+        """
+        Returns the node index of the source of each edge in CSR order
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        Numpy array (int32) with the source of each edge
+        """
+
+        return np.repeat(np.arange(self.n_nodes, dtype=np.int32), np.diff(self.indptr))
+
+    def in_degree(self):
+        """
+        Returns the indegree of each node
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        Numpy array with the number of incoming edges of each node
+        """
+
+        return np.bincount(self.indices, minlength=self.n_nodes)
+
+    def out_degree(self):
+        """
+        Returns the outdegree of each node
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        Numpy array with the number of outgoing edges of each node
+        """
+
+        return np.diff(self.indptr)
+
+    def set_node_values(self, pu_ids, values):
+        """
+        Sets the attribute value of the nodes, values of planning units not in the graph are ignored
+
+        Parameters
+        ----------
+        pu_ids : Pandas Series
+            Planning unit ids
+        values : Pandas Series
+            Attribute value of each planning unit
+
+        Returns
+        -------
+        None
+        """
+
+        pos = pd.Index(self.nodes).get_indexer(pu_ids)
+        known = pos >= 0
+        self.node_values = np.full(self.n_nodes, np.nan)
+        self.node_values[pos[known]] = np.asarray(values, dtype=np.float64)[known]
+
+    def top_k(self, k):
+        """
+        Returns which edges are among the k strongest out-edges of their source
+
+        Parameters
+        ----------
+        k : int
+            Number of edges to keep per node
+
+        Returns
+        -------
+        Boolean Numpy array with True for each kept edge in CSR order
+        """
+
+        src = self.sources()
+        # edges sorted on source and decreasing weight, the rank is the position within the source
+        order = np.lexsort((-self.weights, src))
+        rank = np.empty(self.n_edges, dtype=np.int64)
+        rank[order] = np.arange(self.n_edges) - self.indptr[src[order]]
+        return rank < k
+
+    def backbone(self):
+        """
+        Returns which edges are part of a maximum spanning forest of the graph
+
+        The forest is calculated on the undirected graph, where a pair of nodes has the largest weight of both
+        directions. Both directions of a pair in the forest are kept.
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        Boolean Numpy array with True for each kept edge in CSR order
+        """
+
+        from scipy.sparse.csgraph import minimum_spanning_tree
+
+        if self.n_edges == 0:
+            return np.zeros(0, dtype=bool)
+        src = self.sources().astype(np.int64)
+        dst = self.indices.astype(np.int64)
+        # positive weights increasing with the edge weight, reversed s.t. the minimum spanning tree is a maximum one
+        w = self.weights.astype(np.float64)
+        w = w - w.min() + 1
+        a = sp.csr_matrix((w, (src, dst)), shape=(self.n_nodes, self.n_nodes))
+        a = a.maximum(a.T).tocsr()
+        a.data = a.data.max() + 1 - a.data
+        tree = sp.coo_matrix(minimum_spanning_tree(a))
+        n = self.n_nodes
+        pairs = np.minimum(tree.row, tree.col).astype(np.int64) * n + np.maximum(tree.row, tree.col)
+        return np.isin(np.minimum(src, dst) * n + np.maximum(src, dst), pairs)
+
+    def sparsify(self, method, k=None, quantile=None):
+        """
+        Returns a sparser graph keeping the strongest edges
+
+        With top-k, the k strongest out-edges of each node are kept. With quantile, the edges with a weight of at least
+        the quantile of all weights are kept. With backbone, a maximum spanning forest is kept, together with the top-k
+        or quantile edges if k or quantile is given.
+
+        Parameters
+        ----------
+        method : str
+            Sparsification method: top-k, quantile or backbone
+        k : int
+            Number of edges to keep per node
+        quantile : float
+            Quantile (between 0 and 1) of the edge weights to keep the edges above of
+
+        Returns
+        -------
+        A tuple (g, kept_edges, weight_share) with the sparse ConnectivityGraph, the number of kept edges and the share of
+        the total edge weight they retain
+        """
+
+        keep = np.zeros(self.n_edges, dtype=bool)
+        if method == c.SPARSE_BACKBONE:
+            keep |= self.backbone()
+        if k is not None and method != c.SPARSE_QUANTILE:
+            keep |= self.top_k(k)
+        if quantile is not None and method != c.SPARSE_TOP_K and self.n_edges > 0:
+            keep |= self.weights >= np.quantile(self.weights, quantile)
+
+        indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.sources()[keep], minlength=self.n_nodes), out=indptr[1:])
+        g = ConnectivityGraph.from_csr(self.nodes, indptr, self.indices[keep], self.weights[keep])
+        g.node_values = self.node_values.copy()
+        total = self.weights.sum(dtype=np.float64)
+        share = float(self.weights[keep].sum(dtype=np.float64) / total) if total != 0 else 1.0
+        return (g, int(keep.sum()), share)
+
+    def induced(self, mask):
+        """
+        Returns the subgraph induced by the nodes in mask, the graph itself is not changed
+
+        The CSR arrays of the subgraph are selected from the arrays of the graph with an edge mask, s.t., only the
+        subgraph is allocated. The node values are kept.
+
+        Parameters
+        ----------
+        mask : Numpy array
+            Boolean array with True for each node (index) in the subgraph
+
+        Returns
+        -------
+        A new ConnectivityGraph with the selected nodes in their original order
+        """
+
+        mask = np.asarray(mask, dtype=bool)
+        keep = np.repeat(mask, np.diff(self.indptr)) & mask[self.indices]
+        # relabelling is monotone, s.t., the destinations stay sorted per source
+        position = (np.cumsum(mask) - 1).astype(np.int32)
+        # number of kept edges of each node from the running count of kept edges at the CSR boundaries
+        kept = np.concatenate(([0], np.cumsum(keep, dtype=np.int64)))
+        counts = kept[self.indptr[1:]] - kept[self.indptr[:-1]]
+        indptr = np.zeros(int(mask.sum()) + 1, dtype=np.int64)
+        np.cumsum(counts[mask], out=indptr[1:])
+        g = ConnectivityGraph.from_csr(self.nodes[mask], indptr, position[self.indices[keep]], self.weights[keep])
+        g.node_values = self.node_values[mask]
+        return g
+
+    def components(self):
+        """
+        Returns the weakly connected components of the graph
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        A tuple (n, labels) with the number of components and the component of each node
+        """
+
+        from scipy.sparse.csgraph import connected_components
+
+        if self.n_nodes == 0:
+            return (0, np.zeros(0, dtype=np.int32))
+        a = sp.csr_matrix((np.ones(self.n_edges, dtype=np.int8), self.indices, self.indptr), shape=(self.n_nodes, self.n_nodes))
+        return connected_components(a, directed=True, connection='weak')
+
+    def to_scipy(self):
+        """
+        Returns the weighted adjacency matrix of the graph
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        scipy.sparse csr matrix sharing the CSR arrays of the graph
+        """
+
+        return sp.csr_matrix((self.weights, self.indices, self.indptr), shape=(self.n_nodes, self.n_nodes))
+
+    def to_networkx(self):
+        """
+        Exports the graph to a Networkx DiGraph, with the edge weights and node values as attribute 'value'
+
+        Networkx is an optional dependency and only imported when exporting.
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        Networkx DiGraph
+        """
+
+        import networkx as nx
+
+        g = nx.DiGraph()
+        g.add_nodes_from(self.nodes.tolist())
+        src = self.nodes[self.sources()].tolist()
+        dst = self.nodes[self.indices].tolist()
+        g.add_weighted_edges_from(zip(src, dst, self.weights.tolist()), weight=c.EDGE_VAL)
+        has_value = ~np.isnan(self.node_values)
+        for node, value in zip(self.nodes[has_value].tolist(), self.node_values[has_value].tolist()):
+            g.nodes[node][c.NODE_VAL] = value
+        return g
@@ -16,13 +16,14 @@
 # along with Coco. If not, see <http://www.gnu.org/licenses/>.
 
 import pandas as pd
-import networkx as nx
+import numpy as np
+import rsp.betweenness as btw
 import constant as c
 import sys
 
 class ConnectivityMetric:
 
-    def __init__(self, metric_type, g):
+    def __init__(self, metric_type, g, pu_index=None, workers=1, bc_samples=None, bc_error=None, bc_seed=0):
         """
         Creates and initializes a new ConnectivityMetric object
 
@@ -30,8 +31,18 @@ class ConnectivityMetric:
         ----------
         metric_type : str
             Name of the metric
-        g : Networkx graph
+        g : ConnectivityGraph
             Graph of the underlying dataset
+        pu_index : Pandas Index
+            Dense planning unit index of the Conservation object, if given the positions of the pu's are added to the values
+        workers : int
+            Number of worker processes used to calculate the BC values
+        bc_samples : int
+            Number of sampled source nodes to approximate the BC values, None for exact values
+        bc_error : float
+            Target relative error to approximate the BC values by adaptive sampling, None for exact values
+        bc_seed : int
+            Seed of the sampled source nodes
 
         Returns
         -------
@@ -40,6 +51,17 @@ class ConnectivityMetric:
 
         self.metric_type = metric_type
         self.g = g
+        self.pu_index = pu_index
+        self.workers = workers
+        self.bc_samples = bc_samples
+        self.bc_error = bc_error
+        self.bc_seed = bc_seed
+        # number of sampled sources and estimated relative error of the (approximate) BC values
+        self.sample_size = None
+        self.estimated_error = None
+        # number of edges and share of the total edge weight kept by sparsification of the graph (None if not sparsified)
+        self.kept_edges = None
+        self.weight_share = None
         self.values = pd.DataFrame()
         self.mean = 0
         self.sum = 0
@@ -50,7 +72,10 @@ class ConnectivityMetric:
         self.target = 0
         self.min_threshold = 0
         self.max_threshold = 0
+        # values as calculated, before a threshold changed them (None if no threshold is applied)
         self.orig_values = None
+        self.removed_zero = 0
+        self.removed_loops = 0
 
     def calculate_standards(self):
         """
@@ -89,6 +114,25 @@ class ConnectivityMetric:
 
         self.target = target
 
+    def set_removed(self, zero, loops):
+        """
+        Sets the number of entries removed before building the model
+
+        Parameters
+        ----------
+        zero : int
+            Number of entries with value 0
+        loops : int
+            Number of self-loops
+
+        Returns
+        -------
+        None
+        """
+
+        self.removed_zero = zero
+        self.removed_loops = loops
+
     def indegree(self):
         """
         Calculate the indegree value of each node in the graph and store this in self.values
@@ -103,10 +147,7 @@ class ConnectivityMetric:
         """
 
         print("--- calculating indegree values ---")
-        temp_values = []
-        for unit in self.g.nodes():
-            temp_values.append(self.g.in_degree(unit))
-        self.values = pd.DataFrame(list(zip(self.g.nodes(), temp_values)), columns = [c.MET_PID, c.MET_VAL])
+        self.values = pd.DataFrame({c.MET_PID: self.g.nodes, c.MET_VAL: self.g.in_degree()})
         print(self.values)
         self.calculate_standards()
 
@@ -124,10 +165,7 @@ class ConnectivityMetric:
         """
 
         print("--- calculating outdegree values ---")
-        temp_values = []
-        for unit in self.g.nodes():
-            temp_values.append(self.g.out_degree(unit))
-        self.values = pd.DataFrame(list(zip(self.g.nodes(), temp_values)), columns = [c.MET_PID, c.MET_VAL])
+        self.values = pd.DataFrame({c.MET_PID: self.g.nodes, c.MET_VAL: self.g.out_degree()})
         print(self.values)
         self.calculate_standards()
 
@@ -145,13 +183,14 @@ class ConnectivityMetric:
         """
 
         print("--- calculating BC values ---")
-        all_betcent = nx.betweenness_centrality(self.g, normalized=False, weight=None)
-        #all_betcent_norm = nx.betweenness_centrality(g, normalized=True)
-        #print(all_betcent_norm)
-        temp_values = []
-        for k,v in all_betcent.items():
-            temp_values.append(v)
-        self.values = pd.DataFrame(list(zip(self.g.nodes(), temp_values)), columns = [c.MET_PID, c.MET_VAL])
+        if self.bc_samples is None and self.bc_error is None:
+            all_betcent = btw.betweenness_centrality(self.g, self.workers)
+            self.sample_size = self.g.n_nodes
+            self.estimated_error = 0.0
+        else:
+            (all_betcent, self.sample_size, self.estimated_error) = btw.approximate_betweenness_centrality(self.g, self.bc_samples, self.bc_error, self.bc_seed, self.workers)
+            print("sampled sources: ", self.sample_size, " estimated relative error: ", self.estimated_error)
+        self.values = pd.DataFrame({c.MET_PID: self.g.nodes, c.MET_VAL: all_betcent})
         print(self.values)
         self.calculate_standards()
 
@@ -173,30 +212,114 @@ class ConnectivityMetric:
 
         print("---calculating EC values ---")
 
-        i_s = []
-        j_s = []
-        vals = []
-        for i, a_i in nx.get_node_attributes(self.g, c.NODE_VAL).items():
-            for j in self.g.neighbors(i):
-                a_j =  self.g.nodes[j][c.NODE_VAL]
-                p_ij = self.g.edges[(i,j)][c.EDGE_VAL]
-                val = a_i * a_j * p_ij
-                i_s.append(i)
-                j_s.append(j)
-                vals.append(val)
-        self.values = pd.DataFrame(list(zip(i_s, j_s, vals)), columns = [c.MET_PID1, c.MET_PID2, c.MET_VAL])
+        (i, j, known) = self.ec_edges()
+        a = self.g.node_values
+        vals = a[i] * a[j] * self.g.weights[known].astype(np.float64)
+        self.values = pd.DataFrame({c.MET_PID1: self.g.nodes[i], c.MET_PID2: self.g.nodes[j], c.MET_VAL: vals})
         print(self.values)
         # TODO check "for each map"
         self.calculate_standards()
 
-    def set_connectivity_metrics(self):
+    def ec_edges(self):
         """
-        General function to calculate the connectivity metric. Calculates the correct metric depending on self.name
+        Returns the edges of the graph the EC metric is calculated on: the edges between planning units with an attribute value
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        A tuple (i, j, known) with the node index of the source and destination of each EC edge and the boolean mask of these edges in CSR order
+        """
+
+        i = self.g.sources()
+        j = self.g.indices
+        a = self.g.node_values
+        known = ~np.isnan(a[i]) & ~np.isnan(a[j])
+        return (i[known], j[known], known)
+
+    def cache_settings(self, complete_graph):
+        """
+        Returns the settings, besides the graph, the values of the metric depend on
+
+        Parameters
+        ----------
+        complete_graph : str
+            The type of values dropped from the graph in case of a complete graph (or None)
+
+        Returns
+        -------
+        A dict with the settings
+        """
+
+        settings = {'complete_graph': complete_graph}
+        if self.metric_type == c.BC and (self.bc_samples is not None or self.bc_error is not None):
+            settings.update({'bc_samples': self.bc_samples, 'bc_error': self.bc_error, 'bc_seed': self.bc_seed})
+        return settings
+
+    def cached_arrays(self):
+        """
+        Returns the arrays to store in the metric cache: the metric value vector and, for BC, the sample size and estimated error
 
         Parameters
         ----------
         -
 
+        Returns
+        -------
+        A dict of Numpy arrays
+        """
+
+        arrays = {c.CACHE_VALUES: self.values[c.MET_VAL].to_numpy()}
+        if self.metric_type == c.BC:
+            arrays[c.SAMPLE_SIZE] = np.array(self.sample_size)
+            arrays[c.EST_ERROR] = np.array(self.estimated_error)
+        return arrays
+
+    def set_cached_values(self, cached):
+        """
+        Sets the values of the metric from the arrays loaded from the metric cache
+
+        Parameters
+        ----------
+        cached : dict
+            Numpy arrays loaded from the metric cache
+
+        Returns
+        -------
+        True if the values are set, False if the cached arrays do not match the graph
+        """
+
+        vals = cached.get(c.CACHE_VALUES)
+        if self.metric_type == c.EC:
+            (i, j, known) = self.ec_edges()
+            if vals is None or len(vals) != len(i):
+                return False
+            self.values = pd.DataFrame({c.MET_PID1: self.g.nodes[i], c.MET_PID2: self.g.nodes[j], c.MET_VAL: vals})
+        else:
+            if vals is None or len(vals) != self.g.n_nodes:
+                return False
+            self.values = pd.DataFrame({c.MET_PID: self.g.nodes, c.MET_VAL: vals})
+        if c.SAMPLE_SIZE in cached:
+            self.sample_size = int(cached[c.SAMPLE_SIZE])
+            self.estimated_error = float(cached[c.EST_ERROR])
+        self.calculate_standards()
+        return True
+
+    def set_connectivity_metrics(self, cache=None, complete_graph=None):
+        """
+        General function to calculate the connectivity metric. Calculates the correct metric depending on self.name
+
+        If a cache is given, the values are loaded from the cache if present and stored in the cache otherwise.
+
+        Parameters
+        ----------
+        cache : MetricCache
+            Cache of metric values (or None to always calculate the values)
+        complete_graph : str
+            The type of values dropped from the graph in case of a complete graph (or None)
+
         Returns
         -------
         None
@@ -204,11 +327,76 @@ class ConnectivityMetric:
 
         do = f"{self.metric_type}"
         if hasattr(self, do) and callable(func := getattr(self, do)):
-            return func()
+            key = None
+            cached = None
+            if cache is not None:
+                key = cache.key(self.g, self.metric_type, self.cache_settings(complete_graph))
+                cached = cache.load(key)
+            if cached is not None and self.set_cached_values(cached):
+                print(f"--- loaded cached {self.metric_type} values ---")
+            else:
+                func()
+                if cache is not None:
+                    cache.store(key, self.cached_arrays())
+            self.set_pu_positions()
         else:
             error = "Error: metric not implemented"
             sys.exit(error)
 
+    def set_pu_positions(self):
+        """
+        Adds the position of each planning unit in the dense planning unit index as int32 column(s) to the values
+
+        Node weighted metrics get one column (idx), edge weighted metrics two columns (idx1, idx2). Planning units not in the index get position -1.
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        None
+        """
+
+        if self.pu_index is None:
+            return
+        if c.MET_PID in self.values.columns:
+            self.values[c.MET_IDX] = self.pu_index.get_indexer(self.values[c.MET_PID]).astype(np.int32)
+        else:
+            self.values[c.MET_IDX1] = self.pu_index.get_indexer(self.values[c.MET_PID1]).astype(np.int32)
+            self.values[c.MET_IDX2] = self.pu_index.get_indexer(self.values[c.MET_PID2]).astype(np.int32)
+
+    def keep_orig_values(self):
+        """
+        Stores a copy of the calculated values before they are changed by a threshold, once
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        None
+        """
+
+        if self.orig_values is None:
+            self.orig_values = self.values.copy()
+
+    def calculated_values(self):
+        """
+        Returns the values of the metric as calculated, i.e., before any threshold was applied
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        Pandas DataFrame containing the calculated values of the metric
+        """
+
+        return self.values if self.orig_values is None else self.orig_values
+
     def drop_smaller(self, threshold):
         """
         Drops all values below the threshold value of metric name
@@ -223,6 +411,7 @@ class ConnectivityMetric:
         None
         """
 
+        self.keep_orig_values()
         self.min_threshold = threshold
         self.values[c.MET_VAL] = self.values[c.MET_VAL].where(self.values[c.MET_VAL] >= self.min_threshold, other=0)
 
@@ -240,6 +429,7 @@ class ConnectivityMetric:
         None
         """
 
+        self.keep_orig_values()
         self.max_theshold = threshold
         self.values[c.MET_VAL] = self.values[c.MET_VAL].where(self.values[c.MET_VAL] <= self.max_threshold, other=0)
 
@@ -257,6 +447,7 @@ class ConnectivityMetric:
         None
         """
 
+        self.keep_orig_values()
         self.min_threshold = self.get_type(type_name)
         self.values[c.MET_VAL] = self.values[c.MET_VAL].where(self.values[c.MET_VAL] >= self.min_threshold, other=0)
 
@@ -274,6 +465,7 @@ class ConnectivityMetric:
         None
         """
 
+        self.keep_orig_values()
         self.max_threshold = self.get_type(type_name)
         self.values[c.MET_VAL] = self.values[c.MET_VAL].where(self.values[c.MET_VAL] <= self.max_threshold, other=0)
 
@@ -317,5 +509,5 @@ class ConnectivityMetric:
         None
         """
 
-        self.orig_values = self.values.copy()
+        self.keep_orig_values()
         self.values[c.MET_VAL] = self.values[c.MET_VAL].where(self.values[c.MET_VAL] == 0, other=1)
@@ -16,7 +16,10 @@
 # along with Coco. If not, see <http://www.gnu.org/licenses/>.
 
 import pandas as pd
+import numpy as np
+import scipy.sparse as sp
 import constant as c
+import sys
 
 class Conservation:
 
@@ -44,12 +47,24 @@ class Conservation:
         self.pu = pu
         self.features = features
         self.pvf = pvf
+        # dense index: position of each pu id in self.pu, used to index the decision vars x
+        self.pu_index = pd.Index(self.pu[c.PU_ID])
+        if not self.pu_index.is_unique:
+            duplicates = self.pu_index[self.pu_index.duplicated()].unique()
+            error = f"The planning unit ids in pu.csv should be unique, repeated ids: {', '.join(map(str, duplicates[:10]))}"
+            if len(duplicates) > 10:
+                error += f" and {len(duplicates) - 10} more"
+            sys.exit(error)
+        self.pvf[c.PVF_IDX] = self.get_pu_idx(self.pvf[c.PVF_PID])
+        self.x = None
         self.bounds = bounds
         self.strategy = strategy
         self.blm_weight = 1
         self.prop_target = None
         self.max_cost = None
         self.min_cost = None
+        # sparse feature x planning unit matrix of the pvf, created on first use
+        self.feature_matrix = None
         self.set_features_targets()
 
     def set_features_targets(self):
@@ -69,6 +84,63 @@ class Conservation:
             self.prop_target = self.features.filter([c.FEAT_ID], axis=1)
             self.prop_target[c.FEAT_TARGET] = ""
 
+    def get_pu_idx(self, pu_ids):
+        """
+        Returns the position of each planning unit id in the dense planning unit index
+
+        Parameters
+        ----------
+        pu_ids : Pandas Series
+            Planning unit ids to look up
+        Returns
+        -------
+        Numpy array (int32) with the position of each planning unit, -1 if the planning unit is not in pu.csv
+        """
+
+        return self.pu_index.get_indexer(pu_ids).astype(np.int32)
+
+    def pvf_matrix(self):
+        """
+        Returns the sparse feature x planning unit matrix of the pvf, shared by the model and the evaluation of the solution
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        A tuple (feature_ids, matrix), where row k of the scipy.sparse csr matrix contains the amounts of feature
+        feature_ids[k] in each planning unit (in the order of the dense planning unit index)
+        """
+
+        if self.feature_matrix is None:
+            (feature_ids, rows) = np.unique(self.pvf[c.PVF_FID].to_numpy(), return_inverse=True)
+            cols = self.pvf[c.PVF_IDX].to_numpy()
+            values = self.pvf[c.PVF_VAL].to_numpy(dtype=np.float64)
+            known = cols >= 0
+            matrix = sp.csr_matrix((values[known], (rows[known], cols[known])), shape=(len(feature_ids), len(self.pu_index)))
+            self.feature_matrix = (feature_ids, matrix)
+        return self.feature_matrix
+
+    def targets(self, feature_ids):
+        """
+        Returns the targets of features as set in the model, i.e., the targets of feature.csv or the targets derived
+        from the proportions
+
+        Parameters
+        ----------
+        feature_ids : Numpy array
+            Feature ids to return the targets of
+
+        Returns
+        -------
+        Numpy array with the target of each feature, NaN for features without target
+        """
+
+        targets = self.prop_target if self.prop_target is not None else self.features
+        targets = pd.to_numeric(targets.set_index(c.FEAT_ID)[c.FEAT_TARGET], errors='coerce')
+        return targets[~targets.index.duplicated(keep='last')].reindex(feature_ids).to_numpy()
+
     def has_target(self, target):
         return True
         #if target in self.features[c.PVF_FID].values:
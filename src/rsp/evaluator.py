@@ -0,0 +1,206 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+import cocoio as cio
+import rsp.rsp as rsp
+import constant as c
+
+class Evaluator:
+
+    def __init__(self, conservation, connectivity=None):
+        """
+        Creates and initializes a new Evaluator object, scoring many selections of planning units at once
+
+        Parameters
+        ----------
+        conservation : Conservation
+            Conservation object (pu, features, pvf, strategy, bounds)
+        connectivity : Connectivity
+            Connectivity object with the calculated metrics (or None to only evaluate cost and features)
+
+        Returns
+        -------
+        None
+        """
+
+        self.conservation = conservation
+        self.connectivity = connectivity
+        self.cost = conservation.pu[c.PU_COST].to_numpy(dtype=np.float64)
+
+        # features occurring in at least one planning unit of pu.csv, with their targets as set in the model
+        (feature_ids, pvf_matrix) = conservation.pvf_matrix()
+        keep = (np.diff(pvf_matrix.indptr) > 0) & np.array([conservation.has_target(k) for k in feature_ids], dtype=bool)
+        self.feature_ids = feature_ids[keep]
+        self.pvf_matrix = pvf_matrix[keep]
+        self.targets = np.array([conservation.get_target(k) for k in self.feature_ids], dtype=np.float64)
+        self.operators = self.metric_operators() if connectivity is not None else []
+
+    def metric_operators(self):
+        """
+        Returns the calculated values of each metric as a vector (node weighted metrics) or a sparse matrix (edge
+        weighted metrics) over the dense planning unit index
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        A list of tuples (con_data, metric, operator)
+        """
+
+        n = len(self.conservation.pu_index)
+        operators = []
+        for condata in self.connectivity.connectivity_data:
+            for metric_name in condata.metrics:
+                values = condata.get_metric(metric_name).calculated_values()
+                vals = values[c.MET_VAL].to_numpy(dtype=np.float64)
+                if c.MET_IDX1 in values.columns:
+                    i = values[c.MET_IDX1].to_numpy()
+                    j = values[c.MET_IDX2].to_numpy()
+                    known = (i >= 0) & (j >= 0)
+                    operator = sp.csr_matrix((vals[known], (i[known], j[known])), shape=(n, n))
+                else:
+                    i = values[c.MET_IDX].to_numpy()
+                    known = i >= 0
+                    operator = np.bincount(i[known], weights=vals[known], minlength=n)
+                operators.append((condata.name, metric_name, operator))
+        return operators
+
+    def selection_matrix(self, solutions):
+        """
+        Returns the boolean candidates x planning units matrix of the selected planning units of each solution
+
+        Parameters
+        ----------
+        solutions : list
+            Pandas DataFrames [pu, x] of the solutions, planning units not in pu.csv are ignored
+
+        Returns
+        -------
+        scipy.sparse csr matrix with a row for each solution, in the order of the dense planning unit index
+        """
+
+        selected = [s.loc[s[c.PUX_X] > 0.5, c.PUX_PID] for s in solutions]
+        cols = self.conservation.get_pu_idx(pd.concat(selected, ignore_index=True)) if selected else np.empty(0, dtype=np.int32)
+        rows = np.repeat(np.arange(len(solutions)), [len(s) for s in selected])
+        known = cols >= 0
+        data = np.ones(np.count_nonzero(known), dtype=bool)
+        x = sp.csr_matrix((data, (rows[known], cols[known])), shape=(len(solutions), len(self.conservation.pu_index)))
+        # a planning unit listed twice in a solution is selected once
+        x.sum_duplicates()
+        return x
+
+    def evaluate(self, x, names):
+        """
+        Evaluates the cost, features and connectivity of each selection of planning units
+
+        Node weighted metrics are reached by a selected planning unit, edge weighted metrics by an edge of which both
+        planning units are selected, as in metrics.csv of a solved run.
+
+        Parameters
+        ----------
+        x : scipy.sparse matrix
+            Boolean candidates x planning units matrix of the selected planning units
+        names : list
+            Name of each candidate
+
+        Returns
+        -------
+        A tuple (summary, features, metrics) of Pandas DataFrames: the cost and targets met of each candidate, the reached
+        amount and shortfall of each feature for each candidate and the metric totals of each candidate
+        """
+
+        x = sp.csr_matrix(x, dtype=np.float64)
+        names = np.asarray(names)
+
+        cost = x @ self.cost
+        reached = (x @ self.pvf_matrix.T).toarray()
+        shortfall = np.maximum(self.targets - reached, 0)
+        summary = pd.DataFrame({
+            c.SOL_NAME: names,
+            c.SEL_PU: np.diff(x.indptr),
+            c.TOTAL_COST: cost,
+            c.TARGETS_MET: np.count_nonzero(shortfall == 0, axis=1),
+            c.TOTAL_SHORTFALL: shortfall.sum(axis=1)
+        })
+
+        (k, f) = reached.shape
+        features = pd.DataFrame({
+            c.SOL_NAME: np.repeat(names, f),
+            c.FEATURES: np.tile(self.feature_ids, k),
+            c.TARGET_F: np.tile(self.targets, k),
+            c.REACHED_F: reached.ravel(),
+            c.SHORTFALL_F: shortfall.ravel()
+        })
+
+        metrics = []
+        for (name, metric_name, operator) in self.operators:
+            if sp.issparse(operator):
+                total = np.asarray((x @ operator).multiply(x).sum(axis=1)).ravel()
+            else:
+                total = x @ operator
+            metrics.append(pd.DataFrame({c.SOL_NAME: names, c.DATA_M: name, c.METRIC_M: metric_name, c.TOTAL_METRIC_M: total}))
+        metrics = pd.concat(metrics, ignore_index=True) if metrics else pd.DataFrame(columns=[c.SOL_NAME, c.DATA_M, c.METRIC_M, c.TOTAL_METRIC_M])
+        return (summary, features, metrics)
+
+def run_eval(args, path, features, pu, pvf, timer, con_data=None, pu_data=None):
+    """
+    Evaluates all solutions in the solutions folder and stores the results in the output folder
+
+    Parameters
+    ----------
+    args : Argparse namespace
+        Contains all passed arguments.
+    path : str
+        Path to input folder
+    features : Pandas DataFrame
+        DataFrame containing info from features.csv (id, prop/target)
+    pu : Pandas DataFrame
+        DataFrame containing info from pu.csv (pu, cost, xloc, yloc)
+    pvf : Pandas DataFrame
+        DataFrame containing info from pvf.csv (feature id, pu id, value)
+    timer : Timer
+        Timer object containing all timers of the executed run
+    con_data : list
+        The connectivity datasets (or None without metrics)
+    pu_data : Pandas DataFrame
+        The planning unit attribute data (or None)
+
+    Returns
+    -------
+    None
+    """
+
+    conservation = rsp.init_conservation(args, pu, features, pvf, None)
+    connectivity = rsp.init_pre_connectivity(args, con_data, conservation, pu_data) if args.metric else None
+    (names, solutions) = cio.read_solutions(args.solutions)
+    print("evaluating ", len(names), " solutions...")
+
+    evaluator = Evaluator(conservation, connectivity)
+    (summary, features_sum, metrics_sum) = evaluator.evaluate(evaluator.selection_matrix(solutions), names)
+    print(summary)
+
+    cio.save_csv(summary, args.output, c.EVAL_SUMMARY)
+    cio.save_csv(features_sum, args.output, c.EVAL_FEATURES)
+    if connectivity is not None:
+        cio.save_csv(metrics_sum, args.output, c.EVAL_METRICS)
+    timer.stop_setup()
+    print("Total time: ", timer.setup_time())
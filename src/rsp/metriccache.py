@@ -0,0 +1,189 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import numpy as np
+import constant as c
+
+class MetricCache:
+
+    def __init__(self, path, max_size):
+        """
+        Creates and initializes a new MetricCache object
+
+        The cache stores the value vector of a metric on a connectivity graph in a binary .npz file, named after a hash
+        of the graph arrays, the node attribute values, the metric type and the settings the values depend on. When the
+        total size of the cache exceeds max_size, the least recently used files are removed.
+
+        Parameters
+        ----------
+        path : str
+            Directory to store the cached metric values in
+        max_size : float
+            Maximum size of the cache in MB
+
+        Returns
+        -------
+        None
+        """
+
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size * 2**20
+        self.enabled = True
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            self.evict()
+        except OSError as e:
+            print("Warning: could not use metric cache, continuing without it: ", e)
+            self.enabled = False
+
+    def key(self, g, metric_type, settings):
+        """
+        Returns the key of a metric on a graph
+
+        Parameters
+        ----------
+        g : ConnectivityGraph
+            Graph the metric is calculated on
+        metric_type : str
+            Name of the metric
+        settings : dict
+            Settings the metric values depend on, e.g., the complete graph drop rule
+
+        Returns
+        -------
+        Hexadecimal sha256 hash identifying the metric values
+        """
+
+        h = hashlib.sha256()
+        h.update(f"{c.CACHE_VERSION}|{metric_type}|{sorted(settings.items())}".encode())
+        if g.nodes.dtype == object:
+            h.update("\0".join(map(str, g.nodes.tolist())).encode())
+        else:
+            h.update(str(g.nodes.dtype).encode())
+            h.update(np.ascontiguousarray(g.nodes).tobytes())
+        for array in (g.indptr, g.indices, g.weights):
+            h.update(np.ascontiguousarray(array).tobytes())
+        # only EC depends on the attribute values of the nodes
+        if metric_type == c.EC:
+            h.update(np.ascontiguousarray(g.node_values).tobytes())
+        return h.hexdigest()
+
+    def file_name(self, key):
+        """
+        Returns the path of the cache file of key
+
+        Parameters
+        ----------
+        key : str
+            Key of the metric values
+
+        Returns
+        -------
+        Path of the cache file
+        """
+
+        return os.path.join(self.path, key + c.CACHE_EXT)
+
+    def load(self, key):
+        """
+        Loads the metric values of key from the cache and marks them as recently used
+
+        Parameters
+        ----------
+        key : str
+            Key of the metric values
+
+        Returns
+        -------
+        A dict with the cached arrays, or None if key is not in the cache
+        """
+
+        if not self.enabled:
+            return None
+        file_name = self.file_name(key)
+        try:
+            with np.load(file_name) as data:
+                cached = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(file_name)
+        except OSError as e:
+            print("Warning: could not update metric cache: ", e)
+        return cached
+
+    def store(self, key, arrays):
+        """
+        Stores the metric values of key in the cache and evicts the least recently used entries if needed
+
+        Parameters
+        ----------
+        key : str
+            Key of the metric values
+        arrays : dict
+            Named Numpy arrays to store
+
+        Returns
+        -------
+        None
+        """
+
+        if not self.enabled:
+            return
+        file_name = self.file_name(key)
+        # write to a temporary file first, s.t., concurrent runs never read a partial file
+        temp_name = f"{file_name}.{os.getpid()}.tmp"
+        try:
+            with open(temp_name, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(temp_name, file_name)
+        except OSError as e:
+            print("Warning: could not write metric cache: ", e)
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used cache files until the cache size is at most max_size
+
+        Parameters
+        ----------
+        -
+
+        Returns
+        -------
+        None
+        """
+
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.is_file() and entry.name.endswith(c.CACHE_EXT):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for (_, file_size, file_name) in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(file_name)
+                size -= file_size
+            except OSError:
+                pass
@@ -0,0 +1,131 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import scipy.sparse as sp
+import constant as c
+from gurobipy import GRB
+
+class ModelBuilder:
+
+    def __init__(self, m, conservation):
+        """
+        Creates and initializes a new ModelBuilder object
+
+        The builder uses the dense planning unit index of the conservation object (the row position of the pu in pu.csv), s.t., all
+        coefficients of the model can be stored in numpy arrays and scipy.sparse matrices and added in bulk.
+
+        Parameters
+        ----------
+        m : Gurobi model
+            Model in Gurobi environment
+        conservation : Conservation
+            Conservation object (pu, features, pvf, strategy, bounds), with the decision variables x set
+
+        Returns
+        -------
+        None
+        """
+
+        self.m = m
+        self.x = conservation.x
+        self.n_pu = len(conservation.pu_index)
+        self.cost = conservation.pu[c.PU_COST].to_numpy(dtype=np.float64)
+        # registry of the shared pair decision vars, set when the model has connectivity
+        self.pairs = None
+
+    def pu_vector(self, pu_idx, values):
+        """
+        Creates a dense coefficient vector over all planning units, values of the same planning unit are summed
+
+        Values of planning units not in pu.csv (position -1) are dropped.
+
+        Parameters
+        ----------
+        pu_idx : Pandas Series
+            Position of each planning unit in the dense planning unit index
+        values : Pandas Series
+            Value for each planning unit
+
+        Returns
+        -------
+        Numpy array containing one coefficient for each decision variable x
+        """
+
+        pos = np.asarray(pu_idx)
+        values = np.asarray(values, dtype=np.float64)
+        known = pos >= 0
+        return np.bincount(pos[known], weights=values[known], minlength=self.n_pu)
+
+    def pair_matrix(self, pu_idx1, pu_idx2, values):
+        """
+        Creates the sparse planning unit x planning unit matrix Q of the pair values, values of the same pair are summed
+
+        The quadratic form x' Q x equals sum(v_ij * x_i * x_j) over all pairs. Pairs with a planning unit not in pu.csv (position -1) are dropped.
+
+        Parameters
+        ----------
+        pu_idx1 : Pandas Series
+            Position of the first planning unit of each pair in the dense planning unit index
+        pu_idx2 : Pandas Series
+            Position of the second planning unit of each pair in the dense planning unit index
+        values : Pandas Series
+            Value of each pair
+
+        Returns
+        -------
+        A scipy.sparse csr matrix Q
+        """
+
+        pos1 = np.asarray(pu_idx1)
+        pos2 = np.asarray(pu_idx2)
+        values = np.asarray(values, dtype=np.float64)
+        known = (pos1 >= 0) & (pos2 >= 0)
+        return sp.csr_matrix((values[known], (pos1[known], pos2[known])), shape=(self.n_pu, self.n_pu))
+
+    def add_pair_vars(self, pu_idx1, pu_idx2, formulation=c.PAIR_AND):
+        """
+        Adds a decision variable z_ij = x_i AND x_j for each planning unit pair (i, j)
+
+        With the and formulation z_ij is binary and set by an and general constraint. With the linear formulation z_ij is
+        continuous in [0,1] and only bounded from above by z_ij <= x_i and z_ij <= x_j. The linear formulation is only exact
+        if every z_ij has a coefficient that pushes it up, i.e., a nonnegative value in a maximization or a >= target.
+
+        Parameters
+        ----------
+        pu_idx1 : Numpy array
+            Position of the first planning unit of each pair in the dense planning unit index
+        pu_idx2 : Numpy array
+            Position of the second planning unit of each pair in the dense planning unit index
+        formulation : str
+            Formulation of the pair variables (and, linear)
+
+        Returns
+        -------
+        Gurobi MVar of the pair variables
+        """
+
+        if formulation == c.PAIR_LINEAR:
+            z = self.m.addMVar(len(pu_idx1), lb=0, ub=1, vtype=GRB.CONTINUOUS)
+            self.m.addConstr(z <= self.x[pu_idx1])
+            self.m.addConstr(z <= self.x[pu_idx2])
+        else:
+            z = self.m.addMVar(len(pu_idx1), vtype=GRB.BINARY)
+            x = self.x.tolist()
+            for z_ij, i, j in zip(z.tolist(), pu_idx1, pu_idx2):
+                self.m.addGenConstrAnd(z_ij, [x[i], x[j]])
+        return z
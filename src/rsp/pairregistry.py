@@ -0,0 +1,148 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+import gurobipy as gp
+import numpy as np
+import constant as c
+
+class PairRegistry:
+
+    def __init__(self, builder, formulation=c.PAIR_AND):
+        """
+        Creates and initializes a new PairRegistry object
+
+        The registry creates at most one pair decision variable z_ij = x_i AND x_j for each unordered planning unit pair {i, j},
+        shared by all datasets, metrics and both edge directions (i, j) and (j, i). Self pairs (i, i) are not supported, the
+        self-loops of edge weighted metrics are dropped by ConnectivityData.get_compact_metric_values.
+
+        Parameters
+        ----------
+        builder : ModelBuilder
+            ModelBuilder object (dense pu index, decision vars x)
+        formulation : str
+            Formulation of the pair variables (and, linear)
+
+        Returns
+        -------
+        None
+        """
+
+        self.builder = builder
+        self.formulation = formulation
+        self.n_pu = builder.n_pu
+        # sorted keys (min(i, j) * n_pu + max(i, j)) of all registered pairs and the pair index of each key
+        self.keys = np.empty(0, dtype=np.int64)
+        self.key_idx = np.empty(0, dtype=np.int64)
+        # MVars of the pairs, the pair index is the position in the concatenation of all MVars
+        self.vars = []
+        self.n_pairs = 0
+
+    def get_pair_idx(self, pu_idx1, pu_idx2):
+        """
+        Returns the pair index of each planning unit pair (i != j), adds pair variables for all pairs not registered yet
+
+        Parameters
+        ----------
+        pu_idx1 : Pandas Series
+            Position of the first planning unit of each pair in the dense planning unit index
+        pu_idx2 : Pandas Series
+            Position of the second planning unit of each pair in the dense planning unit index
+
+        Returns
+        -------
+        Numpy array with the pair index of each pair, -1 if a planning unit of the pair is not in pu.csv
+        """
+
+        pos1 = np.asarray(pu_idx1, dtype=np.int64)
+        pos2 = np.asarray(pu_idx2, dtype=np.int64)
+        known = (pos1 >= 0) & (pos2 >= 0)
+        keys = np.minimum(pos1, pos2) * self.n_pu + np.maximum(pos1, pos2)
+
+        new_keys = np.setdiff1d(np.unique(keys[known]), self.keys, assume_unique=True)
+        if len(new_keys) > 0:
+            self.add_pairs(new_keys)
+
+        pair_idx = np.full(len(keys), -1, dtype=np.int64)
+        pair_idx[known] = self.key_idx[np.searchsorted(self.keys, keys[known])]
+        return pair_idx
+
+    def add_pairs(self, new_keys):
+        """
+        Adds the decision variables of new pairs
+
+        Parameters
+        ----------
+        new_keys : Numpy array
+            Keys of the pairs that are not registered yet
+
+        Returns
+        -------
+        None
+        """
+
+        self.vars.append(self.builder.add_pair_vars(new_keys // self.n_pu, new_keys % self.n_pu, self.formulation))
+        keys = np.concatenate([self.keys, new_keys])
+        key_idx = np.concatenate([self.key_idx, np.arange(self.n_pairs, self.n_pairs + len(new_keys))])
+        self.n_pairs += len(new_keys)
+
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.key_idx = key_idx[order]
+
+    def vector(self, pair_idx, values):
+        """
+        Creates a dense coefficient vector over all registered pairs, values of the same pair are summed
+
+        Parameters
+        ----------
+        pair_idx : Numpy array
+            Pair index of each value, values with index -1 are dropped
+        values : Numpy array
+            Value of each pair
+
+        Returns
+        -------
+        Numpy array containing one coefficient for each registered pair
+        """
+
+        values = np.asarray(values, dtype=np.float64)
+        known = pair_idx >= 0
+        return np.bincount(pair_idx[known], weights=values[known], minlength=self.n_pairs)
+
+    def expression(self, coefs):
+        """
+        Creates the expression sum(coef_ij * z_ij) over all registered pairs
+
+        Parameters
+        ----------
+        coefs : Numpy array
+            Coefficient of each registered pair
+
+        Returns
+        -------
+        Gurobi MLinExpr (or an empty LinExpr if no coefficient is set)
+        """
+
+        expr = gp.LinExpr()
+        start = 0
+        for z in self.vars:
+            end = start + z.shape[0]
+            part = coefs[start:end]
+            if part.any():
+                expr = part @ z + expr
+            start = end
+        return expr
@@ -18,12 +18,16 @@
 import gurobipy as gp
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 import cocoio as cio
 import cocoparser as cparser
 import timer as ctimer
 import rsp.connectivity as conn
 import rsp.conservation as cons
 import rsp.solution as sol
+import rsp.modelbuilder as mb
+import rsp.pairregistry as pr
+import rsp.metriccache as mc
 import constant as c
 import sys
 from gurobipy import GRB
@@ -57,16 +61,46 @@ def process_solution(m, conservation, timer):
         error = "The model is infeasible, no solution found"
         sys.exit(error)
     pu = conservation.pu
-    pu_val = []
-    pu_id = conservation.pu['pu']
-    xloc = conservation.pu['xloc']
-    yloc = conservation.pu['yloc']
-    for x in conservation.pu[c.PUX_X]:
-        pu_val.append(1) if x.getAttr('Xn') >= 1 else pu_val.append(0)
-    #df = pd.DataFrame(list(zip(pu_id, pu_val, xloc, yloc)), columns = ['pu', 'x', 'xloc', 'yloc'])
-    df = pd.DataFrame(list(zip(pu_id, pu_val, xloc, yloc)), columns = [c.PU_ID, c.PUX_X, c.PU_XLOC, c.PU_YLOC])
+    # all values in one bulk call, rounded to 0 or 1
+    pu_val = np.where(conservation.x.getAttr('Xn') >= 0.5, 1, 0)
+    df = pd.DataFrame({c.PU_ID: pu[c.PU_ID], c.PUX_X: pu_val, c.PU_XLOC: pu[c.PU_XLOC], c.PU_YLOC: pu[c.PU_YLOC]})
     obj_val = m.getObjective().getValue()
-    return sol.SolutionArea(df, obj_val, m.MIPGap, timer)
+    solution = sol.SolutionArea(df, obj_val, m.MIPGap, timer)
+    solution.set_model_stats(m)
+    return solution
+
+def process_solution_pool(m, conservation, solution):
+    """
+    Reads all solutions in the solution pool and stores them in the solution area as a compact selection matrix
+
+    Parameters
+    ----------
+    m : Gurobi model
+        Model in Gurobi environment
+    conservation : Conservation
+        Conservation object (pu, features, pvf, strategy, bounds)
+    solution : SolutionArea
+        SolutionArea of the best solution
+
+    Returns
+    -------
+    None
+    """
+
+    # only the positions of the selected pu's of each pool solution are kept, read with one bulk call per solution
+    selected = []
+    obj_vals = np.empty(m.SolCount)
+    for k in range(m.SolCount):
+        m.Params.SolutionNumber = k
+        selected.append(np.flatnonzero(conservation.x.getAttr('Xn') >= 0.5).astype(np.int32))
+        obj_vals[k] = m.PoolObjVal
+    m.Params.SolutionNumber = 0
+
+    indptr = np.zeros(len(selected) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in selected], out=indptr[1:])
+    indices = np.concatenate(selected)
+    pool = sp.csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr), shape=(len(selected), len(conservation.pu_index)))
+    solution.set_solution_pool(pool, obj_vals, conservation)
 
 #def process_lp_relaxation(m, conservation, timer):
 #    """
@@ -149,11 +183,17 @@ def analyze_and_save_solution(args, conservation, solution, connectivity=None):
     if connectivity:
         metric_sum = solution.metrics_sum(connectivity)
         cio.save_csv(metric_sum, path, c.METRICS)
+        if args.post_connectivity:
+            post_sum = solution.analyze_post_connectivity(connectivity, args.workers)
+            cio.save_csv(post_sum, path, c.POST_METRICS)
 
     # save csv files
     cio.save_csv(spec_sum, path, c.TARGETS)
     cio.save_csv(solution.pux, path, c.SOLUTION)
     cio.save_csv(arg_run_stats, path, c.RUNSTATS)
+    if solution.pool is not None:
+        cio.save_npz(solution.pool, path, c.SOL_POOL)
+        cio.save_csv(solution.pool_stats, path, c.POOL_STATS)
 
     solution.show_map(path)
 
@@ -219,6 +259,15 @@ def set_connectivity_data(args, con_data, connectivity, conservation, pu_data=No
     elif args.feature_edgelist:
         for data in con_data:
             connectivity.set_feature_connectivity_edgelist(data, args.metric, pu_data, conservation)
+    elif args.grid_map:
+        for i in range(len(con_data)):
+            connectivity.set_connectivity_grid(con_data[i], i, args.grid_neighbours, args.grid_weight, args.metric, pu_data)
+    elif args.distance_decay:
+        if c.PU_XLOC not in conservation.pu or c.PU_YLOC not in conservation.pu:
+            error = "distance decay: pu.csv should contain the coordinates of the planning units (xloc, yloc)"
+            sys.exit(error)
+        decay = {'alpha': args.distance_decay, 'kernel': args.decay_kernel, 'cutoff': args.decay_cutoff, 'neighbours': args.decay_neighbours}
+        connectivity.set_connectivity_decay(conservation.pu, decay, 0, args.metric, pu_data)
     else:
         error = "Please give connectivity input file"
         sys.exit(error)
@@ -256,18 +305,34 @@ def init_pre_connectivity(args, con_data, conservation, pu_data=None):
     elif args.cmd == c.RSP_CC:
         metric_weight = args.metric_weight
         metric_target = False
-    elif args.cmd == c.RSP_CON:
+    elif args.cmd == c.RSP_CON or args.cmd == c.EVAL:
         metric_weight = None
         metric_target = False
 
     # create new connectivity object, add all data and metrics.
     connectivity = conn.Connectivity(args.cmd, metric_weight, args.complete_graph, metric_target)
+    connectivity.set_pu_index(conservation.pu_index)
+    connectivity.pair_formulation = args.pair_formulation
+    connectivity.workers = args.workers
+    connectivity.bc_samples = args.bc_samples
+    connectivity.bc_error = args.bc_error
+    connectivity.bc_seed = args.bc_seed
+    if not args.no_cache:
+        connectivity.cache = mc.MetricCache(args.cache_dir, args.cache_size)
+    if args.sparsify:
+        if args.sparsify == c.SPARSE_TOP_K and args.sparsify_k is None:
+            error = "top-k sparsification: number of edges per node missing (--sparsify-k <k>)"
+            sys.exit(error)
+        if args.sparsify == c.SPARSE_QUANTILE and args.sparsify_quantile is None:
+            error = "quantile sparsification: quantile missing (--sparsify-quantile <q>)"
+            sys.exit(error)
+        connectivity.sparsify = {'method': args.sparsify, 'k': args.sparsify_k, 'quantile': args.sparsify_quantile}
     if args.cmd == c.RSP_CC and args.cost_weight:
         connectivity.cost_weight = args.cost_weight
     set_connectivity_data(args, con_data, connectivity, conservation, pu_data)
     return connectivity
 
-def init_connectivity(args, path, conservation):
+def init_connectivity(args, path, conservation, con_data=None, pu_data=None):
     """
     Creates and initializes a new connectivity object
 
@@ -277,13 +342,18 @@ def init_connectivity(args, path, conservation):
         Contains all passed arguments.
     path : str
         Path to input folder
+    con_data : list
+        The connectivity datasets if already read (or None to read them)
+    pu_data : Pandas DataFrame
+        The planning unit attribute data if already read together with con_data
     Returns
     -------
     A new connectivity object
     """
 
-    con_data = cio.read_connectivity_data(path, args)
-    pu_data = cio.read_pu_data(path, args.pu_data) if args.pu_data else None
+    if con_data is None:
+        con_data = cio.read_connectivity_data(path, args)
+        pu_data = cio.read_pu_data(path, args.pu_data, cio.csv_cache_dir(args)) if args.pu_data else None
     #if args.cmd == c.RSP_CF or args.cmd == c.RSP_CC or args.cmd == c.RSP_CON or args.cmd == c.RSP_BLM:
     if args.cmd == c.RSP_CF or args.cmd == c.RSP_CC or args.cmd == c.RSP_CON:
         return init_pre_connectivity(args, con_data, conservation, pu_data)
@@ -344,7 +414,7 @@ def init_conservation(args, pu, features, pvf, bounds):
         conservation.blm_weight = args.blm_weight
     return conservation
 
-def init_conservation_and_connectivity(args, path, features, pu, pvf):
+def init_conservation_and_connectivity(args, path, features, pu, pvf, con_data=None, pu_data=None):
     """
     Initialize the conservation object and if needed the connectivity object
 
@@ -361,6 +431,10 @@ def init_conservation_and_connectivity(args, path, features, pu, pvf):
         DataFrame containing info from pu.csv (pu, cost, xloc, yloc)
     pvf : Pandas DataFrame
         DataFrame containing info from pvf.csv (feature id, pu id, value)
+    con_data : list
+        The connectivity datasets if already read (or None to read them)
+    pu_data : Pandas DataFrame
+        The planning unit attribute data if already read together with con_data
     Returns
     -------
     A tuple (conservation, connectivity), where connectivity is None if RSP-Cost
@@ -368,14 +442,37 @@ def init_conservation_and_connectivity(args, path, features, pu, pvf):
 
     bounds = init_bounds(args, path) if args.cmd == c.RSP_BLM else None
     conservation = init_conservation(args, pu, features, pvf, bounds)
-    connectivity = init_connectivity(args, path, conservation) if args.cmd != c.RSP else None
+    connectivity = init_connectivity(args, path, conservation, con_data, pu_data) if args.cmd != c.RSP else None
     return (conservation, connectivity)
 
 ###                                        ###
 # Constraints related functions              #
 ###                                        ###
 
-def c_set_node_metric_target(m, conservation, connectivity, metric):
+def check_pair_formulation(connectivity, values):
+    """
+    Checks if the pair variables of an edge weighted metric can use the chosen formulation
+
+    The linear formulation only bounds z from above, it is only exact if all values and the metric weight are nonnegative.
+
+    Parameters
+    ----------
+    connectivity : Connectivity
+        Connectivity object (strategy, weight, complete_graph, target)
+    values : Pandas Series
+        Values of the pairs
+    Returns
+    -------
+    None
+    """
+
+    if connectivity.pair_formulation != c.PAIR_LINEAR:
+        return
+    if values.min() < 0 or (connectivity.strategy == c.RSP_CC and connectivity.weight < 0):
+        error = "linear pair formulation: requires nonnegative edge values and metric weight, use --pair-formulation and"
+        sys.exit(error)
+
+def c_set_node_metric_target(m, builder, conservation, connectivity, metric):
     """
     Set target constraints for each node weighted metric in RSP-CF
 
@@ -385,6 +482,8 @@ def c_set_node_metric_target(m, conservation, connectivity, metric):
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     metric : str
@@ -395,22 +494,18 @@ def c_set_node_metric_target(m, conservation, connectivity, metric):
     """
 
     for condata in connectivity.get_connectivity_data():
-        metric_values = condata.get_metric_values(metric)
+        metric_values = condata.get_compact_metric_values(metric)
         total = metric_values[c.MET_VAL].sum()
 
         # calculate tk based on proportion or target
         target = connectivity.weight * total if not connectivity.target else connectivity.weight
         condata.get_metric(metric).set_target(target)
 
-        metric_values = metric_values.merge(conservation.pu[c.PUX_X], left_on=c.PU_ID, right_on=conservation.pu[c.PU_ID])
-
-        x = metric_values[c.PUX_X].to_numpy()
-        values = metric_values[c.MET_VAL].to_numpy()
-
-        m.addConstr(sum(x[i] * values[i] for i in range(len(x))) >= target)
+        values = builder.pu_vector(metric_values[c.MET_IDX], metric_values[c.MET_VAL])
+        m.addConstr(sp.csr_matrix(values) @ builder.x >= target)
     m.update()
 
-def c_set_edge_metric_target(m, conservation, connectivity, metric):
+def c_set_edge_metric_target(m, builder, conservation, connectivity, metric):
     """
     Set target constraints for each edge weighted metric in RSP-CF
 
@@ -420,6 +515,8 @@ def c_set_edge_metric_target(m, conservation, connectivity, metric):
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     connectivity : Connectivity
@@ -432,34 +529,21 @@ def c_set_edge_metric_target(m, conservation, connectivity, metric):
     """
 
     for condata in connectivity.get_connectivity_data():
-        pu_z = []
-        metric_values = condata.get_metric_values(metric)
+        metric_values = condata.get_compact_metric_values(metric)
         total = metric_values[c.MET_VAL].sum()
 
+        # calculate tk based on proportion or target
         target = connectivity.weight * total if not connectivity.target else connectivity.weight
         condata.get_metric(metric).set_target(target)
 
-        metric_values = metric_values.merge(conservation.pu[c.PUX_X], left_on=c.MET_PID1, right_on=conservation.pu[c.PU_ID])
-        metric_values = metric_values.merge(conservation.pu[c.PUX_X], left_on=c.MET_PID2, right_on=conservation.pu[c.PU_ID])
-
-        x_1 = metric_values['x_x'].to_numpy()
-        x_2 = metric_values['x_y'].to_numpy()
-
-        for x_i, x_j in zip(x_1, x_2):
-            z = m.addVar(vtype=GRB.BINARY, name = "z_" + str(x_i) + "_" + str(x_j))
-            m.addConstr(z == gp.and_([x_i, x_j]))
-            pu_z.append(z)
-
-        metric_values[c.PUX_X] = pu_z
-
-        # calculate tk based on proportion or target
-        x = metric_values[c.PUX_X].to_numpy()
-        pu_m = metric_values[c.MET_VAL].to_numpy()
+        check_pair_formulation(connectivity, metric_values[c.MET_VAL])
+        pair_idx = builder.pairs.get_pair_idx(metric_values[c.MET_IDX1], metric_values[c.MET_IDX2])
+        values = builder.pairs.vector(pair_idx, metric_values[c.MET_VAL])
 
-        m.addConstr(sum(x[i] * pu_m[i] for i in range(len(x))) >= target)
+        m.addConstr(builder.pairs.expression(values) >= target)
     m.update()
 
-def c_set_metric_target(m, conservation, connectivity):
+def c_set_metric_target(m, builder, conservation, connectivity):
     """
     Set the connectivity metric targets for RSP-CF
 
@@ -468,6 +552,8 @@ def c_set_metric_target(m, conservation, connectivity):
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     connectivity : Connectivity
@@ -480,12 +566,12 @@ def c_set_metric_target(m, conservation, connectivity):
     for metric in connectivity.metrics:
         #if metric == 'betcent' or metric == c.INDEG or metric == c.OUTDEG:
         if metric == c.BC or metric == c.INDEG or metric == c.OUTDEG:
-            c_set_node_metric_target(m, conservation, connectivity, metric)
+            c_set_node_metric_target(m, builder, conservation, connectivity, metric)
         elif metric == c.EC:
-            c_set_edge_metric_target(m, conservation, connectivity, metric)
+            c_set_edge_metric_target(m, builder, conservation, connectivity, metric)
     m.update()
 
-def c_set_cost_target(m, conservation):
+def c_set_cost_target(m, builder, conservation):
     """
     Set the target for the cost in RSP-Con
 
@@ -493,6 +579,8 @@ def c_set_cost_target(m, conservation):
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     Returns
@@ -500,14 +588,13 @@ def c_set_cost_target(m, conservation):
     None
     """
 
-    x = conservation.pu[c.PUX_X].to_numpy()
-    values = conservation.pu[c.PU_COST].to_numpy()
+    cost = sp.csr_matrix(builder.cost)
     # setting a max cost is mandatory for this strategy
-    m.addConstr(sum(x[i] * values[i] for i in range(len(x))) <= conservation.max_cost)
+    m.addConstr(cost @ builder.x <= conservation.max_cost)
     if conservation.min_cost:
-        m.addConstr(sum(x[i] * values[i] for i in range(len(x))) >= conservation.min_cost)
+        m.addConstr(cost @ builder.x >= conservation.min_cost)
 
-def c_set_features_target(m, conservation):
+def c_set_features_target(m, builder, conservation):
     """
     Set feature target constraints
 
@@ -517,6 +604,8 @@ def c_set_features_target(m, conservation):
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     Returns
@@ -524,25 +613,19 @@ def c_set_features_target(m, conservation):
     None
     """
 
-    # group pvf in slices based on features_id giving all pu's for each features
-    pu_per_feature = [y for x, y in conservation.pvf.groupby(c.PVF_FID)]
-    for feature in pu_per_feature:
-        # select features id from last row (index not possible)
-        if (conservation.has_target(feature[c.PVF_FID].iloc[-1])):
-            target = conservation.get_target(feature[c.PVF_FID].iloc[-1])
-            feature = feature.merge(conservation.pu[c.PUX_X], left_on=c.PU_ID, right_on=conservation.pu[c.PU_ID])
+    # one row per feature, one column per pu
+    (feature_ids, pvf_matrix) = conservation.pvf_matrix()
+    has_target = np.array([conservation.has_target(k) for k in feature_ids], dtype=bool)
+    targets = np.array([conservation.get_target(k) for k in feature_ids[has_target]], dtype=np.float64)
 
-            x = feature[c.PUX_X].to_numpy()
-            values = feature[c.PVF_VAL].to_numpy()
-
-            m.addConstr(sum(x[i] * values[i] for i in range(len(x))) >= target)
-            m.update()
+    m.addMConstr(pvf_matrix[has_target], builder.x, GRB.GREATER_EQUAL, targets)
+    m.update()
 
 ###                                        ###
 # Objective related functions                #
 ###                                        ###
 
-def get_cost_and_selected_pu(m, conservation):
+def get_cost_and_selected_pu(m, builder):
 
     """
     Selects the cost and decision variable of all planning units
@@ -551,113 +634,130 @@ def get_cost_and_selected_pu(m, conservation):
     ----------
     m : Gurobi model
         Model in Gurobi environment
-    conservation : Conservation
-        Conservation object (pu, features, pvf, strategy, bounds)
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     Returns
     -------
-    A tuple (pu_c, pu_x) of two lists, in which each index has the cost (pu_c) and decision variable (pu_x) of a planning unit
+    A tuple (pu_c, pu_x), where pu_c is an array with the cost and pu_x the MVar with the decision variable of each planning unit
 
     """
-    pu_c = conservation.pu['cost'].to_numpy()
-    pu_x = conservation.pu['x'].to_numpy()
 
-    return (pu_c, pu_x)
+    return (builder.cost, builder.x)
 
-def set_edge_connectivity_objective(m, conservation, connectivity, metric, pu_z, pu_m):
+def set_edge_connectivity_objective(m, builder, conservation, connectivity, metric, pu_z, pu_m):
     """
-    Select the decision vars and the values for the edge weighted connectivity metric objective.
+    Select the pair decision vars and the values for the edge weighted connectivity metric objective.
 
-    Gets the metric values for all connectivity data sets and adds the decision var and the value to two seperate lists, s.t., each index in both lists is one pu_x - metric value pair.
+    Gets the metric values for all connectivity data sets and adds the pair index of the shared pair decision vars and the values to two seperate lists, s.t., each index in both lists is one pair index - values pair.
 
     Parameters
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     connectivity : Connectivity
         Connectivity object (strategy, weight, complete_graph, target)
     metric : str
         Name of the metric that needs to be set
-    pu_mx : list
-        Ordered list containing the decision vars of the pu's. New decision vars are added
+    pu_z : list
+        Ordered list containing the pair index arrays of the pairs. New pair index arrays are added
     pu_m : list
-        Ordered list containing the values of the pu's. New values are added
+        Ordered list containing the value arrays of the pairs. New value arrays are added
 
     Returns
     -------
-    A tuple of two ordered lists (pu_mx, pu_m) containing the value and dec var of pu's to be added to the objective
+    A tuple of two ordered lists (pu_z, pu_m) containing the pair indices and values of the pairs to be added to the objective
     """
 
-    pu = conservation.pu
-    vs_pu1 = c.MET_PID1
-    vs_pu2 = c.MET_PID2
-    vs_val = c.MET_VAL
-
     for condata in connectivity.get_connectivity_data():
-        metric_values = condata.get_normalized_metric_values(metric).copy()
+        metric_values = condata.get_compact_metric_values(metric, normalized=True)
 
-        metric_values = metric_values.merge(conservation.pu[c.PUX_X], left_on=c.MET_PID1, right_on=conservation.pu[c.PU_ID])
-        metric_values = metric_values.merge(conservation.pu[c.PUX_X], left_on=c.MET_PID2, right_on=conservation.pu[c.PU_ID])
+        check_pair_formulation(connectivity, metric_values[c.MET_VAL])
+        pu_z.append(builder.pairs.get_pair_idx(metric_values[c.MET_IDX1], metric_values[c.MET_IDX2]))
+        pu_m.append(metric_values[c.MET_VAL].to_numpy(dtype=np.float64))
 
-        x_1 = metric_values['x_x'].to_numpy()
-        x_2 = metric_values['x_y'].to_numpy()
+    return (pu_z, pu_m)
 
-        for x_i, x_j in zip(x_1, x_2):
-            z = m.addVar(vtype=GRB.BINARY, name = "z_" + str(x_i) + "_" + str(x_j))
-            m.addConstr(z == gp.and_([x_i, x_j]))
-            pu_z.append(z)
+def set_quadratic_connectivity_objective(m, builder, conservation, connectivity, metric, pu_q):
+    """
+    Select the values for the edge weighted connectivity metric objective as a quadratic form over the decision vars x.
 
-        pu_m = np.append(pu_m, metric_values[c.MET_VAL].to_numpy())
+    Gets the metric values for all connectivity data sets and adds them to the matrix Q, s.t., x' Q x is the sum of the values of all pairs with both pu's selected. No pair decision vars are created, Gurobi linearizes the products of the binary x's itself.
 
-    return (pu_z, pu_m)
+    Parameters
+    ----------
+    m : Gurobi model
+        Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
+    conservation : Conservation
+        Conservation object (pu, features, pvf, strategy, bounds)
+    connectivity : Connectivity
+        Connectivity object (strategy, weight, complete_graph, target)
+    metric : str
+        Name of the metric that needs to be set
+    pu_q : scipy.sparse matrix
+        Matrix containing the value of each pu pair, or None if no pairs were added yet. New values are added
+
+    Returns
+    -------
+    The matrix pu_q containing the values of the pu pairs to be added to the objective
+    """
+
+    for condata in connectivity.get_connectivity_data():
+        metric_values = condata.get_compact_metric_values(metric, normalized=True)
+        pair_values = builder.pair_matrix(metric_values[c.MET_IDX1], metric_values[c.MET_IDX2], metric_values[c.MET_VAL])
+        pu_q = pair_values if pu_q is None else pu_q + pair_values
+    return pu_q
 
-def set_node_connectivity_objective(m, conservation, connectivity, metric, pu_mx, pu_m):
+def set_node_connectivity_objective(m, builder, conservation, connectivity, metric, pu_m):
     """
-    Select the decision vars and the values for the node weighted connectivity metric objective.
+    Select the values for the node weighted connectivity metric objective.
 
-    Gets the metric values for all connectivity data sets and adds the decision var and the value to two seperate lists, s.t., each index in both lists is one pu_x - metric value pair. Normalize the values per connectivity data set separetely
+    Gets the metric values for all connectivity data sets and adds them to the coefficient of the decision var x of each pu. Normalize the values per connectivity data set separetely
 
     Parameters
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     connectivity : Connectivity
         Connectivity object (strategy, weight, complete_graph, target)
     metric : str
         Name of the metric that needs to be set
-    pu_mx : list
-        Ordered list containing the decision vars of the pu's. New decision vars are added
-    pu_m : list
-        Ordered list containing the values of the pu's. New values are added
+    pu_m : Numpy array
+        Array containing the coefficient of the decision var x of each pu. New values are added
 
     Returns
     -------
-    A tuple of two ordered lists (pu_mx, pu_m) containing the value and dec var of pu's to be added to the objective
+    The array pu_m containing the coefficients of the decision vars x to be added to the objective
 
     """
 
     for condata in connectivity.get_connectivity_data():
         # TODO add option to NOT normalize data?
-        metric_values = condata.get_normalized_metric_values(metric).copy()
-        metric_values = metric_values.merge(conservation.pu[c.PUX_X], left_on=c.PU_ID, right_on=conservation.pu[c.PU_ID])
-
-        pu_mx = np.append(pu_mx, metric_values[c.PUX_X].to_numpy())
-        pu_m = np.append(pu_m, metric_values[c.MET_VAL].to_numpy())
-    return (pu_mx, pu_m)
+        metric_values = condata.get_compact_metric_values(metric, normalized=True)
+        pu_m = pu_m + builder.pu_vector(metric_values[c.MET_IDX], metric_values[c.MET_VAL])
+    return pu_m
 
-def set_connectivity_objective(m, conservation, connectivity):
+def get_connectivity_expression(m, builder, conservation, connectivity):
     """
-    Set the objective with connectivity (RSP-Con)
+    Creates the connectivity part of the objective: sum(mi xi) + sum(mij zij)
 
-    For each metric call the correct function to get the pu values and x's (vertex-weighted) or the edge values and z's (edge weighted) and add them to a list. Then, set the objective for all elements in the list. The lists are ordered and must be iterated over simultaneously.
+    For each metric call the correct function to get the pu values (vertex-weighted) or the edge values and z's (edge weighted), or the edge values as quadratic form (edge weighted, quadratic formulation). Then, add all of them to one matrix expression.
 
     Parameters
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     connectivity : Connectivity
@@ -665,37 +765,63 @@ def set_connectivity_objective(m, conservation, connectivity):
 
     Returns
     -------
-    None
+    Gurobi MLinExpr (or MQuadExpr for the quadratic formulation) of the connectivity values of all metrics
     """
 
-    (pu_c, pu_x) = get_cost_and_selected_pu(m, conservation)
-    dec_vars = []
-    dec_values = []
+    node_values = np.zeros(builder.n_pu)
+    pair_vars = []
+    pair_values = []
+    pair_matrix = None
 
     for metric in connectivity.metrics:
-#        print("------------------------------------------- metric", metric)
         if metric == c.BC or metric == c.INDEG or metric == c.OUTDEG:
-            (dec_vars, dec_values) = set_node_connectivity_objective(m, conservation, connectivity, metric, dec_vars, dec_values)
+            node_values = set_node_connectivity_objective(m, builder, conservation, connectivity, metric, node_values)
+        elif metric == c.EC and connectivity.pair_formulation == c.PAIR_QUADRATIC:
+            pair_matrix = set_quadratic_connectivity_objective(m, builder, conservation, connectivity, metric, pair_matrix)
         elif metric == c.EC:
-            (dec_vars, dec_values) = set_edge_connectivity_objective(m, conservation, connectivity, metric, dec_vars, dec_values)
+            (pair_vars, pair_values) = set_edge_connectivity_objective(m, builder, conservation, connectivity, metric, pair_vars, pair_values)
+
+    expr = node_values @ builder.x
+    if pair_vars:
+        # values of pairs shared by datasets, metrics or edge directions are summed on one pair var
+        expr = expr + builder.pairs.expression(builder.pairs.vector(np.concatenate(pair_vars), np.concatenate(pair_values)))
+    if pair_matrix is not None:
+        expr = expr + builder.x @ pair_matrix @ builder.x
+    return expr
 
-    #dec_vars = dec_vars.to_numpy()
-    #dec_values = dec_values.to_numpy()
+def set_connectivity_objective(m, builder, conservation, connectivity):
+    """
+    Set the objective with connectivity (RSP-Con)
+
+    Parameters
+    ----------
+    m : Gurobi model
+        Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
+    conservation : Conservation
+        Conservation object (pu, features, pvf, strategy, bounds)
+    connectivity : Connectivity
+        Connectivity object (strategy, weight, complete_graph, target)
 
-    m.setObjective(sum(dec_vars[j] * dec_values[j] for j in range(len(dec_vars))), GRB.MAXIMIZE)
+    Returns
+    -------
+    None
+    """
 
+    m.setObjective(get_connectivity_expression(m, builder, conservation, connectivity), GRB.MAXIMIZE)
     m.update()
 
-def set_cost_connectivity_objective(m, conservation, connectivity):
+def set_cost_connectivity_objective(m, builder, conservation, connectivity):
     """
     Set the RSP-CC objective: min (ci xi) + max (mi xi).
 
-    Select the correct node or edge weighted function to add the values to the tuple (xi, val_i) for all datasets for all metrics.
-
     Parameters
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     connectivity : Connectivity
@@ -706,25 +832,13 @@ def set_cost_connectivity_objective(m, conservation, connectivity):
     None
     """
 
-    (pu_c, pu_x) = get_cost_and_selected_pu(m, conservation)
-    dec_vars = []
-    dec_values = []
-
-    for metric in connectivity.metrics:
-        if metric == c.BC or metric == c.INDEG or metric == c.OUTDEG:
-            (dec_vars, dec_values) = set_node_connectivity_objective(m, conservation, connectivity, metric, dec_vars, dec_values)
-        elif metric == c.EC:
-            (dec_vars, dec_values) = set_edge_connectivity_objective(m, conservation, connectivity, metric, dec_vars, dec_values)
-
-    #dec_vars = dec_vars.to_numpy()
-    #dec_values = dec_values.to_numpy()
+    (pu_c, pu_x) = get_cost_and_selected_pu(m, builder)
+    con_expr = get_connectivity_expression(m, builder, conservation, connectivity)
 
-    m.setObjective((connectivity.cost_weight * sum(pu_x[i] * pu_c[i] for i in range(len(pu_c)))) -
-                   connectivity.weight *
-                   sum(dec_vars[j] * dec_values[j] for j in range(len(dec_vars))), GRB.MINIMIZE)
+    m.setObjective(connectivity.cost_weight * (pu_c @ pu_x) - connectivity.weight * con_expr, GRB.MINIMIZE)
     m.update()
 
-def set_cost_objective(m, conservation):
+def set_cost_objective(m, builder, conservation):
     """
     Set the RSP-CF objective: min sum(ci xi)
 
@@ -732,6 +846,8 @@ def set_cost_objective(m, conservation):
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     Returns
@@ -739,10 +855,10 @@ def set_cost_objective(m, conservation):
     None
     """
 
-    (pu_c, pu_x) = get_cost_and_selected_pu(m, conservation)
+    (pu_c, pu_x) = get_cost_and_selected_pu(m, builder)
 
     # set objective: minimize sum(ci * xi for all pu i)
-    m.setObjective(sum(pu_x[i] * pu_c[i] for i in range(len(pu_c))), GRB.MINIMIZE)
+    m.setObjective(pu_c @ pu_x, GRB.MINIMIZE)
 
 #def set_cost_blm_objective(m, conservation):
 #    """
@@ -780,7 +896,7 @@ def set_cost_objective(m, conservation):
 #    # set objective: minimize sum(ci * xi for all pu i) + blm sum(sum(xv - zv))
 #    m.setObjective(sum(pu_x[i] * pu_c[i] for i in range(len(pu_c))) + conservation.blm_weight * sum(xi[j] * vij[j] - zij[j] * vij[j] for j in range(len(xi))), GRB.MINIMIZE)
 
-def set_objective(m, conservation, connectivity=None):
+def set_objective(m, builder, conservation, connectivity=None):
     """
     Select the correct function to set the objective depending on the RSP variant
 
@@ -788,6 +904,8 @@ def set_objective(m, conservation, connectivity=None):
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     connectivity : Connectivity
@@ -798,13 +916,13 @@ def set_objective(m, conservation, connectivity=None):
     """
 
     if connectivity and connectivity.strategy == c.RSP_CC:
-        set_cost_connectivity_objective(m, conservation, connectivity)
+        set_cost_connectivity_objective(m, builder, conservation, connectivity)
     elif connectivity and connectivity.strategy == c.RSP_CON:
-        set_connectivity_objective(m, conservation, connectivity)
+        set_connectivity_objective(m, builder, conservation, connectivity)
     #elif conservation.strategy == c.RSP_BLM:
     #    set_cost_blm_objective(m, conservation, pux)
     elif conservation.strategy == c.RSP_CF or conservation.strategy == c.RSP:
-        set_cost_objective(m, conservation)
+        set_cost_objective(m, builder, conservation)
     else:
         error = "Unknown strategy, objective can not be set"
         sys.exit(error)
@@ -836,7 +954,7 @@ def solve_model(m, timer):
     #m.relax()
     timer.stop()
 
-def setup_model(m, conservation, connectivity=None):
+def setup_model(m, builder, conservation, connectivity=None):
     """
     Set model constraints and objective function depending on RSP variant
 
@@ -844,6 +962,8 @@ def setup_model(m, conservation, connectivity=None):
     ----------
     m : Gurobi model
         Model in Gurobi environment
+    builder : ModelBuilder
+        ModelBuilder object (dense pu index, decision vars x)
     conservation : Conservation
         Conservation object (pu, features, pvf, strategy, bounds)
     connectivity : Connectivity
@@ -855,18 +975,19 @@ def setup_model(m, conservation, connectivity=None):
 
     # set features consrtaints for all strategies
     print("setting features targets...")
-    c_set_features_target(m, conservation)
+    c_set_features_target(m, builder, conservation)
 
     if connectivity:
+        builder.pairs = pr.PairRegistry(builder, connectivity.pair_formulation)
         if connectivity.strategy == c.RSP_CF:
-            c_set_metric_target(m, conservation, connectivity)
+            c_set_metric_target(m, builder, conservation, connectivity)
         #elif connectivity.strategy == c.RSP_CON or connectivity.strategy == 'con-blm':
         elif connectivity.strategy == c.RSP_CON:
-            c_set_cost_target(m, conservation)
+            c_set_cost_target(m, builder, conservation)
 
     # set objective
     print("setting objective...")
-    set_objective(m, conservation, connectivity)
+    set_objective(m, builder, conservation, connectivity)
 
 def init_pu_x(m, pu):
     """
@@ -881,20 +1002,17 @@ def init_pu_x(m, pu):
 
     Returns
     -------
-    DataFrame containing all pu id's and decision variables x [pu_id, pu_x]
+    Gurobi MVar containing the decision variables x, one for each pu in the order of pu [pu_x]
     """
 
-    x = [None] * len(pu)
-    for i in range(len(x)):
-        x[i] = m.addVar(vtype=GRB.BINARY, name = "x_" + str(pu[c.PU_ID][i]))
-        # LP
-        #x[i] = m.addVar(vtype=GRB.CONTINUOUS, name = "x_" + str(pu[i]))
-        m.addConstr(x[i] <= 1)
-        m.addConstr(x[i] >= 0)
-
-    pu['x'] = x
+    names = ["x_" + str(p) for p in pu[c.PU_ID]]
+    x = m.addMVar(len(pu), vtype=GRB.BINARY, name=names)
+    # LP
+    #x = m.addMVar(len(pu), vtype=GRB.CONTINUOUS, name=names)
+    m.addConstr(x <= 1)
+    m.addConstr(x >= 0)
     m.update()
-    return pu
+    return x
 
 def set_gurobi_params(m, args):
     """
@@ -923,6 +1041,12 @@ def set_gurobi_params(m, args):
     if args.gap:
         m.setParam('MIPGap', args.gap)
 
+    if args.pool_solutions:
+        m.setParam('PoolSolutions', args.pool_solutions)
+        m.setParam('PoolSearchMode', args.pool_search_mode)
+        if args.pool_gap is not None:
+            m.setParam('PoolGap', args.pool_gap)
+
 
 def init_and_solve_model(args, conservation, timer, connectivity=None):
     """
@@ -958,15 +1082,19 @@ def init_and_solve_model(args, conservation, timer, connectivity=None):
             # init pu decision vars
             print("initializing pux...")
             #pux = init_pu_x(m, conservation.pu[c.PU_ID])
-            init_pu_x(m, conservation.pu)
+            conservation.x = init_pu_x(m, conservation.pu)
+            builder = mb.ModelBuilder(m, conservation)
             print("setting up model...")
-            setup_model(m, conservation, connectivity)
+            setup_model(m, builder, conservation, connectivity)
             print("solving model...")
             solve_model(m, timer)
-            return process_solution(m, conservation, timer)
+            solution = process_solution(m, conservation, timer)
+            if args.pool_solutions:
+                process_solution_pool(m, conservation, solution)
+            return solution
 
-def run_rsp(args, path, features, pu, pvf, timer):
-    (conservation, connectivity) = init_conservation_and_connectivity(args, path, features, pu, pvf)
+def run_rsp(args, path, features, pu, pvf, timer, con_data=None, pu_data=None):
+    (conservation, connectivity) = init_conservation_and_connectivity(args, path, features, pu, pvf, con_data, pu_data)
     print("conservation created...")
 
     # init and solve model
@@ -15,12 +15,39 @@
 # You should have received a copy of the GNU General Public License
 # along with Coco. If not, see <http://www.gnu.org/licenses/>.
 import pandas as pd
-import networkx as nx
-import seaborn as sns
+import numpy as np
 import os
-import matplotlib.pyplot as plt
 import constant as c
 import rsp.connectivitymetric as conMet
+from concurrent.futures import ProcessPoolExecutor
+
+def post_metric(metric_type, g, workers, bc_samples, bc_error, bc_seed):
+    """
+    Calculates a metric on the subgraph induced by the solution area, used by the worker processes of the post-solve analysis
+
+    Parameters
+    ----------
+    metric_type : str
+        Name of the metric
+    g : ConnectivityGraph
+        Subgraph induced by the selected planning units
+    workers : int
+        Number of worker processes used to calculate the BC values
+    bc_samples : int
+        Number of sampled source nodes to approximate the BC values, None for exact values
+    bc_error : float
+        Target relative error to approximate the BC values by adaptive sampling, None for exact values
+    bc_seed : int
+        Seed of the sampled source nodes
+
+    Returns
+    -------
+    The ConnectivityMetric with the values on the subgraph
+    """
+
+    metric = conMet.ConnectivityMetric(metric_type, g, workers=workers, bc_samples=bc_samples, bc_error=bc_error, bc_seed=bc_seed)
+    metric.set_connectivity_metrics()
+    return metric
 
 class SolutionArea:
 
@@ -46,9 +73,61 @@ class SolutionArea:
         self.pux = pux
         self.obj_val = obj_val
         self.metrics_total = pd.DataFrame()
+        self.post_metrics_total = pd.DataFrame()
         self.features_total = pd.DataFrame()
         self.timer = timer
         self.gap = gap
+        self.model_stats = {}
+        # selection matrix of the solution pool (None if the pool is not kept)
+        self.pool = None
+        self.pool_stats = pd.DataFrame()
+
+    def set_model_stats(self, m):
+        """
+        Stores the size of the solved model
+
+        Parameters
+        ----------
+        m : Gurobi model
+            The solved model
+
+        Returns
+        -------
+        None
+        """
+
+        self.model_stats = {
+            c.NUM_VARS: m.NumVars,
+            c.NUM_BIN_VARS: m.NumBinVars,
+            c.NUM_CONSTRS: m.NumConstrs,
+            c.NUM_GEN_CONSTRS: m.NumGenConstrs,
+            c.NUM_NZS: m.NumNZs,
+            c.NUM_QNZS: m.NumQNZs
+        }
+
+    def set_solution_pool(self, pool, obj_vals, conservation):
+        """
+        Stores the solutions of the solution pool and adds the number of pool solutions selecting each planning unit
+        to pux, as the summed solution of Marxan
+
+        Parameters
+        ----------
+        pool : scipy.sparse csr matrix
+            Boolean solutions x planning units matrix of the selected planning units, in the order of pu.csv
+        obj_vals : Numpy array
+            Objective value of each pool solution
+        conservation : Conservation
+            Conservation containing the cost of the planning units
+
+        Returns
+        -------
+        None
+        """
+
+        self.pool = pool
+        cost = conservation.pu[c.PU_COST].to_numpy(dtype=np.float64)
+        self.pool_stats = pd.DataFrame({c.SOL_NAME: np.arange(pool.shape[0]), c.OBJ_VAL: obj_vals, c.SEL_PU: np.diff(pool.indptr), c.TOTAL_COST: pool.astype(np.float64) @ cost})
+        self.pux[c.SSOLN] = np.bincount(pool.indices, minlength=pool.shape[1])
 
     def save_run_stats(self, conservation):
         """
@@ -67,8 +146,13 @@ class SolutionArea:
         solver_time = self.timer.solver_time()
         total_time = self.timer.setup_time()
 
-        values = [solver_time, total_time, self.obj_val, self.gap, self.total_cost(conservation)]
-        names = [c.SOLVER_TIME, c.TOTAL_TIME, c.OBJ_VAL, c.GAP_OPT, c.TOTAL_COST]
+        values = [solver_time, total_time, self.obj_val, self.gap, self.total_cost(conservation)] + list(self.model_stats.values())
+        names = [c.SOLVER_TIME, c.TOTAL_TIME, c.OBJ_VAL, c.GAP_OPT, c.TOTAL_COST] + list(self.model_stats.keys())
+        values += list(self.timer.load_times.values())
+        names += [f"{c.LOAD_TIME}_{name}" for name in self.timer.load_times]
+        if self.pool is not None:
+            values.append(self.pool.shape[0])
+            names.append(c.POOL_SIZE)
         return pd.DataFrame(list(zip(names, values)), columns = [c.RUNSTAT_NAME, c.RUNSTAT_VAL])
 
     def features_sum(self, conservation):
@@ -85,27 +169,15 @@ class SolutionArea:
         A Pandas DataFrame [features, total, target, reached] of all features during this run
         """
 
-        pvf = conservation.pvf
-        temp = self.pux.merge(pvf, on=c.PUX_PID, how='left')
-        pu_per_sp = [y for x, y in temp.groupby(c.PVF_FID)]
-
-        spec = []
-        total = []
-        target = []
-        reached = []
-
-        for sp in pu_per_sp:
-            s = int(sp[c.PVF_FID].iloc[-1])
-            if conservation.has_target(s):
-                spec.append(s)
-                total.append(sp[c.PVF_VAL].sum())
-                reached.append(sp.loc[sp[c.PUX_X] == 1, c.PVF_VAL].sum())
-                if conservation.prop_target is not None:
-                    t = conservation.prop_target.loc[conservation.prop_target[c.FEAT_ID] == s, c.FEAT_TARGET].item()
-                else:
-                    t = conservation.features.loc[conservation.features[c.FEAT_ID] == s, c.FEAT_TARGET].item()
-                target.append(t)
-        data = { c.FEATURES: spec, c.TOTAL_F: total, c.TARGET_F: target, c.REACHED_F: reached }
+        # totals and reached amounts of all features at once: row sums and a product with the selected pu vector
+        (feature_ids, pvf_matrix) = conservation.pvf_matrix()
+        x = self.pux[c.PUX_X].to_numpy(dtype=np.float64)
+        total = np.asarray(pvf_matrix.sum(axis=1)).ravel()
+        reached = pvf_matrix @ x
+        # features occurring in at least one planning unit of pu.csv
+        keep = (np.diff(pvf_matrix.indptr) > 0) & np.array([conservation.has_target(k) for k in feature_ids], dtype=bool)
+        spec = feature_ids[keep]
+        data = { c.FEATURES: spec, c.TOTAL_F: total[keep], c.TARGET_F: conservation.targets(spec), c.REACHED_F: reached[keep] }
         self.features_total = pd.DataFrame(data)
         print(self.features_total)
         return self.features_total
@@ -153,9 +225,14 @@ class SolutionArea:
         total = []
         target = []
         reached = []
-        #post_metric = []
         avg_per_node = []
         data_name = []
+        removed_zero = []
+        removed_loops = []
+        sample_size = []
+        estimated_error = []
+        kept_edges = []
+        weight_share = []
 
         for condata in connectivity.connectivity_data:
             for metric_name in condata.metrics:
@@ -168,14 +245,17 @@ class SolutionArea:
                 total.append(metric.sum)
                 name.append(metric_name)
                 target.append(metric.target)
-                #post_conn = self.analyze_post_connectivity(metric_name, condata)
-                #post_metric.append(post_conn.sum())
-                #avg = post_conn.sum() / len(post_conn)
-                conn = self.analyze_connectivity(metric_name, condata, self.pux.copy())
+                removed_zero.append(metric.removed_zero)
+                removed_loops.append(metric.removed_loops)
+                sample_size.append(metric.sample_size)
+                estimated_error.append(metric.estimated_error)
+                kept_edges.append(metric.kept_edges)
+                weight_share.append(metric.weight_share)
+                conn = self.analyze_connectivity(metric_name, condata)
                 avg = conn.sum() / len(conn)
                 reached.append(conn.sum())
                 avg_per_node.append(avg)
-        self.metrics_total = pd.DataFrame(list(zip(data_name, name, total, min_value, max_value, min_threshold, max_threshold, target, reached, avg_per_node)), columns = [c.DATA_M, c.METRIC_M, c.TOTAL_M, c.MIN_M, c.MAX_M, c.MIN_THRES, c.MAX_THRES, c.TARGET_M, c.TOTAL_METRIC_M, c.AVG_PER_PU])
+        self.metrics_total = pd.DataFrame(list(zip(data_name, name, total, min_value, max_value, min_threshold, max_threshold, target, reached, avg_per_node, removed_zero, removed_loops, sample_size, estimated_error, kept_edges, weight_share)), columns = [c.DATA_M, c.METRIC_M, c.TOTAL_M, c.MIN_M, c.MAX_M, c.MIN_THRES, c.MAX_THRES, c.TARGET_M, c.TOTAL_METRIC_M, c.AVG_PER_PU, c.REMOVED_ZERO, c.REMOVED_LOOPS, c.SAMPLE_SIZE, c.EST_ERROR, c.KEPT_EDGES, c.WEIGHT_SHARE])
         return self.metrics_total
 
     def total_cost(self, conservation):
@@ -192,72 +272,111 @@ class SolutionArea:
         A float with the total cost of the conservation area
         """
 
-        temp_pux = self.pux.merge(conservation.pu[c.PU_COST], left_on=c.PUX_PID, right_on=conservation.pu[c.PU_ID], how='left')
-        return temp_pux.loc[temp_pux[c.PUX_X] == 1, c.PU_COST].sum()
+        # pux has the planning units in the order of pu.csv
+        cost = conservation.pu[c.PU_COST].to_numpy(dtype=np.float64)
+        return float(cost @ self.pux[c.PUX_X].to_numpy(dtype=np.float64))
 
-    def analyze_post_connectivity(self, metric_name, connectivity):
+    def analyze_post_connectivity(self, connectivity, workers=1):
         """
-        Calculates the metric value of metric_name on the solution area
+        Calculates the metrics of each dataset on the subgraph induced by the solution area, and its connected components
+
+        The subgraphs are selected from the CSR arrays of the graphs with a mask of the selected planning units, the graphs
+        themselves are not changed. With more than one worker the metrics of all datasets are calculated in parallel worker
+        processes, each using a single process for BC.
 
         Parameters
         ----------
         connectivity : Connectivity
             Connecitivty object containing all metrics and data
-        metric_name : str
-            Name of the metric to calculate
+        workers : int
+            Number of worker processes
 
         Returns
         -------
-        The values of the metric on the solution area
+        A Pandas DataFrame with the size, number of (weakly) connected components and metric values of the solution area
+        on each dataset
+        """
+
+        # metrics of a dataset share their graph, s.t., each subgraph is only selected once
+        subgraphs = {}
+        jobs = []
+        for condata in connectivity.connectivity_data:
+            for metric_name in condata.metrics:
+                metric = condata.get_metric(metric_name)
+                if id(metric.g) not in subgraphs:
+                    subgraphs[id(metric.g)] = metric.g.induced(self.selected(metric.g.nodes))
+                jobs.append((condata.name, metric, subgraphs[id(metric.g)]))
+
+        parallel = workers is not None and workers > 1 and len(jobs) > 1
+        bc_workers = 1 if parallel else workers
+        args = [(metric.metric_type, sub, bc_workers, metric.bc_samples, metric.bc_error, metric.bc_seed) for (_, metric, sub) in jobs]
+        if parallel:
+            with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+                sol_metrics = list(pool.map(post_metric, *zip(*args)))
+        else:
+            sol_metrics = [post_metric(*arg) for arg in args]
+
+        components = {}
+        rows = []
+        for ((name, metric, sub), sol_metric) in zip(jobs, sol_metrics):
+            if id(sub) not in components:
+                (n, labels) = sub.components()
+                components[id(sub)] = (n, int(np.bincount(labels).max()) if n > 0 else 0)
+            (n, largest) = components[id(sub)]
+            rows.append([name, metric.metric_type, sub.n_nodes, sub.n_edges, n, largest, sol_metric.sum, sol_metric.mean, sol_metric.min, sol_metric.max])
+        self.post_metrics_total = pd.DataFrame(rows, columns = [c.DATA_M, c.METRIC_M, c.SEL_PU, c.SEL_EDGES, c.COMPONENTS, c.LARGEST_COMP, c.TOTAL_METRIC_M, c.MEAN_M, c.MIN_M, c.MAX_M])
+        print(self.post_metrics_total)
+        return self.post_metrics_total
+
+    def selected(self, pu_ids, positions=None):
         """
+        Returns which of the planning units pu_ids are selected in the solution
 
-        metric = connectivity.get_metric(metric_name)
-        g = connectivity.g
-        out_nodes = list(self.pux.loc[self.pux[c.PUX_X] == 0][c.PUX_PID])
-        g.remove_nodes_from(out_nodes)
-        sol_metric = ConnectivityMetric(metric_name)
-        sol_metric.g = g
-        sol_metric.set_connectivity_metrics(sol_metric.g)
+        Parameters
+        ----------
+        pu_ids : Pandas Series
+            Ids of the planning units
+        positions : Pandas Series
+            Positions of the planning units in the dense planning unit index (or None to look them up in pux)
 
-        return sol_metric.values[c.MET_VAL]
+        Returns
+        -------
+        A boolean Numpy array, False for planning units that are not selected or not in pux
+        """
+
+        # pux has the planning units in the order of the dense planning unit index
+        x = self.pux[c.PUX_X].to_numpy() > 0
+        if positions is None:
+            positions = pd.Index(self.pux[c.PUX_PID]).get_indexer(pu_ids)
+        positions = np.asarray(positions)
+        return (positions >= 0) & x[np.maximum(positions, 0)]
 
-    def analyze_connectivity(self, metric_name, condata, co_best):
+    def analyze_connectivity(self, metric_name, condata):
         """
-        Calculates the metric value of metric_name on a dataset
+        Returns the values of metric_name on a dataset that are reached by the solution
+
+        The metric values calculated before the solve are reused (before any threshold was applied): node weighted metrics
+        are reached by a selected planning unit, edge weighted metrics (EC) by an edge of which both planning units are selected.
 
         Parameters
         ----------
         metric_name : str
-            Name of the metric to calculate
+            Name of the metric
         condata : ConnecitivtyData
-            Dataset to calculate the metric on
-        co_best : Pandas DataFrame
-            DataFrame containing all values of the planning units
+            Dataset the metric is calculated on
 
         Returns
         -------
-        The values of the metric on the dataset
+        A Numpy array with the values of the metric reached by the solution
         """
 
-        if metric_name == c.EC:
-            metric = condata.get_metric(metric_name)
-            print(metric.metric_type)
-            sol_metric = conMet.ConnectivityMetric(metric_name, metric.g)
-
-            sol_metric.set_connectivity_metrics()
-            co_best = co_best[co_best[c.PUX_X] > 0]
-            cvalues = sol_metric.values.merge(co_best[c.PUX_X], left_on=c.MET_PID1, right_on=co_best[c.PUX_PID])
-            cvalues.rename(columns={c.PUX_X: 'x1'}, inplace=True)
-            cvalues = cvalues.merge(co_best[c.PUX_X], left_on=c.MET_PID2, right_on=co_best[c.PUX_PID])
-            cvalues.rename(columns={'x': 'x2'}, inplace=True)
-            return cvalues[c.MET_VAL]
+        metric = condata.get_metric(metric_name)
+        values = metric.calculated_values()
+        if c.MET_PID1 in values.columns:
+            reached = self.selected(values[c.MET_PID1], values.get(c.MET_IDX1)) & self.selected(values[c.MET_PID2], values.get(c.MET_IDX2))
         else:
-            metric = condata.get_metric(metric_name)
-            sol_metric = conMet.ConnectivityMetric(metric_name, metric.g)
-            sol_metric.set_connectivity_metrics()
-            cvalues = sol_metric.values.merge(co_best[c.PUX_X], left_on=c.MET_PID, right_on=co_best[c.PUX_PID])
-            cvalues = cvalues[cvalues[c.PUX_X] > 0]
-            return cvalues[c.MET_VAL]
+            reached = self.selected(values[c.MET_PID], values.get(c.MET_IDX))
+        return values[c.MET_VAL].to_numpy()[reached]
 
     def show_map(self, path):
         """
@@ -272,6 +391,10 @@ class SolutionArea:
         -------
         None
         """
+        # plotting libraries are only imported when a map is shown
+        import seaborn as sns
+        import matplotlib.pyplot as plt
+
         # plot map
         #ax1 = self.pux.plot.scatter(x='xloc', y='yloc', c='x', colormap='viridis')
         #plt.savefig('output/conservation.pdf', bbox_inches='tight')
@@ -27,6 +27,8 @@ class Timer:
         self.stop_sol = None
         self.start_set = None
         self.stop_set = None
+        # time (s) spent loading each input file
+        self.load_times = {}
 
     def start_setup(self):
         self.start_set_ns = time.time_ns()
@@ -50,6 +52,9 @@ class Timer:
     def solver_time(self):
         return self.stop_sol - self.start_sol
 
+    def add_load_time(self, name, seconds):
+        self.load_times[name] = seconds
+
     def stop(self):
         self.stop_solver()
         self.stop_setup()
@@ -0,0 +1,236 @@
+# Copyright (c) 2022, Eline van Mantgem
+#
+# This file is part of Coco.
+#
+# Coco is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Coco is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Coco. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import cocoio as cio
+import csvcache as csvc
+import constant as c
+
+def open_band(file, x_length=None, y_length=None):
+    """
+    Opens the first band of a GeoTIFF, s.t., it can be read window by window
+
+    Parameters
+    ----------
+    file : str
+        Path of the GeoTIFF
+    x_length : int
+        Required number of columns, or None for any
+    y_length : int
+        Required number of rows, or None for any
+
+    Returns
+    -------
+    A tuple (dataset, band, no_data) with the GDAL dataset, its first band and the no data value of the band
+    """
+
+    ds = cio.read_tif(file)
+    if x_length is not None and (ds.RasterXSize != x_length or ds.RasterYSize != y_length):
+        error = f"Raster {file} does not have the same dimensions as the zone raster"
+        sys.exit(error)
+    rb = ds.GetRasterBand(1)
+    return (ds, rb, rb.GetNoDataValue())
+
+def zone_ids(rb, no_data, windows):
+    """
+    Returns the sorted ids of all zones (planning units) in the zone raster
+
+    Parameters
+    ----------
+    rb : gdal.Band
+        Band of the zone raster
+    no_data : float
+        No data value of the zone raster, or None
+    windows : list
+        Windows (xoff, yoff, xsize, ysize) to read the band in
+
+    Returns
+    -------
+    Numpy array with the sorted zone ids
+    """
+
+    ids = []
+    for (xoff, yoff, xsize, ysize) in windows:
+        window = rb.ReadAsArray(xoff, yoff, xsize, ysize)
+        if window.dtype.kind not in 'iu':
+            error = "The zone raster should contain integer planning unit ids"
+            sys.exit(error)
+        ids.append(np.unique(window[cio.valid_cells(window, no_data)]))
+    return np.unique(np.concatenate(ids)) if ids else np.empty(0, dtype=np.int64)
+
+def aggregate(zones, rasters, cost=None, memory=c.RASTER_MEMORY):
+    """
+    Aggregates feature rasters over the zones (planning units) of a zone raster
+
+    The rasters are read window by window, following the blocks of the zone raster. In each window, the cells of each
+    zone are summed with one bincount over their dense zone index per raster, s.t., no raster is ever in memory as a
+    whole.
+
+    Parameters
+    ----------
+    zones : str
+        Path of the zone raster, a GeoTIFF with the planning unit id of each cell
+    rasters : list
+        Paths of the feature rasters, with the same dimensions as the zone raster
+    cost : str
+        Path of a raster with the cost of each cell, or None
+    memory : float
+        Memory budget (in MB) of the windows of all rasters together
+
+    Returns
+    -------
+    A dict with the sorted zone ids ('pu'), the number of cells ('cells'), the summed x and y coordinates of the cell
+    centers ('x', 'y') and the summed cost ('cost', None without cost raster) of each zone, and the summed values
+    ('sums') and number of cells with data ('counts') of each raster and zone, as arrays (rasters x zones)
+    """
+
+    (zone_ds, zone_rb, zone_no_data) = open_band(zones)
+    x_length = zone_ds.RasterXSize
+    y_length = zone_ds.RasterYSize
+    gt = zone_ds.GetGeoTransform()
+    bands = [open_band(file, x_length, y_length) for file in rasters]
+    cost_band = open_band(cost, x_length, y_length) if cost else None
+
+    windows = list(cio.raster_windows(zone_rb, x_length, y_length, memory / (len(bands) + 2)))
+    ids = zone_ids(zone_rb, zone_no_data, windows)
+    n = len(ids)
+    result = {'pu': ids, 'cells': np.zeros(n), 'x': np.zeros(n), 'y': np.zeros(n), 'cost': np.zeros(n) if cost_band else None,
+              'sums': np.zeros((len(bands), n)), 'counts': np.zeros((len(bands), n))}
+
+    for (xoff, yoff, xsize, ysize) in windows:
+        window = zone_rb.ReadAsArray(xoff, yoff, xsize, ysize)
+        valid = cio.valid_cells(window, zone_no_data)
+        idx = np.searchsorted(ids, window[valid])
+        (rows, cols) = np.nonzero(valid)
+        # cell centers from the geotransform of the zone raster
+        rows = rows + yoff + 0.5
+        cols = cols + xoff + 0.5
+        result['cells'] += np.bincount(idx, minlength=n)
+        result['x'] += np.bincount(idx, weights=gt[0] + cols * gt[1] + rows * gt[2], minlength=n)
+        result['y'] += np.bincount(idx, weights=gt[3] + cols * gt[4] + rows * gt[5], minlength=n)
+        if cost_band:
+            (_, rb, no_data) = cost_band
+            values = rb.ReadAsArray(xoff, yoff, xsize, ysize)[valid]
+            has_data = cio.valid_cells(values, no_data)
+            result['cost'] += np.bincount(idx[has_data], weights=values[has_data], minlength=n)
+        for k, (_, rb, no_data) in enumerate(bands):
+            values = rb.ReadAsArray(xoff, yoff, xsize, ysize)[valid]
+            has_data = cio.valid_cells(values, no_data)
+            result['sums'][k] += np.bincount(idx[has_data], weights=values[has_data], minlength=n)
+            result['counts'][k] += np.bincount(idx[has_data], minlength=n)
+    return result
+
+def feature_ids(features):
+    """
+    Returns the feature ids of the configuration, as integers if all ids are integers
+
+    Parameters
+    ----------
+    features : Pandas Series
+        Feature id of each feature in the configuration
+
+    Returns
+    -------
+    A Pandas Series with the feature ids
+    """
+
+    try:
+        return features.astype(np.int64)
+    except ValueError:
+        return features
+
+def zonal_tables(aggregation, fids, statistic=c.SUM):
+    """
+    Creates the pu and pvf tables of an aggregation
+
+    The cost of a planning unit is the summed cost raster, or its number of cells without cost raster. The location
+    of a planning unit is the mean center of its cells. The pvf table contains the sum or the mean of each feature
+    over the cells with data of each planning unit, planning units with value 0 are left out.
+
+    Parameters
+    ----------
+    aggregation : dict
+        Aggregated rasters, see aggregate
+    fids : Pandas Series
+        Feature id of each feature raster
+    statistic : str
+        Value of a feature in a planning unit, the sum or the mean of its cells
+
+    Returns
+    -------
+    A tuple of two DataFrames (pu, pvf)
+    """
+
+    ids = aggregation['pu']
+    cells = aggregation['cells']
+    pu = pd.DataFrame({c.PU_ID: ids,
+                       c.PU_COST: aggregation['cost'] if aggregation['cost'] is not None else cells,
+                       c.PU_STATUS: np.zeros(len(ids), dtype=np.int32),
+                       c.PU_XLOC: aggregation['x'] / np.maximum(cells, 1),
+                       c.PU_YLOC: aggregation['y'] / np.maximum(cells, 1)})
+
+    pvf = []
+    for k, fid in enumerate(fids):
+        values = aggregation['sums'][k]
+        if statistic == c.MEAN:
+            values = values / np.maximum(aggregation['counts'][k], 1)
+        keep = (aggregation['counts'][k] > 0) & (values != 0)
+        pvf.append(pd.DataFrame({c.PVF_FID: fid, c.PVF_PID: ids[keep], c.PVF_VAL: values[keep]}))
+    pvf = pd.concat(pvf, ignore_index=True) if pvf else pd.DataFrame(columns=[c.PVF_FID, c.PVF_PID, c.PVF_VAL])
+    return (pu, pvf)
+
+def run_zonal(args, timer):
+    """
+    Aggregates the feature rasters of a configuration over a zone raster and writes the pu and pvf tables
+
+    The tables are written directly as the binary columnar tables of pu.csv and pvf.csv in the output folder, which
+    are read by the RSP variants as if they were the csv files.
+
+    Parameters
+    ----------
+    args : Namespace
+        Command line arguments
+    timer : Timer
+        Timer of the run
+
+    Returns
+    -------
+    None
+    """
+
+    (path, features, _) = cio.read_config_features(args.config)
+    rasters = [cio.open_file(path, file) for file in features['file']]
+    zones = cio.open_file(args.zones)
+    cost = cio.open_file(args.cost) if args.cost else None
+
+    aggregation = aggregate(zones, rasters, cost, args.raster_memory)
+    (pu, pvf) = zonal_tables(aggregation, feature_ids(features['feature']), args.statistic)
+
+    os.makedirs(args.output, exist_ok=True)
+    for (name, df) in ((c.PU_F, pu), (c.PVF_F, pvf)):
+        file = os.path.join(args.output, name)
+        if os.path.exists(file):
+            print(f"Warning: {file} exists and is read instead of the aggregated table")
+        csvc.write_table(file, df)
+
+    timer.stop_setup()
+    print("Planning units:", len(pu))
+    print("Planning unit feature values:", len(pvf))
+    print("Aggregation time:", timer.setup_time())